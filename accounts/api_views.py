@@ -7,7 +7,9 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import get_user_model
-from .models import ServiceProvider, OTP
+from .auth import TokenUser, user_snapshots
+from .models import ServiceProvider
+from .otp import issue_otp, verify_otp
 from core.models import ActivityLog
 
 # User = get_user_model() # Moved inside functions to avoid AppRegistryNotReady
@@ -16,6 +18,17 @@ from core.models import ActivityLog
 JWT_SECRET = settings.SECRET_KEY
 JWT_ALGORITHM = 'HS256'
 
+# Pre-keyed signer/verifier; tokens issued before kids existed verify with the current key.
+jwt_signer = jwt.Signer(JWT_SECRET, kid=settings.JWT_KEY_ID, algorithm=JWT_ALGORITHM)
+jwt_verifier = jwt.Verifier(
+    {**settings.JWT_PREVIOUS_KEYS, settings.JWT_KEY_ID: JWT_SECRET},
+    default_kid=settings.JWT_KEY_ID,
+    algorithms=[JWT_ALGORITHM],
+)
+
+# Verified tokens are remembered per process so repeat requests skip the HMAC check.
+token_cache = jwt.TokenCache(maxsize=settings.JWT_TOKEN_CACHE_SIZE)
+
 def generate_token(user):
     payload = {
         'user_id': user.id,
@@ -24,7 +37,7 @@ def generate_token(user):
         'exp': datetime.datetime.utcnow() + datetime.timedelta(days=7),
         'iat': datetime.datetime.utcnow()
     }
-    token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    token = jwt_signer.encode(payload)
     return token
 
 def jwt_required(view_func):
@@ -37,20 +50,24 @@ def jwt_required(view_func):
 
         token = auth_header.split(' ', 1)[1]
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            payload = token_cache.verify(token, jwt_verifier)
         except jwt.ExpiredSignatureError:
             return JsonResponse({'error': 'Token has expired'}, status=401)
         except jwt.InvalidTokenError:
             return JsonResponse({'error': 'Invalid token'}, status=401)
 
+        if 'user_id' not in payload or user_snapshots.is_deleted(payload['user_id']):
+            return JsonResponse({'error': 'User not found'}, status=401)
+
+        # The User row is only fetched if the view reads a field the token doesn't carry.
+        request.user = TokenUser(payload)
         User = get_user_model()
         try:
-            user = User.objects.get(id=payload['user_id'])
+            return view_func(request, *args, **kwargs)
         except User.DoesNotExist:
+            if not user_snapshots.is_deleted(payload['user_id']):
+                raise
             return JsonResponse({'error': 'User not found'}, status=401)
-
-        request.user = user
-        return view_func(request, *args, **kwargs)
     return wrapper
 
 import random
@@ -67,9 +84,7 @@ def login_api(request):
             user = authenticate(request, username=username, password=password)
             
             if user:
-                # Generate OTP using the model
-                otp_record = OTP.create_otp(user.email, 'login')
-                otp = otp_record.otp_code
+                otp = issue_otp(user.email, 'login')
                 
                 # Send OTP email
                 send_otp_email(user.email, otp, user.first_name)
@@ -107,9 +122,7 @@ def register_api(request):
             # Session data is persisted in the database, so it survives across function invocations
             request.session['pending_registration'] = data
             
-            # Generate OTP using the model
-            otp_record = OTP.create_otp(email, 'register')
-            otp = otp_record.otp_code
+            otp = issue_otp(email, 'register')
             
             # Send OTP email
             send_otp_email(email, otp, data.get('first_name'))
@@ -133,11 +146,7 @@ def verify_otp_api(request):
             email = data.get('email')
             otp_type = data.get('otp_type', 'register')
             
-            print(f"DEBUG: Verify OTP attempt - Email: {email}, OTP: {entered_otp}, Type: {otp_type}")
-            
-            # Validate OTP using the model
-            otp_record = OTP.validate_otp(email, entered_otp, otp_type)
-            if not otp_record:
+            if not verify_otp(email, entered_otp, otp_type):
                 return JsonResponse({'success': False, 'error': 'Invalid or expired OTP'}, status=400)
             
             User = get_user_model()
@@ -221,9 +230,7 @@ def resend_otp_api(request):
             if not email:
                 return JsonResponse({'success': False, 'error': 'Email is required to resend OTP.'}, status=400)
             
-            # Generate new OTP using the model
-            otp_record = OTP.create_otp(email, otp_type)
-            otp = otp_record.otp_code
+            otp = issue_otp(email, otp_type)
             
             # Send OTP email
             send_otp_email(email, otp, first_name)
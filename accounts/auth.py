@@ -0,0 +1,139 @@
+"""
+Request authentication helpers for the JWT-protected API.
+
+`jwt_required` puts a TokenUser on `request.user`. It answers the user id from
+the token directly, and only resolves the full User row when a view touches
+anything else. Resolved users are kept in a per-process snapshot cache that is
+invalidated by the User save/delete signals (see accounts/signals.py) and
+expires after a short TTL as a backstop for writes that bypass signals, such
+as queryset.update().
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject
+
+
+class UserSnapshotCache:
+    """
+    Thread-safe LRU of User instances keyed by id. Entries expire after `ttl`
+    seconds; ids of users deleted in this process are remembered so their
+    still-valid tokens are rejected without a query.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._deleted = set()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                user, stored_at = entry
+                if time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    # Hand out a copy so a view mutating request.user can't leak into the cache.
+                    return copy.copy(user)
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def put(self, user):
+        with self._lock:
+            self._deleted.discard(user.pk)
+            self._entries[user.pk] = (copy.copy(user), time.monotonic())
+            self._entries.move_to_end(user.pk)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id, deleted=False):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            if deleted:
+                self._deleted.add(user_id)
+
+    def is_deleted(self, user_id):
+        with self._lock:
+            return user_id in self._deleted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._deleted.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
+
+
+user_snapshots = UserSnapshotCache(
+    maxsize=getattr(settings, 'USER_SNAPSHOT_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'USER_SNAPSHOT_CACHE_TTL', 60),
+)
+
+
+def load_user(user_id):
+    """Return the User for `user_id` from the snapshot cache, falling back to the DB."""
+    user = user_snapshots.get(user_id)
+    if user is None:
+        User = get_user_model()
+        user = User.objects.get(id=user_id)
+        user_snapshots.put(user)
+    return user
+
+
+class TokenUser(SimpleLazyObject):
+    """
+    Lazy `request.user` built from a verified JWT payload.
+
+    `id` and `pk` come straight from the token; any other attribute (or passing
+    the object to the ORM) loads the real User through load_user(). That
+    includes `username` and `email`: the copies in a token are as old as the
+    token, so they are read from the snapshot, which the User save signal
+    keeps current. Views that only need the id should filter on
+    `user_id=user.id` so the request runs without an auth query.
+    """
+
+    def __init__(self, payload):
+        self.__dict__['_payload'] = payload
+        super().__init__(lambda: self._load())
+
+    def _load(self):
+        user_id = self._payload['user_id']
+        try:
+            return load_user(user_id)
+        except get_user_model().DoesNotExist:
+            # Deleted by another process; remember it so the token is refused next time.
+            user_snapshots.invalidate(user_id, deleted=True)
+            raise
+
+    @property
+    def id(self):
+        return self._payload['user_id']
+
+    pk = id
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
@@ -0,0 +1,53 @@
+import time
+import timeit
+
+from django.core.management.base import BaseCommand
+
+import jwt
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark jwt.encode/decode against the pre-keyed Signer/Verifier.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+        parser.add_argument('--batch', type=int, default=100, help='Tokens per verify_many() call')
+
+    def handle(self, *args, **options):
+        n = options['iterations']
+        batch = options['batch']
+        key = 'bench-secret-key-' + 'x' * 32
+        payload = {
+            'user_id': 42,
+            'username': 'bench',
+            'email': 'bench@example.com',
+            'exp': int(time.time()) + 3600,
+            'iat': int(time.time()),
+        }
+
+        signer = jwt.Signer(key, kid='bench')
+        verifier = jwt.Verifier({'bench': key}, default_kid='bench')
+        legacy_token = jwt.encode(payload, key)
+        token = signer.encode(payload)
+        tokens = [signer.encode({**payload, 'user_id': i}) for i in range(batch)]
+
+        cases = [
+            ('jwt.encode', lambda: jwt.encode(payload, key)),
+            ('Signer.encode', lambda: signer.encode(payload)),
+            ('jwt.decode', lambda: jwt.decode(legacy_token, key)),
+            ('Verifier.verify', lambda: verifier.verify(token)),
+        ]
+        self.stdout.write(f"{'case':<28}{'us/token':>12}")
+        for name, fn in cases:
+            self._report(name, min(timeit.repeat(fn, number=n, repeat=3)) / n)
+
+        rounds = max(1, n // batch)
+        elapsed = min(timeit.repeat(lambda: verifier.verify_many(tokens), number=rounds, repeat=3))
+        self._report(f'Verifier.verify_many({batch})', elapsed / (rounds * batch))
+
+        cache = jwt.TokenCache()
+        elapsed = min(timeit.repeat(lambda: cache.verify(token, verifier), number=n, repeat=3))
+        self._report('TokenCache.verify (warm)', elapsed / n)
+
+    def _report(self, name, seconds):
+        self.stdout.write(f'{name:<28}{seconds * 1e6:>12.2f}')
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from accounts.otp import CacheOTPBackend, DatabaseOTPBackend
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the OTP round trip (issue, one wrong guess, verify) for the db and "
+        "cache backends: wall time and database queries. Rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=500)
+
+    def handle(self, *args, **options):
+        n = options['iterations']
+        # A private local-memory cache so the benchmark never touches shared state.
+        bench_cache = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-otp'}
+        with override_settings(CACHES={'default': bench_cache, 'bench-otp': bench_cache}):
+            backends = [
+                ('db', DatabaseOTPBackend()),
+                ('cache (locmem)', CacheOTPBackend('bench-otp')),
+            ]
+            self.stdout.write(f"{'backend':<20}{'us/round trip':>15}{'queries':>9}")
+            try:
+                with transaction.atomic():
+                    for name, backend in backends:
+                        self._run(name, backend, n)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def _run(self, name, backend, n):
+        emails = [f'bench-otp-{i}@example.com' for i in range(n)]
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            for email in emails:
+                code = backend.issue(email, 'login')
+                backend.verify(email, '000000', 'login')  # Codes are 100000-999999.
+                assert backend.verify(email, code, 'login')
+            elapsed = time.perf_counter() - start
+        self.stdout.write(f'{name:<20}{elapsed / n * 1e6:>15.1f}{len(captured) / n:>9.1f}')
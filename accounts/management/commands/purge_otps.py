@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from accounts.otp import DatabaseOTPBackend
+
+
+class Command(BaseCommand):
+    help = 'Delete used and expired one-time passcodes from the OTP table (the db OTP backend).'
+
+    def handle(self, *args, **options):
+        deleted = DatabaseOTPBackend().purge()
+        self.stdout.write(f'Deleted {deleted} OTP row(s)')
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:11
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_user_profile_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['otp_type', 'email', 'is_used'], name='accounts_otp_type_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(django.db.models.functions.text.Upper('email'), models.F('otp_type'), models.F('is_used'), models.F('expires_at'), name='accounts_otp_email_upper_idx'),
+        ),
+    ]
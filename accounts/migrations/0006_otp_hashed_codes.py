@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:30
+
+from django.db import migrations, models
+
+
+def delete_plaintext_codes(apps, schema_editor):
+    # Rows from before hashing can never verify; they would only wait for purge_otps.
+    apps.get_model('accounts', 'OTP').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_otp_accounts_otp_type_email_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_plaintext_codes, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='otp',
+            name='accounts_otp_email_upper_idx',
+        ),
+        migrations.AddField(
+            model_name='otp',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='otp',
+            name='otp_code',
+            field=models.CharField(max_length=64),
+        ),
+    ]
@@ -68,6 +68,7 @@ class ServiceProvider(models.Model):
 
 
 class OTP(models.Model):
+    """A one-time passcode issued by accounts.otp.DatabaseOTPBackend."""
     OTP_TYPES = [
         ('register', 'Registration'),
         ('login', 'Login'),
@@ -75,59 +76,19 @@ class OTP(models.Model):
     ]
     
     email = models.EmailField()
-    otp_code = models.CharField(max_length=6)
+    # HMAC of the code (accounts.otp.hash_code), never the code itself.
+    otp_code = models.CharField(max_length=64)
     otp_type = models.CharField(max_length=20, choices=OTP_TYPES)
     created_at = models.DateTimeField(auto_now_add=True)
     is_used = models.BooleanField(default=False)
     expires_at = models.DateTimeField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Issue, verify and the failed-attempt counter all filter on these exactly.
+            models.Index(fields=['otp_type', 'email', 'is_used'], name='accounts_otp_type_email_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.email} - {self.otp_code}"
-    
-    @classmethod
-    def create_otp(cls, email, otp_type):
-        import datetime
-        from django.utils import timezone
-        
-        # Delete any existing unused OTPs for this email and type
-        cls.objects.filter(email=email, otp_type=otp_type, is_used=False).delete()
-        
-        # Create new OTP that expires in 10 minutes
-        expires_at = timezone.now() + datetime.timedelta(minutes=10)
-        import random
-        otp_code = str(random.randint(100000, 999999))
-        otp_instance = cls.objects.create(
-            email=email,
-            otp_code=otp_code,
-            otp_type=otp_type,
-            expires_at=expires_at
-        )
-        return otp_instance
-    
-    @classmethod
-    def validate_otp(cls, email, otp_code, otp_type):
-        from django.utils import timezone
-        now = timezone.now()
-        print(f"DEBUG: Validating OTP - Email: {email}, Code: {otp_code}, Type: {otp_type}, Time: {now}")
-        
-        try:
-            # Check all matching records to see what's wrong
-            all_matches = cls.objects.filter(email__iexact=email, otp_type=otp_type)
-            print(f"DEBUG: Found {all_matches.count()} total OTP records for this email/type")
-            for record in all_matches:
-                print(f"DEBUG: Record ID: {record.id}, Code: {record.otp_code}, Used: {record.is_used}, Expires: {record.expires_at}")
-
-            otp_instance = cls.objects.get(
-                email__iexact=email,
-                otp_code=otp_code,
-                otp_type=otp_type,
-                is_used=False,
-                expires_at__gt=now
-            )
-            otp_instance.is_used = True
-            otp_instance.save()
-            print("DEBUG: OTP Validation SUCCESS")
-            return otp_instance
-        except cls.DoesNotExist:
-            print("DEBUG: OTP Validation FAILED - No matching unused, non-expired record found")
-            return None
+        return f"{self.email} ({self.otp_type})"
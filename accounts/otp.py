@@ -0,0 +1,154 @@
+"""
+One-time passcodes for registration, login and password reset.
+
+issue_otp() returns a fresh 6-digit code for (email, otp_type) and replaces any
+code issued before it. verify_otp() consumes the code: it succeeds at most
+once, and only within OTP_TTL_SECONDS. After OTP_MAX_ATTEMPTS wrong guesses
+the code is burned and a new one must be issued.
+
+Only an HMAC of the code is stored. Two backends are available, chosen with
+OTP_BACKEND:
+- 'cache': one TTL'd cache key per code plus an attempt counter. Expired codes
+  vanish on their own and nothing touches the database. Needs a cache shared
+  by all workers (REDIS_URL); the local-memory cache only works for a single
+  process.
+- 'db': rows in the OTP table. Issuing costs a delete and an insert, and
+  verification is a single conditional UPDATE. Expired and used rows are
+  removed by `manage.py purge_otps`.
+"""
+import datetime
+import hashlib
+import hmac
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OTP
+
+TTL = getattr(settings, 'OTP_TTL_SECONDS', 600)
+MAX_ATTEMPTS = getattr(settings, 'OTP_MAX_ATTEMPTS', 5)
+
+
+def generate_code():
+    return f'{secrets.randbelow(900000) + 100000}'
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def hash_code(email, otp_type, code):
+    message = f'{otp_type}:{email}:{(code or "").strip()}'.encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+class DatabaseOTPBackend:
+    """Codes stored as OTP rows."""
+
+    def __init__(self, ttl=TTL, max_attempts=MAX_ATTEMPTS):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+
+    def issue(self, email, otp_type):
+        email = normalize_email(email)
+        code = generate_code()
+        OTP.objects.filter(email=email, otp_type=otp_type).delete()
+        OTP.objects.create(
+            email=email,
+            otp_code=hash_code(email, otp_type, code),
+            otp_type=otp_type,
+            expires_at=timezone.now() + datetime.timedelta(seconds=self.ttl),
+        )
+        return code
+
+    def verify(self, email, code, otp_type):
+        email = normalize_email(email)
+        live = OTP.objects.filter(
+            email=email, otp_type=otp_type, is_used=False, expires_at__gt=timezone.now()
+        )
+        # The UPDATE is the consume: of two concurrent requests with the right
+        # code, only one sees a matched row.
+        if live.filter(otp_code=hash_code(email, otp_type, code), attempts__lt=self.max_attempts).update(is_used=True):
+            return True
+        live.update(attempts=F('attempts') + 1)
+        return False
+
+    def purge(self):
+        """Delete used and expired codes. Returns the number of rows deleted."""
+        deleted, _ = OTP.objects.filter(Q(is_used=True) | Q(expires_at__lte=timezone.now())).delete()
+        return deleted
+
+
+class CacheOTPBackend:
+    """Codes stored as TTL'd cache keys; see the module docstring."""
+
+    def __init__(self, alias='default', ttl=TTL, max_attempts=MAX_ATTEMPTS):
+        self.cache = caches[alias]
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+
+    def _keys(self, email, otp_type):
+        digest = hashlib.sha256(email.encode()).hexdigest()
+        return f'otp:{otp_type}:{digest}', f'otp-attempts:{otp_type}:{digest}'
+
+    def issue(self, email, otp_type):
+        email = normalize_email(email)
+        code = generate_code()
+        code_key, attempts_key = self._keys(email, otp_type)
+        self.cache.set_many({code_key: hash_code(email, otp_type, code), attempts_key: 0}, self.ttl)
+        return code
+
+    def verify(self, email, code, otp_type):
+        email = normalize_email(email)
+        code_key, attempts_key = self._keys(email, otp_type)
+        try:
+            attempts = self.cache.incr(attempts_key)
+        except ValueError:
+            return False  # No live code.
+        if attempts > self.max_attempts:
+            self.cache.delete_many([code_key, attempts_key])
+            return False
+        stored = self.cache.get(code_key)
+        if stored is None or not hmac.compare_digest(stored, hash_code(email, otp_type, code)):
+            return False
+        # delete() reports whether the key was there, so a code is consumed only once.
+        if not self.cache.delete(code_key):
+            return False
+        self.cache.delete(attempts_key)
+        return True
+
+    def purge(self):
+        return 0  # Expired keys are evicted by the cache.
+
+
+BACKENDS = {
+    'db': DatabaseOTPBackend,
+    'cache': CacheOTPBackend,
+}
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'OTP_BACKEND', 'db')
+        try:
+            backend_class = BACKENDS[name]
+        except KeyError:
+            raise ValueError(f"Unknown OTP_BACKEND {name!r}; expected one of {', '.join(BACKENDS)}")
+        _backend = backend_class()
+    return _backend
+
+
+def issue_otp(email, otp_type):
+    """Create a code for (email, otp_type), replacing any earlier one, and return it."""
+    return get_backend().issue(email, otp_type)
+
+
+def verify_otp(email, code, otp_type):
+    """Consume the code. Returns True if it was valid, unused and unexpired."""
+    return get_backend().verify(email, code, otp_type)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .auth import user_snapshots
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_snapshot(sender, instance, **kwargs):
+    # updated_at moves on every save, so any cached snapshot is now stale.
+    user_snapshots.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_deleted_user(sender, instance, **kwargs):
+    user_snapshots.invalidate(instance.pk, deleted=True)
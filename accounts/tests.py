@@ -1,3 +1,370 @@
-from django.test import TestCase
+import datetime
+import json
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+import jwt
+from core.tests import run_concurrently
+
+from . import otp
+from .api_views import generate_token
+from .auth import user_snapshots
+from .models import OTP, User
+
+
+class TokenCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = jwt.TokenCache(maxsize=3)
+        self.verifier = jwt.Verifier('secret')
+        self.signer = jwt.Signer('secret')
+
+    def token(self, sub, ttl=60):
+        return self.signer.encode({'sub': sub, 'exp': int(time.time()) + ttl})
+
+    def test_repeated_token_is_served_from_the_cache(self):
+        token = self.token('a')
+        first = self.cache.verify(token, self.verifier)
+        first['sub'] = 'changed'  # Callers get copies.
+        self.assertEqual(self.cache.verify(token, self.verifier)['sub'], 'a')
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 3})
+
+    def test_expired_entry_is_dropped(self):
+        token = self.token('a', ttl=10)
+        self.cache.verify(token, self.verifier)
+        with mock.patch.object(jwt.time, 'time', return_value=time.time() + 20):
+            with self.assertRaises(jwt.ExpiredSignatureError):
+                self.cache.verify(token, self.verifier)
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        a, b, c, d = (self.token(sub) for sub in 'abcd')
+        for token in (a, b, c, a, d):  # Touching `a` makes `b` the oldest.
+            self.cache.verify(token, self.verifier)
+        self.assertEqual(self.cache.stats()['size'], 3)
+        with mock.patch.object(self.verifier, 'verify', wraps=self.verifier.verify) as verify:
+            for token in (a, c, d):
+                self.cache.verify(token, self.verifier)
+            self.assertEqual(verify.call_count, 0)
+            self.cache.verify(b, self.verifier)
+            self.assertEqual(verify.call_count, 1)
+
+    def test_new_verifier_flushes_the_cache(self):
+        token = self.token('a')
+        self.cache.verify(token, self.verifier)
+        with self.assertRaises(jwt.InvalidTokenError):
+            self.cache.verify(token, jwt.Verifier('rotated'))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_new_key_flushes_the_cache(self):
+        token = jwt.encode({'sub': 'a'}, 'secret')
+        self.assertEqual(self.cache.decode(token, 'secret'), {'sub': 'a'})
+        with self.assertRaises(jwt.InvalidTokenError):
+            self.cache.decode(token, 'other')
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_invalid_tokens_are_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(jwt.InvalidTokenError):
+                self.cache.verify('not.a.token', self.verifier)
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 2, 'size': 0, 'maxsize': 3})
+
+
+class SignerVerifierTests(SimpleTestCase):
+    def setUp(self):
+        self.verifier = jwt.Verifier({'2024': 'old-secret', '2025': 'new-secret'}, default_kid='2024')
+
+    def test_signed_tokens_verify(self):
+        token = jwt.Signer('new-secret', kid='2025').encode({'sub': 'a'})
+        self.assertEqual(self.verifier.verify(token), {'sub': 'a'})
+        # Same bytes as the module-level encoder apart from the kid header.
+        self.assertEqual(jwt.Signer('k').encode({'sub': 'a'}), jwt.encode({'sub': 'a'}, 'k'))
+
+    def test_previous_key_still_verifies(self):
+        token = jwt.Signer('old-secret', kid='2024').encode({'sub': 'a'})
+        self.assertEqual(self.verifier.verify(token), {'sub': 'a'})
+
+    def test_unknown_kid_is_rejected(self):
+        token = jwt.Signer('new-secret', kid='2026').encode({'sub': 'a'})
+        with self.assertRaisesMessage(jwt.InvalidTokenError, 'Unknown key id'):
+            self.verifier.verify(token)
+
+    def test_kid_does_not_select_a_different_key(self):
+        token = jwt.Signer('old-secret', kid='2025').encode({'sub': 'a'})
+        with self.assertRaisesMessage(jwt.InvalidTokenError, 'Signature verification failed'):
+            self.verifier.verify(token)
+
+    def test_legacy_token_without_kid_uses_the_default_key(self):
+        self.assertEqual(self.verifier.verify(jwt.encode({'sub': 'a'}, 'old-secret')), {'sub': 'a'})
+        with self.assertRaises(jwt.InvalidTokenError):
+            self.verifier.verify(jwt.encode({'sub': 'a'}, 'new-secret'))
+
+    def test_disallowed_alg_is_rejected(self):
+        header = jwt.base64url_encode(b'{"alg": "none", "typ": "JWT"}')
+        with self.assertRaisesMessage(jwt.InvalidTokenError, 'alg value is not allowed'):
+            self.verifier.verify(f'{header}.e30.')
+
+    def test_expired_token_is_rejected(self):
+        token = jwt.Signer('new-secret', kid='2025').encode({'exp': int(time.time()) - 1})
+        with self.assertRaises(jwt.ExpiredSignatureError):
+            self.verifier.verify(token)
+
+    def test_verify_many_reports_each_token(self):
+        good = jwt.Signer('new-secret', kid='2025').encode({'sub': 'a'})
+        payload, malformed, forged = self.verifier.verify_many([good, 'garbage', good[:-2] + 'xx'])
+        self.assertEqual(payload, {'sub': 'a'})
+        self.assertIsInstance(malformed, jwt.InvalidTokenError)
+        self.assertIsInstance(forged, jwt.InvalidTokenError)
+
+    def test_signer_rejects_other_algorithms(self):
+        with self.assertRaises(ValueError):
+            jwt.Signer('k', algorithm='HS512')
+
+
+class TokenUserTests(TestCase):
+    def setUp(self):
+        user_snapshots.clear()
+        self.addCleanup(user_snapshots.clear)
+        self.user = User.objects.create_user(username='tokenuser', email='old@example.com', password='pw')
+        self.token = generate_token(self.user)
+
+    def profile(self):
+        return self.client.get('/api/profile/', HTTP_AUTHORIZATION='Bearer ' + self.token)
+
+    def test_cached_user_needs_no_query(self):
+        self.profile()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.profile().json()['user']['email'], 'old@example.com')
+
+    def test_profile_change_is_seen_with_an_old_token(self):
+        self.profile()
+        self.user.email = 'new@example.com'
+        self.user.save()
+        self.assertEqual(self.profile().json()['user']['email'], 'new@example.com')
+
+    def test_deleted_user_is_refused(self):
+        self.profile()
+        self.user.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.profile().status_code, 401)
+
+    def test_user_deleted_by_another_process_is_refused(self):
+        self.user.delete()
+        user_snapshots.clear()  # This process never saw the delete signal.
+        self.assertEqual(self.profile().status_code, 401)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.profile().status_code, 401)
+
+
+class OTPBackendTestsMixin:
+    """Behaviour both OTP backends must share; subclasses provide the backend and its clock."""
+
+    email = 'Someone@Example.com '
+
+    def make_backend(self, **options):
+        raise NotImplementedError
+
+    def later(self, seconds):
+        """Context manager under which the backend sees a clock `seconds` ahead."""
+        raise NotImplementedError
+
+    def setUp(self):
+        self.backend = self.make_backend(ttl=60, max_attempts=3)
+
+    def test_code_verifies_once(self):
+        code = self.backend.issue(self.email, 'login')
+        self.assertRegex(code, r'^[1-9][0-9]{5}$')
+        self.assertTrue(self.backend.verify('someone@example.com', f' {code} ', 'login'))
+        self.assertFalse(self.backend.verify(self.email, code, 'login'))
+
+    def test_code_is_bound_to_email_and_type(self):
+        code = self.backend.issue(self.email, 'login')
+        self.assertFalse(self.backend.verify('other@example.com', code, 'login'))
+        self.assertFalse(self.backend.verify(self.email, code, 'password_reset'))
+        self.assertTrue(self.backend.verify(self.email, code, 'login'))
+
+    def test_new_code_replaces_the_old_one(self):
+        first = self.backend.issue(self.email, 'login')
+        second = self.backend.issue(self.email, 'login')
+        if first != second:
+            self.assertFalse(self.backend.verify(self.email, first, 'login'))
+        self.assertTrue(self.backend.verify(self.email, second, 'login'))
+
+    def test_wrong_codes_lock_the_code_out(self):
+        code = self.backend.issue(self.email, 'login')
+        wrong = '000000'
+        for _ in range(2):
+            self.assertFalse(self.backend.verify(self.email, wrong, 'login'))
+        # Still under the limit: the right code works.
+        self.assertTrue(self.backend.verify(self.email, code, 'login'))
+
+        code = self.backend.issue(self.email, 'login')
+        for _ in range(3):
+            self.assertFalse(self.backend.verify(self.email, wrong, 'login'))
+        self.assertFalse(self.backend.verify(self.email, code, 'login'))
+        # Issuing again starts a fresh count.
+        code = self.backend.issue(self.email, 'login')
+        self.assertTrue(self.backend.verify(self.email, code, 'login'))
+
+    def test_expired_code_fails(self):
+        code = self.backend.issue(self.email, 'login')
+        with self.later(61):
+            self.assertFalse(self.backend.verify(self.email, code, 'login'))
+        code = self.backend.issue(self.email, 'login')
+        with self.later(59):
+            self.assertTrue(self.backend.verify(self.email, code, 'login'))
+
+
+class DatabaseOTPBackendTests(OTPBackendTestsMixin, TestCase):
+    def make_backend(self, **options):
+        return otp.DatabaseOTPBackend(**options)
+
+    def later(self, seconds):
+        return mock.patch.object(otp.timezone, 'now', return_value=timezone.now() + datetime.timedelta(seconds=seconds))
+
+    def test_only_the_hash_is_stored(self):
+        code = self.backend.issue(self.email, 'register')
+        row = OTP.objects.get()
+        self.assertEqual(row.email, 'someone@example.com')
+        self.assertNotIn(code, row.otp_code)
+        self.assertEqual(row.otp_code, otp.hash_code('someone@example.com', 'register', code))
+        self.assertEqual(len(row.otp_code), 64)
+
+    def test_wrong_guesses_are_counted_on_the_row(self):
+        self.backend.issue(self.email, 'login')
+        self.backend.verify(self.email, '000000', 'login')
+        self.backend.verify(self.email, '000001', 'login')
+        self.assertEqual(OTP.objects.get().attempts, 2)
+
+    def test_purge_removes_used_and_expired_codes(self):
+        self.backend.verify(self.email, self.backend.issue(self.email, 'login'), 'login')
+        self.backend.issue(self.email, 'register')
+        self.backend.issue('live@example.com', 'register')
+        OTP.objects.filter(otp_type='register', email='someone@example.com').update(expires_at=timezone.now())
+        self.assertEqual(self.backend.purge(), 2)
+        self.assertEqual(list(OTP.objects.values_list('email', flat=True)), ['live@example.com'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'otp-tests'}})
+class CacheOTPBackendTests(OTPBackendTestsMixin, SimpleTestCase):
+    def make_backend(self, **options):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        return otp.CacheOTPBackend(**options)
+
+    def later(self, seconds):
+        clock = mock.Mock(time=mock.Mock(return_value=time.time() + seconds))
+        return mock.patch('django.core.cache.backends.locmem.time', clock)
+
+    def keys(self):
+        return self.backend._keys('someone@example.com', 'login')
+
+    def test_only_the_hash_is_stored(self):
+        code = self.backend.issue(self.email, 'login')
+        code_key, attempts_key = self.keys()
+        self.assertNotIn('someone', code_key)
+        self.assertEqual(cache.get(code_key), otp.hash_code('someone@example.com', 'login', code))
+        self.assertEqual(cache.get(attempts_key), 0)
+
+    def test_attempts_are_counted_and_keys_deleted(self):
+        code = self.backend.issue(self.email, 'login')
+        code_key, attempts_key = self.keys()
+        self.backend.verify(self.email, '000000', 'login')
+        self.assertEqual(cache.get(attempts_key), 1)
+        self.assertTrue(self.backend.verify(self.email, code, 'login'))
+        self.assertEqual(cache.get_many([code_key, attempts_key]), {})
+
+        self.backend.issue(self.email, 'login')
+        for _ in range(4):
+            self.backend.verify(self.email, '000000', 'login')
+        # Burned on the attempt past the limit.
+        self.assertEqual(cache.get_many([code_key, attempts_key]), {})
+
+    def test_verify_without_a_code_stores_nothing(self):
+        self.assertFalse(self.backend.verify(self.email, '123456', 'login'))
+        self.assertEqual(cache.get_many(self.keys()), {})
+
+    def test_code_is_consumed_once_under_concurrency(self):
+        code = self.backend.issue(self.email, 'login')
+        self.backend.max_attempts = 10
+        results = run_concurrently(8, lambda i: self.backend.verify(self.email, code, 'login'))
+        self.assertEqual(results.count(True), 1)
+
+    def test_purge_is_a_no_op(self):
+        self.assertEqual(self.backend.purge(), 0)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class OTPApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='otpuser', email='otp@example.com', password='pw')
+        patcher = mock.patch('accounts.api_views.send_otp_email')
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+    def sent_code(self):
+        return self.send.call_args.args[1]
+
+    def test_login_code_is_emailed_hashed_and_consumed_once(self):
+        response = self.post('/accounts/api/login/', {'username': 'otpuser', 'password': 'pw'})
+        self.assertTrue(response.json()['otp_required'])
+        code = self.sent_code()
+        self.assertFalse(OTP.objects.filter(otp_code=code).exists())
+
+        verify = {'email': 'otp@example.com', 'otp': code, 'otp_type': 'login', 'username': 'otpuser'}
+        response = self.post('/accounts/api/verify-otp/', verify)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['id'], self.user.id)
+        self.assertEqual(self.post('/accounts/api/verify-otp/', verify).status_code, 400)
+
+    def test_resend_replaces_the_code(self):
+        self.post('/accounts/api/login/', {'username': 'otpuser', 'password': 'pw'})
+        first = self.sent_code()
+        self.post('/accounts/api/resend-otp/', {'email': 'otp@example.com', 'otp_type': 'login'})
+        second = self.sent_code()
+        self.assertEqual(OTP.objects.filter(email='otp@example.com', otp_type='login').count(), 1)
+        verify = {'email': 'otp@example.com', 'otp_type': 'login', 'username': 'otpuser'}
+        if first != second:
+            self.assertEqual(self.post('/accounts/api/verify-otp/', {**verify, 'otp': first}).status_code, 400)
+        self.assertEqual(self.post('/accounts/api/verify-otp/', {**verify, 'otp': second}).status_code, 200)
+
+    def test_wrong_codes_lock_out(self):
+        self.post('/accounts/api/login/', {'username': 'otpuser', 'password': 'pw'})
+        code = self.sent_code()
+        verify = {'email': 'otp@example.com', 'otp_type': 'login', 'username': 'otpuser'}
+        wrong = '000000' if code != '000000' else '111111'
+        for _ in range(otp.MAX_ATTEMPTS):
+            self.assertEqual(self.post('/accounts/api/verify-otp/', {**verify, 'otp': wrong}).status_code, 400)
+        self.assertEqual(self.post('/accounts/api/verify-otp/', {**verify, 'otp': code}).status_code, 400)
+
+
+class PlaintextOTPMigrationTests(TransactionTestCase):
+    migrate_from = [('accounts', '0005_otp_accounts_otp_type_email_idx_and_more')]
+    migrate_to = [('accounts', '0006_otp_hashed_codes')]
+
+    def tearDown(self):
+        MigrationExecutor(connection).migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_plaintext_codes_are_purged(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        old_apps = executor.loader.project_state(self.migrate_from).apps
+        old_apps.get_model('accounts', 'OTP').objects.create(
+            email='old@example.com', otp_code='123456', otp_type='login',
+            expires_at=timezone.now() + datetime.timedelta(minutes=5),
+        )
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.migrate_to)
+        new_apps = executor.loader.project_state(self.migrate_to).apps
+        self.assertFalse(new_apps.get_model('accounts', 'OTP').objects.exists())
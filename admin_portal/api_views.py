@@ -1,12 +1,36 @@
+import logging
+
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.db.models import Count
 from accounts.models import User, ServiceProvider
-from core.models import HealthRecord, ActivityLog
+from core.models import HealthRecord
+from core.activity import log_activity
+from core.serializers import Computed, Field, Serializer, strftime
+from core.singleflight import SingleFlight
 
 from django.views.decorators.csrf import csrf_exempt
 from accounts.api_views import jwt_required
 
+logger = logging.getLogger(__name__)
+
+def display_role(user_type, provider_type):
+    # Providers are shown by their specific role when they have a profile.
+    if user_type == 'provider' and provider_type:
+        return provider_type
+    return user_type
+
+
+class AdminUserSerializer(Serializer):
+    model = User
+    id = Field()
+    username = Field()
+    email = Field()
+    user_type = Computed(('user_type', 'provider_profile__provider_type'), display_role)
+    is_approved = Field()
+    date_joined = Field(convert=strftime('%Y-%m-%d'))
+
+
 def admin_required(view_func):
     @jwt_required
     def _wrapped_view(request, *args, **kwargs):
@@ -15,31 +39,31 @@ def admin_required(view_func):
         return view_func(request, *args, **kwargs)
     return _wrapped_view
 
+def count_admin_stats():
+    return {
+        'total_users': User.objects.count(),
+        'patients': User.objects.filter(user_type='patient').count(),
+        'providers': User.objects.filter(user_type__in=['doctor', 'provider']).count(),
+        'pending_approvals': User.objects.filter(is_approved=False, user_type__in=['doctor', 'provider']).count(),
+        'total_records': HealthRecord.objects.count(),
+    }
+
+
+stats_flight = SingleFlight()
+
+
 @csrf_exempt
 @admin_required
 def admin_stats_api(request):
-    print(f"DEBUG: Admin Stats API called by {request.user.email}")
-    total_users = User.objects.count()
-    patients = User.objects.filter(user_type='patient').count()
-    providers = User.objects.filter(user_type__in=['doctor', 'provider']).count()
-    pending_approvals = User.objects.filter(is_approved=False, user_type__in=['doctor', 'provider']).count()
-    total_records = HealthRecord.objects.count()
-
-    return JsonResponse({
-        'success': True,
-        'stats': {
-            'total_users': total_users,
-            'patients': patients,
-            'providers': providers,
-            'pending_approvals': pending_approvals,
-            'total_records': total_records,
-        }
-    })
+    logger.debug('Admin stats API called by user %s', request.user.id)
+    # Concurrent requests share one run of the five COUNT queries.
+    stats = stats_flight.do('admin-stats', count_admin_stats)
+    return JsonResponse({'success': True, 'stats': stats})
 
 @csrf_exempt
 @admin_required
 def admin_users_api(request):
-    print(f"DEBUG: Admin Users API called with params: {request.GET}")
+    logger.debug('Admin users API called with params: %s', request.GET.dict())
     user_type = request.GET.get('type')
     search = request.GET.get('search')
     
@@ -50,21 +74,7 @@ def admin_users_api(request):
     if search:
         users = users.filter(email__icontains=search) | users.filter(username__icontains=search)
     
-    user_list = []
-    for user in users:
-        # Determine specific role
-        display_role = user.user_type
-        if user.user_type == 'provider' and hasattr(user, 'provider_profile'):
-            display_role = user.provider_profile.provider_type
-            
-        user_list.append({
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'user_type': display_role,
-            'is_approved': user.is_approved,
-            'date_joined': user.date_joined.strftime('%Y-%m-%d'),
-        })
+    user_list = AdminUserSerializer.serialize(users)
         
     return JsonResponse({
         'success': True,
@@ -86,15 +96,15 @@ def admin_user_action_api(request, user_id):
         if action == 'approve':
             user.is_approved = True
             user.save()
-            ActivityLog.objects.create(user=request.user, action='admin_action', details=f"Approved user {user.email}")
+            log_activity(request.user, 'admin_action', details=f"Approved user {user.email}")
         elif action == 'reject':
             user.is_approved = False
             user.save()
-            ActivityLog.objects.create(user=request.user, action='admin_action', details=f"Rejected user {user.email}")
+            log_activity(request.user, 'admin_action', details=f"Rejected user {user.email}")
         elif action == 'delete':
             email = user.email
             user.delete()
-            ActivityLog.objects.create(user=request.user, action='admin_action', details=f"Deleted user {email}")
+            log_activity(request.user, 'admin_action', details=f"Deleted user {email}")
             
         return JsonResponse({'success': True})
     except User.DoesNotExist:
@@ -1,3 +1,54 @@
-from django.test import TestCase
+import io
+from contextlib import redirect_stdout
+from unittest import mock
 
-# Create your tests here.
+from django.test import Client, TestCase, override_settings
+
+from accounts.api_views import generate_token
+from accounts.models import User
+from core.tests import run_concurrently, wait_until
+
+from . import api_views
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class AdminStatsTests(TestCase):
+    callers = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.com', password='pw', user_type='admin')
+        User.objects.create_user(username='patient', email='patient@example.com', password='pw', user_type='patient')
+        User.objects.create_user(username='doctor', email='doctor@example.com', password='pw', user_type='doctor')
+
+    def get_stats(self, client=None):
+        response = (client or self.client).get('/admin-panel/api/stats/',
+                                               HTTP_AUTHORIZATION='Bearer ' + generate_token(self.admin))
+        return response.status_code, response.json()
+
+    def test_counts(self):
+        self.assertEqual(self.get_stats(), (200, {'success': True, 'stats': {
+            'total_users': 3, 'patients': 1, 'providers': 1, 'pending_approvals': 1, 'total_records': 0,
+        }}))
+
+    def test_requests_are_logged_not_printed(self):
+        with redirect_stdout(io.StringIO()) as out, self.assertLogs('admin_portal.api_views', 'DEBUG') as logs:
+            self.get_stats()
+        self.assertEqual(out.getvalue(), '')
+        self.assertEqual(logs.output, [f'DEBUG:admin_portal.api_views:Admin stats API called by user {self.admin.id}'])
+
+    def test_concurrent_requests_count_once(self):
+        stats = api_views.count_admin_stats()
+        self.get_stats()  # Caches the admin's user snapshot, so the threads below need no database.
+        calls, coalesced = [], api_views.stats_flight.coalesced
+
+        def count_admin_stats():
+            # Hold the leader until every other request has joined it.
+            calls.append(1)
+            wait_until(lambda: api_views.stats_flight.coalesced - coalesced == self.callers - 1)
+            return stats
+
+        with mock.patch.object(api_views, 'count_admin_stats', count_admin_stats):
+            replies = run_concurrently(self.callers, lambda i: self.get_stats(Client()))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(replies, [(200, {'success': True, 'stats': stats})] * self.callers)
@@ -0,0 +1,93 @@
+"""
+Shared HTTP client for outbound calls to the LLM and TTS providers.
+
+One requests.Session per process keeps a connection pool per host, so repeat
+calls to Groq, OpenRouter or Sarvam reuse an open keep-alive connection and
+skip the TCP and TLS handshakes. Every call has a connect and a read timeout
+(OUTBOUND_HTTP_CONNECT_TIMEOUT / OUTBOUND_HTTP_READ_TIMEOUT, overridable per
+call), so a hung upstream cannot hold a worker indefinitely.
+
+Retries are bounded (OUTBOUND_HTTP_RETRIES). Connection failures are
+retried for every method, since nothing reached the upstream. 502/503/504
+answers are retried for GETs only. A POST completion or synthesis may
+already have run, and been billed, behind a gateway error, so it is never
+sent twice; callers fall back to another provider instead, as they do for
+read timeouts and 429s. The session stores no cookies, so sharing it
+between threads cannot leak one request's cookies into another.
+"""
+import http.cookiejar
+import os
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CONNECT_TIMEOUT = getattr(settings, 'OUTBOUND_HTTP_CONNECT_TIMEOUT', 3.05)
+READ_TIMEOUT = getattr(settings, 'OUTBOUND_HTTP_READ_TIMEOUT', 30.0)
+RETRIES = getattr(settings, 'OUTBOUND_HTTP_RETRIES', 2)
+# Hosts with their own pool, and keep-alive connections kept per host.
+POOL_HOSTS = 10
+POOL_SIZE = getattr(settings, 'OUTBOUND_HTTP_POOL_SIZE', 10)
+
+
+class HttpClient:
+    """Lazily built, fork-aware pooled Session; see the module docstring."""
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, retries=RETRIES,
+                 pool_size=POOL_SIZE):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.pool_size = pool_size
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _build_session(self):
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=False,  # Re-raise read timeouts as requests.ReadTimeout.
+            status=self.retries,
+            status_forcelist=(502, 503, 504),
+            # Idempotent methods only: POST is not retried once it was sent.
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            backoff_factor=0.2,
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    @property
+    def session(self):
+        # A forked worker must not share the parent's sockets.
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._build_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def request(self, method, url, timeout=None, **kwargs):
+        return self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+
+http_client = HttpClient()
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from chatbot.response_cache import response_cache
+from chatbot.routing import router
+from chatbot.tests import FakeProvider
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare time to first byte of chat_api and the SSE chat_stream_api against "
+        "local fake providers, including a Groq outage that falls back to OpenRouter "
+        "and a stream that breaks off midway."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5)
+        parser.add_argument('--latency', type=float, default=0.2, help='Provider seconds before the first chunk')
+        parser.add_argument('--chunk-delay', type=float, default=0.1, help='Provider seconds between chunks')
+
+    def handle(self, *args, **options):
+        groq = FakeProvider(latency=options['latency'], chunk_delay=options['chunk_delay']).start()
+        openrouter = FakeProvider(latency=options['latency'], chunk_delay=options['chunk_delay']).start()
+        enabled, response_cache.enabled = response_cache.enabled, False
+        try:
+            with override_settings(
+                GROQ_API_KEY='fake', GROQ_API_URL=groq.url,
+                OPENAI_API_KEY='fake', OPENROUTER_API_URL=openrouter.url,
+                RATE_LIMIT_ENABLED=False, ALLOWED_HOSTS=['testserver'],
+            ):
+                self.stdout.write(f"{'case':<36}{'first byte ms':>15}{'total ms':>10}  result")
+                n = options['requests']
+                self._report('chat_api (JSON)', [self._sync() for _ in range(n)])
+                self._report('chat_stream_api (SSE)', [asyncio.run(self._stream()) for _ in range(n)])
+
+                # Fresh routing state, so Groq (configured first) is tried first.
+                router._health.clear()
+                groq.status = 500
+                self._report('SSE, Groq down -> OpenRouter', [asyncio.run(self._stream())])
+                groq.status = 200
+
+                router._health.clear()
+                groq.break_after = 2
+                self._report('SSE, stream breaks after 2 chunks', [asyncio.run(self._stream())])
+        finally:
+            router._health.clear()
+            response_cache.enabled = enabled
+            groq.stop()
+            openrouter.stop()
+
+    def _sync(self):
+        start = time.perf_counter()
+        response = Client().post('/chatbot/api/', json.dumps({'message': 'What is normal blood pressure?'}),
+                                 content_type='application/json')
+        elapsed = time.perf_counter() - start
+        return elapsed, elapsed, f'{response.status_code} {len(response.json().get("response", ""))} chars'
+
+    async def _stream(self):
+        start = time.perf_counter()
+        response = await AsyncClient().post('/chatbot/api/stream/',
+                                            json.dumps({'message': 'What is normal blood pressure?'}),
+                                            content_type='application/json')
+        first = None
+        events = []
+        async for chunk in response.streaming_content:
+            if first is None:
+                first = time.perf_counter() - start
+            events.append(chunk.decode())
+        total = time.perf_counter() - start
+        text = ''.join(events)
+        deltas = text.count('data: {"delta"')
+        ending = 'error' if 'event: error' in text else 'done' if 'event: done' in text else 'unterminated'
+        provider = json.loads(text.rsplit('data: ', 1)[1]).get('provider', '') if ending == 'done' else ''
+        return first, total, f'{response.status_code} {deltas} deltas, {ending} {provider}'.rstrip()
+
+    def _report(self, name, runs):
+        first = sum(run[0] for run in runs) / len(runs)
+        total = sum(run[1] for run in runs) / len(runs)
+        self.stdout.write(f'{name:<36}{first * 1e3:>15.0f}{total * 1e3:>10.0f}  {runs[-1][2]}')
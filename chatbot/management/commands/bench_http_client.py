@@ -0,0 +1,40 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+
+from chatbot.http_client import HttpClient
+from chatbot.tests import FakeProvider
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure outbound call latency against a local stand-in provider: bare "
+        "requests.post (a new connection per call) versus the pooled HttpClient. "
+        "Timeout and retry behaviour is covered by chatbot.tests.HttpClientTests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=500)
+        parser.add_argument('--latency', type=float, default=0.0, help='Server think time per call, seconds')
+
+    def handle(self, *args, **options):
+        calls = options['calls']
+        server = FakeProvider(latency=options['latency']).start()
+        payload = {'model': 'bench', 'messages': [{'role': 'user', 'content': 'hi'}]}
+        try:
+            self.stdout.write(f"{'case':<28}{'ms/call':>10}{'connections':>13}")
+            client = HttpClient()
+            cases = [
+                ('requests.post', lambda: requests.post(server.url, json=payload, timeout=10)),
+                ('HttpClient.post', lambda: client.post(server.url, json=payload)),
+            ]
+            for name, call in cases:
+                server.connections = 0
+                start = time.perf_counter()
+                for _ in range(calls):
+                    call().raise_for_status()
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'{name:<28}{elapsed / calls * 1e3:>10.3f}{server.connections:>13}')
+        finally:
+            server.stop()
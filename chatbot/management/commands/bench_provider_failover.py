@@ -0,0 +1,74 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+from chatbot.providers import configured_providers
+from chatbot.response_cache import response_cache
+from chatbot.routing import router
+from chatbot.tests import FakeProvider
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a Groq outage against local fake providers and print each chat_api "
+        "request's latency and provider state: the circuit opening, the half-open "
+        "probe after the cooldown, and latency-based routing once both are healthy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=12, help='Requests per phase')
+        parser.add_argument('--cooldown', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        groq = FakeProvider(latency=0.3, status=500).start()
+        openrouter = FakeProvider(latency=0.05).start()
+        saved_options = dict(router.breaker_options)
+        router.breaker_options['cooldown'] = options['cooldown']
+        router._health.clear()
+        enabled, response_cache.enabled = response_cache.enabled, False
+        try:
+            with override_settings(
+                GROQ_API_KEY='fake', GROQ_API_URL=groq.url,
+                OPENAI_API_KEY='fake', OPENROUTER_API_URL=openrouter.url,
+                RATE_LIMIT_ENABLED=False, ALLOWED_HOSTS=['testserver'],
+            ):
+                client = Client()
+                n = options['requests']
+                self.stdout.write('Groq failing after 300 ms:')
+                self._run(client, n, groq, openrouter)
+
+                self.stdout.write(f"Groq recovered and faster than OpenRouter, after the {options['cooldown']}s cooldown:")
+                groq.status, groq.latency, openrouter.latency = 200, 0.02, 0.1
+                time.sleep(options['cooldown'])
+                self._run(client, n, groq, openrouter)
+
+                self.stdout.write('Groq slows down:')
+                groq.latency = 0.25
+                self._run(client, n, groq, openrouter)
+
+                for entry in router.status(configured_providers()):
+                    self.stdout.write(json.dumps(entry))
+        finally:
+            response_cache.enabled = enabled
+            router.breaker_options.update(saved_options)
+            router._health.clear()
+            groq.stop()
+            openrouter.stop()
+
+    def _run(self, client, n, groq, openrouter):
+        for i in range(n):
+            before = groq.requests, openrouter.requests
+            start = time.perf_counter()
+            response = client.post('/chatbot/api/', json.dumps({'message': 'What is normal blood pressure?'}),
+                                   content_type='application/json')
+            elapsed = time.perf_counter() - start
+            called = [name for name, server, count in (('groq', groq, before[0]), ('openrouter', openrouter, before[1]))
+                      if server.requests > count]
+            states = {entry['name']: entry['state'] for entry in router.status(configured_providers())}
+            self.stdout.write(
+                f"  {i + 1:>3} {response.status_code} {elapsed * 1e3:>6.0f} ms  called={','.join(called):<17} "
+                f"groq={states['groq']}"
+            )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from chatbot.tests import FakeProvider
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a fake OpenAI-compatible chat provider that streams canned chunks. "
+        "Point GROQ_API_URL or OPENROUTER_API_URL at the printed URL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.5, help='Seconds before the first byte')
+        parser.add_argument('--chunk-delay', type=float, default=0.2, help='Seconds between streamed chunks')
+        parser.add_argument('--status', type=int, default=200, help='Fail every request with this status')
+        parser.add_argument('--break-after', type=int, help='Drop streams after this many chunks')
+
+    def handle(self, *args, **options):
+        server = FakeProvider(
+            port=options['port'],
+            latency=options['latency'],
+            chunk_delay=options['chunk_delay'],
+            status=options['status'],
+            break_after=options['break_after'],
+        )
+        self.stdout.write(f'Fake provider listening on {server.url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,150 @@
+"""
+LLM providers behind the chatbot.
+
+Providers are OpenAI-compatible chat-completion endpoints, tried in order:
+Groq first when GROQ_API_KEY is set, then OpenRouter. Their URLs and models
+come from settings (GROQ_API_URL, GROQ_MODEL, OPENROUTER_API_URL,
+OPENROUTER_MODEL), so a local stand-in such as chatbot.tests.FakeProvider can
+take their place.
+
+complete() returns a whole answer. open_stream() starts a `stream=true`
+completion and reads up to the first content chunk before returning. Any
+failure up to that point is a ProviderError, and the caller can still move on
+to the next provider without having sent anything to the client.
+"""
+import json
+import os
+
+from django.conf import settings
+
+from .http_client import http_client
+
+system_instruction = """
+You are HealthTrack+ AI, a helpful and professional medical assistant.
+Your goal is to help users understand their health data, provide general wellness advice,
+and assist with navigating the HealthTrack+ platform.
+Always include a disclaimer that you are an AI and not a substitute for professional medical advice.
+"""
+
+
+class ProviderError(Exception):
+    pass
+
+
+class Provider:
+    def __init__(self, name, url, model, api_key):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+
+    def __repr__(self):
+        return f'<Provider {self.name} {self.model}>'
+
+    def _post(self, message, stream):
+        payload = {
+            'model': self.model,
+            'messages': [
+                {'role': 'system', 'content': system_instruction},
+                {'role': 'user', 'content': message},
+            ],
+        }
+        if stream:
+            payload['stream'] = True
+        try:
+            response = http_client.post(
+                self.url,
+                headers={'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'},
+                data=json.dumps(payload),
+                stream=stream,
+            )
+        except Exception as e:
+            raise ProviderError(f'{self.name} request failed: {e}') from e
+        if response.status_code != 200:
+            body = response.text
+            response.close()
+            raise ProviderError(f'{self.name} API error {response.status_code}: {body[:500]}')
+        return response
+
+    def complete(self, message):
+        response = self._post(message, stream=False)
+        try:
+            return response.json()['choices'][0]['message']['content']
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise ProviderError(f'{self.name} returned an unexpected body: {e}') from e
+
+    def open_stream(self, message):
+        """Start a streamed completion; returns a CompletionStream whose first delta has arrived."""
+        response = self._post(message, stream=True)
+        deltas = iter_deltas(response)
+        try:
+            first = next(deltas)
+        except StopIteration:
+            raise ProviderError(f'{self.name} streamed no content')
+        except Exception as e:
+            response.close()
+            raise ProviderError(f'{self.name} stream failed: {e}') from e
+        return CompletionStream(response, deltas, first)
+
+
+class CompletionStream:
+    """
+    Iterator of content deltas. close() may be called from another thread
+    while a read is blocked; the read then fails instead of waiting for the
+    read timeout.
+    """
+
+    def __init__(self, response, deltas, first):
+        self.response = response
+        self._deltas = deltas
+        self._first = first
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._first is not None:
+            first, self._first = self._first, None
+            return first
+        return next(self._deltas)
+
+    def close(self):
+        self.response.close()
+
+
+def iter_deltas(response):
+    """Content deltas from an OpenAI-style SSE body (`data: {...}` lines ending with `data: [DONE]`)."""
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue  # Blank separators, comments and keep-alives.
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                return
+            chunk = json.loads(data)
+            if 'error' in chunk:
+                raise ProviderError(str(chunk['error']))
+            choices = chunk.get('choices') or [{}]
+            content = (choices[0].get('delta') or {}).get('content')
+            if content:
+                yield content
+    finally:
+        response.close()
+
+
+def configured_providers():
+    """The providers with API keys, in the order they should be tried."""
+    providers = []
+    groq_key = getattr(settings, 'GROQ_API_KEY', None) or os.environ.get('GROQ_API_KEY')
+    if groq_key and groq_key != 'your_groq_api_key_here':
+        providers.append(Provider('groq', settings.GROQ_API_URL, settings.GROQ_MODEL, groq_key))
+
+    openrouter_key = getattr(settings, 'OPENAI_API_KEY', None) or os.environ.get('OPENAI_API_KEY')
+    if not openrouter_key:
+        # Try fallback to GOOGLE_API_KEY if the user put the OR key there
+        legacy_key = getattr(settings, 'GOOGLE_API_KEY', None) or os.environ.get('GOOGLE_API_KEY')
+        if legacy_key and legacy_key.startswith('sk-or-v1'):
+            openrouter_key = legacy_key
+    if openrouter_key:
+        providers.append(Provider('openrouter', settings.OPENROUTER_API_URL, settings.OPENROUTER_MODEL, openrouter_key))
+    return providers
@@ -0,0 +1,175 @@
+"""
+Response cache for chat_api.
+
+Many chat messages are the same general question ("what is normal blood
+pressure?"). The answer is cached under a hash of the model, the system
+prompt and the normalized message, so a repeated question skips the provider
+call. Normalization folds case, Unicode forms, whitespace and trailing
+punctuation.
+
+Personalized messages are never cached or served from the cache. A message
+counts as personalized if it contains numbers (readings, doses, ages), an
+email address or phone number, or the user talking about themselves ("my",
+"I have", "I'm taking"...). An answer to one user's situation is never
+replayed to another.
+
+Backends (CHAT_CACHE_BACKEND):
+- 'memory': per-process LRU with a TTL, bounded to CHAT_CACHE_MAX_ENTRIES.
+- 'cache': the shared Django cache. The cache server evicts entries (for
+  example Redis with an allkeys-lru policy), and every worker sees every
+  answer.
+Hit, miss and bypass counts are kept by the backend: per process for
+'memory', shared for 'cache'.
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+TTL = getattr(settings, 'CHAT_CACHE_TTL', 24 * 60 * 60)
+MAX_ENTRIES = getattr(settings, 'CHAT_CACHE_MAX_ENTRIES', 1000)
+# Longer messages are almost never repeated verbatim.
+MAX_MESSAGE_LENGTH = 300
+OUTCOMES = ('hits', 'misses', 'bypassed')
+
+PERSONAL_RE = re.compile(
+    r"\d"
+    r"|\S+@\S+"
+    r"|\b(?:my|mine|myself|our|ours)\b"
+    r"|\bi(?:'m| am| have|'ve| had| was| feel| felt| take| took| got| weigh| suffer)\b",
+    re.IGNORECASE,
+)
+TRAILING_PUNCTUATION = '?!.,;: '
+
+
+def normalize_message(message):
+    text = unicodedata.normalize('NFKC', message).casefold()
+    return ' '.join(text.split()).rstrip(TRAILING_PUNCTUATION)
+
+
+def is_personalized(message):
+    return bool(PERSONAL_RE.search(message))
+
+
+def cache_key(model, system_prompt, message):
+    digest = hashlib.sha256(f'{model}\0{system_prompt}\0{normalize_message(message)}'.encode()).hexdigest()
+    return f'chat-response:{digest}'
+
+
+class MemoryBackend:
+    """Thread-safe LRU with per-entry expiry."""
+
+    name = 'memory'
+
+    def __init__(self, maxsize=MAX_ENTRIES, ttl=TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._counts = dict.fromkeys(OUTCOMES, 0)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def record(self, outcome):
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def counts(self):
+        with self._lock:
+            return {**self._counts, 'entries': len(self._entries)}
+
+
+class DjangoCacheBackend:
+    """Entries and counters in a Django cache alias."""
+
+    name = 'cache'
+
+    def __init__(self, alias='default', ttl=TTL):
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.ttl)
+
+    def record(self, outcome):
+        key = f'chat-response-stats:{outcome}'
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            if not self.cache.add(key, 1, None):
+                self.cache.incr(key)
+
+    def counts(self):
+        stored = self.cache.get_many([f'chat-response-stats:{outcome}' for outcome in OUTCOMES])
+        return {outcome: stored.get(f'chat-response-stats:{outcome}', 0) for outcome in OUTCOMES}
+
+
+class ResponseCache:
+    def __init__(self, backend, enabled=True):
+        self.backend = backend
+        self.enabled = enabled
+
+    def cacheable(self, message):
+        return self.enabled and len(message) <= MAX_MESSAGE_LENGTH and not is_personalized(message)
+
+    def get(self, models, system_prompt, message):
+        """
+        The cached answer to `message` from the first of `models` that has
+        one, or None. Counts a hit, miss or bypass.
+        """
+        if not self.cacheable(message):
+            self.backend.record('bypassed')
+            return None
+        for model in models:
+            answer = self.backend.get(cache_key(model, system_prompt, message))
+            if answer is not None:
+                self.backend.record('hits')
+                return answer
+        self.backend.record('misses')
+        return None
+
+    def set(self, model, system_prompt, message, answer):
+        if self.cacheable(message) and answer:
+            self.backend.set(cache_key(model, system_prompt, message), answer)
+
+    def stats(self):
+        counts = self.backend.counts()
+        lookups = counts['hits'] + counts['misses']
+        counts['hit_ratio'] = round(counts['hits'] / lookups, 4) if lookups else None
+        counts['backend'] = self.backend.name
+        return counts
+
+
+def build_response_cache():
+    if getattr(settings, 'CHAT_CACHE_BACKEND', 'memory') == 'cache':
+        backend = DjangoCacheBackend(getattr(settings, 'CHAT_CACHE_ALIAS', 'default'))
+    else:
+        backend = MemoryBackend()
+    return ResponseCache(backend, enabled=getattr(settings, 'CHAT_CACHE_ENABLED', True))
+
+
+response_cache = build_response_cache()
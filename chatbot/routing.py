@@ -0,0 +1,207 @@
+"""
+Health-aware provider selection for the chatbot.
+
+Each provider has a circuit breaker. Failures are counted over the last
+CHAT_BREAKER_WINDOW calls. Once at least CHAT_BREAKER_MIN_CALLS have been
+made and the failure rate reaches CHAT_BREAKER_FAILURE_RATE, the breaker
+opens: the provider is skipped without a request for CHAT_BREAKER_COOLDOWN
+seconds. It is then half-open. A single probe request is let through, and
+its outcome closes the breaker again or reopens it for another cooldown.
+
+Among the providers whose breakers allow a call, route() tries the one
+with the lowest recent latency first. Latency is an exponentially weighted
+moving average (CHAT_LATENCY_EWMA_ALPHA), kept separately for blocking
+completions and for a stream's time to first token. A provider with no
+samples yet is tried first so that it gets measured; ties keep the
+configured order.
+
+State is per process and shared by all its threads. status() reports it
+for /chatbot/api/providers/.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from .providers import ProviderError
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    def __init__(self, name, window=20, min_calls=5, failure_rate=0.5, cooldown=30.0):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.opened_at = None
+        self._results = deque(maxlen=window)  # True for a success
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go out now. In the half-open state, grants the one probe."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now - self.opened_at < self.cooldown:
+                    return False
+                self.state = HALF_OPEN
+                logger.info('Chat provider %s circuit half-open; sending a probe', self.name)
+            elif self._probe_started is not None and now - self._probe_started < self.cooldown:
+                return False  # A probe is already in flight.
+            # Also replaces a probe that never reported back.
+            self._probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+                self.opened_at = self._probe_started = None
+                self._results.clear()
+                logger.warning('Chat provider %s circuit closed', self.name)
+            self._results.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            self._results.append(False)
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED
+                and len(self._results) >= self.min_calls
+                and self._failures() / len(self._results) >= self.failure_rate
+            ):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probe_started = None
+                logger.warning('Chat provider %s circuit opened for %ss', self.name, self.cooldown)
+
+    def retry_in(self):
+        """Seconds until an open breaker lets a probe through; 0 otherwise."""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def _failures(self):
+        return sum(1 for ok in self._results if not ok)
+
+    def snapshot(self):
+        with self._lock:
+            calls = len(self._results)
+            return {
+                'state': self.state,
+                'window_calls': calls,
+                'window_failures': self._failures(),
+                'failure_rate': round(self._failures() / calls, 3) if calls else None,
+            }
+
+
+class ProviderHealth:
+    def __init__(self, name, alpha, **breaker_options):
+        self.breaker = CircuitBreaker(name, **breaker_options)
+        self.alpha = alpha
+        self.latency = {}  # kind -> EWMA seconds
+        self.calls = 0
+        self.failures = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def observe(self, kind, seconds):
+        with self._lock:
+            self.calls += 1
+            previous = self.latency.get(kind)
+            self.latency[kind] = seconds if previous is None else self.alpha * seconds + (1 - self.alpha) * previous
+
+    def fail(self):
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+
+
+class ProviderRouter:
+    def __init__(self, window=20, min_calls=5, failure_rate=0.5, cooldown=30.0, alpha=0.3):
+        self.breaker_options = {
+            'window': window, 'min_calls': min_calls, 'failure_rate': failure_rate, 'cooldown': cooldown,
+        }
+        self.alpha = alpha
+        self._health = {}
+        self._lock = threading.Lock()
+
+    def health(self, provider):
+        with self._lock:
+            health = self._health.get(provider.name)
+            if health is None:
+                health = self._health[provider.name] = ProviderHealth(provider.name, self.alpha, **self.breaker_options)
+            return health
+
+    def route(self, providers, kind):
+        """
+        Yield the providers to try, fastest first, skipping those whose
+        breaker is open. Breakers are consulted lazily, so a half-open probe
+        is only granted to a provider that will actually be called.
+        """
+        ordered = sorted(providers, key=lambda p: self.health(p).latency.get(kind, 0.0))
+        for provider in ordered:
+            health = self.health(provider)
+            if health.breaker.allow():
+                yield provider
+            else:
+                with health._lock:
+                    health.skipped += 1
+
+    def call(self, provider, kind, function, *args):
+        """Run function(*args) for `provider`, recording its latency or failure."""
+        start = time.monotonic()
+        try:
+            result = function(*args)
+        except ProviderError:
+            self.record_failure(provider)
+            raise
+        self.health(provider).observe(kind, time.monotonic() - start)
+        self.health(provider).breaker.record_success()
+        return result
+
+    def record_failure(self, provider):
+        health = self.health(provider)
+        health.fail()
+        health.breaker.record_failure()
+
+    def retry_in(self, providers):
+        """Seconds until any of `providers` may be tried again."""
+        return min((self.health(p).breaker.retry_in() for p in providers), default=0.0)
+
+    def status(self, providers):
+        report = []
+        for provider in providers:
+            health = self.health(provider)
+            with health._lock:
+                latency = {kind: round(seconds * 1000) for kind, seconds in health.latency.items()}
+                counts = {'calls': health.calls, 'failures': health.failures, 'skipped': health.skipped}
+            report.append({
+                'name': provider.name,
+                'model': provider.model,
+                **health.breaker.snapshot(),
+                'retry_in': round(health.breaker.retry_in(), 1),
+                'latency_ms': latency,
+                **counts,
+            })
+        return report
+
+
+router = ProviderRouter(
+    window=getattr(settings, 'CHAT_BREAKER_WINDOW', 20),
+    min_calls=getattr(settings, 'CHAT_BREAKER_MIN_CALLS', 5),
+    failure_rate=getattr(settings, 'CHAT_BREAKER_FAILURE_RATE', 0.5),
+    cooldown=getattr(settings, 'CHAT_BREAKER_COOLDOWN', 30.0),
+    alpha=getattr(settings, 'CHAT_LATENCY_EWMA_ALPHA', 0.3),
+)
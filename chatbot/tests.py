@@ -1,3 +1,773 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+import requests
+from unittest import mock
+
+from django.conf import settings
+from django.test import Client, SimpleTestCase, override_settings
+
+from core.tests import run_concurrently, wait_until
+
+from . import tts, views
+from .http_client import HttpClient
+from .response_cache import (
+    DjangoCacheBackend, MemoryBackend, ResponseCache, cache_key, is_personalized, normalize_message, response_cache
+)
+from .providers import ProviderError
+from .routing import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ProviderRouter, router
+
+# FakeProvider is a local stand-in for an OpenAI-compatible chat-completion
+# provider. It answers GETs and POSTs on any path with canned chunks: a JSON
+# completion, or Server-Sent Events when the body asks for `stream: true`.
+# It speaks HTTP/1.1 keep-alive and counts the connections and requests it
+# gets. Knobs make it misbehave the way real providers do:
+# - `latency`: seconds before the first byte;
+# - `chunk_delay`: seconds between streamed chunks;
+# - `status`: answer every request with this error status;
+# - `failures`: answer the next N requests with 503;
+# - `break_after`: drop the connection after N streamed chunks;
+# - a path ending in /hang never answers within a sane read timeout.
+# The tests below and the benchmark commands start one in a thread;
+# `manage.py run_fake_provider` runs one on a fixed port for manual testing.
+
+CANNED_CHUNKS = [
+    'Normal blood pressure ',
+    'for most adults ',
+    'is below 120/80 mmHg. ',
+    'I am an AI and not a substitute ',
+    'for professional medical advice.',
+]
+
+
+class FakeProvider(ThreadingHTTPServer):
+    daemon_threads = True
+    # socketserver's default backlog of 5 resets connections from concurrent benchmarks.
+    request_queue_size = 128
+
+    def __init__(self, port=0, chunks=CANNED_CHUNKS, latency=0.0, chunk_delay=0.0, status=200,
+                 failures=0, break_after=None):
+        self.chunks = list(chunks)
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.status = status
+        self.failures = failures
+        self.break_after = break_after
+        self.connections = 0
+        self.requests = 0
+        self.counter_lock = threading.Lock()  # Handlers run in one thread per connection.
+        super().__init__(('127.0.0.1', port), FakeProviderHandler)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/v1/chat/completions'
+
+    def process_request(self, request, client_address):
+        with self.counter_lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='fake-provider', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        with server.counter_lock:
+            server.requests += 1
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError:
+            body = {}
+        if self.path.endswith('/hang'):
+            time.sleep(5)
+        time.sleep(server.latency)
+        if server.failures:
+            server.failures -= 1
+            self._reply_json(503, {'error': {'message': 'overloaded'}})
+            return
+        if server.status != 200:
+            self._reply_json(server.status, {'error': {'message': f'fake status {server.status}'}})
+            return
+        if body.get('stream'):
+            self._stream(server)
+        else:
+            # A blocking completion arrives only once the whole answer is generated.
+            time.sleep(server.chunk_delay * (len(server.chunks) - 1))
+            self._reply_json(200, {'choices': [{'message': {'role': 'assistant', 'content': ''.join(server.chunks)}}]})
+
+    do_GET = do_POST
+
+    def _stream(self, server):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i, text in enumerate(server.chunks):
+            if server.break_after is not None and i >= server.break_after:
+                self.close_connection = True
+                self.connection.shutdown(2)
+                return
+            if i:
+                time.sleep(server.chunk_delay)
+            self._write_chunk(f"data: {json.dumps({'choices': [{'delta': {'content': text}}]})}\n\n")
+        self._write_chunk('data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+    def _reply_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def parse_sse(body):
+    """[(event, data)] for each event in an SSE body; event is None for plain messages."""
+    assert body.endswith('\n\n'), f'Unterminated SSE event: {body[-40:]!r}'
+    events = []
+    for block in body[:-2].split('\n\n'):
+        event = data = None
+        for line in block.split('\n'):
+            field, _, value = line.partition(': ')
+            if field == 'event':
+                event = value
+            elif field == 'data':
+                data = json.loads(value)
+            else:
+                raise AssertionError(f'Unexpected SSE line: {line!r}')
+        events.append((event, data))
+    return events
+
+
+class FakeProviderTestCase(SimpleTestCase):
+    """Points Groq and OpenRouter at two local FakeProviders with fresh routing state."""
+
+    def setUp(self):
+        self.groq = FakeProvider().start()
+        self.openrouter = FakeProvider().start()
+        self.addCleanup(self.groq.stop)
+        self.addCleanup(self.openrouter.stop)
+        overrides = override_settings(
+            GROQ_API_KEY='fake', GROQ_API_URL=self.groq.url,
+            OPENAI_API_KEY='fake', OPENROUTER_API_URL=self.openrouter.url,
+            RATE_LIMIT_ENABLED=False,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        enabled, response_cache.enabled = response_cache.enabled, False
+        self.addCleanup(setattr, response_cache, 'enabled', enabled)
+        router._health.clear()
+        self.addCleanup(router._health.clear)
+
+
+class HttpClientTests(SimpleTestCase):
+    payload = {'model': 'test', 'messages': [{'role': 'user', 'content': 'hi'}]}
+
+    def setUp(self):
+        self.server = FakeProvider().start()
+        self.addCleanup(self.server.stop)
+        self.http = HttpClient(read_timeout=0.5, retries=2)
+        self.addCleanup(self.http.close)
+
+    def test_reuses_one_keep_alive_connection(self):
+        for _ in range(20):
+            self.assertEqual(self.http.post(self.server.url, json=self.payload).status_code, 200)
+        self.assertEqual(self.server.requests, 20)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_read_timeout_raises(self):
+        start = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            self.http.post(f'{self.server.url}/hang', json=self.payload)
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_post_answered_503_is_not_retried(self):
+        # The provider may already have run (and billed) the completion.
+        self.server.failures = 2
+        response = self.http.post(self.server.url, json=self.payload)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_get_answered_503_is_retried(self):
+        self.server.failures = 2
+        self.assertEqual(self.http.get(self.server.url).status_code, 200)
+        self.assertEqual(self.server.requests, 3)
+
+
+class ChatStreamTests(FakeProviderTestCase):
+    async def stream(self, message='What is normal blood pressure?'):
+        response = await self.async_client.post('/chatbot/api/stream/', json.dumps({'message': message}),
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+        return parse_sse(b''.join([chunk async for chunk in response.streaming_content]).decode())
+
+    async def test_relays_each_chunk_then_done(self):
+        events = await self.stream()
+        self.assertEqual(events[:-1], [(None, {'delta': chunk}) for chunk in CANNED_CHUNKS])
+        self.assertEqual(events[-1], ('done', {'provider': 'groq', 'model': settings.GROQ_MODEL}))
+
+    async def test_falls_back_before_the_first_token(self):
+        self.groq.status = 500
+        with self.assertLogs('chatbot.views', 'WARNING'):
+            events = await self.stream()
+        self.assertEqual(''.join(data['delta'] for event, data in events if event is None), ''.join(CANNED_CHUNKS))
+        self.assertEqual(events[-1][0], 'done')
+        self.assertEqual(events[-1][1]['provider'], 'openrouter')
+
+    async def test_broken_stream_ends_with_an_error_event(self):
+        self.groq.break_after = 2
+        with self.assertLogs('chatbot.views', 'WARNING'):
+            events = await self.stream()
+        self.assertEqual(events[:2], [(None, {'delta': chunk}) for chunk in CANNED_CHUNKS[:2]])
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[2][0], 'error')
+        self.assertEqual(self.openrouter.requests, 0)
+
+    async def test_errors_before_streaming_are_json(self):
+        self.groq.status = self.openrouter.status = 500
+        with self.assertLogs('chatbot.views', 'WARNING'):
+            response = await self.async_client.post('/chatbot/api/stream/', json.dumps({'message': 'Hello there'}),
+                                                    content_type='application/json')
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('error', response.json())
+
+
+class ChatCoalescingTests(FakeProviderTestCase):
+    callers = 10
+
+    def ask(self, messages):
+        def post(i):
+            response = Client().post('/chatbot/api/', json.dumps({'message': messages(i)}),
+                                     content_type='application/json')
+            return response.status_code, response.json()
+        return run_concurrently(self.callers, post)
+
+    def test_same_question_goes_upstream_once(self):
+        ask_providers, coalesced = views.ask_providers, views.chat_flight.coalesced
+
+        def leader(*args):
+            # Hold the upstream call until every other request has joined it.
+            wait_until(lambda: views.chat_flight.coalesced - coalesced == self.callers - 1)
+            return ask_providers(*args)
+
+        with mock.patch.object(views, 'ask_providers', leader):
+            replies = self.ask(lambda i: 'What is normal blood pressure?')
+        self.assertEqual(replies, [(200, {'response': ''.join(CANNED_CHUNKS)})] * self.callers)
+        self.assertEqual(self.groq.requests + self.openrouter.requests, 1)
+
+    def test_personalized_questions_are_not_shared(self):
+        replies = self.ask(lambda i: f'My blood pressure is {120 + i}/80, is that normal?')
+        self.assertEqual([status for status, _ in replies], [200] * self.callers)
+        # The router spreads these over both providers while it measures their latency.
+        self.assertEqual(self.groq.requests + self.openrouter.requests, self.callers)
+
+
+class ResponseCacheTests(SimpleTestCase):
+    model = 'model-a'
+    prompt = 'system prompt'
+    question = 'What is normal blood pressure?'
+
+    def test_equivalent_questions_share_a_key(self):
+        key = cache_key(self.model, self.prompt, self.question)
+        for variant in ('what is normal blood pressure', '  WHAT is   normal\tblood pressure ?!', 'What is normal blood pressure.',
+                        '\uff37hat is normal blood pressure?'):
+            with self.subTest(variant):
+                self.assertEqual(cache_key(self.model, self.prompt, variant), key)
+        self.assertEqual(normalize_message(' Hello,\n World?? '), 'hello, world')
+        for other in (cache_key('model-b', self.prompt, self.question), cache_key(self.model, 'other', self.question),
+                      cache_key(self.model, self.prompt, 'What is low blood pressure?')):
+            self.assertNotEqual(other, key)
+
+    def test_personalized_messages(self):
+        for message in ('My blood pressure is high', 'I have a headache', "I'm taking metformin", 'i am dizzy',
+                        "I've been coughing", 'Is 140/90 high?', 'email me at someone@example.com',
+                        'call me on 555 1234', 'Does it run in our family?', 'What should I take for MY cold'):
+            with self.subTest(message):
+                self.assertTrue(is_personalized(message))
+        for message in (self.question, 'What causes migraines?', 'Is myopia hereditary?', 'Tell me about iodine',
+                        'How much water should adults drink?'):
+            with self.subTest(message):
+                self.assertFalse(is_personalized(message))
+
+    def test_personalized_answers_are_never_stored_or_served(self):
+        cache = ResponseCache(MemoryBackend())
+        personal = 'My blood pressure is 150/95, is that high?'
+        cache.set(self.model, self.prompt, personal, 'You should see a doctor.')
+        self.assertEqual(cache.backend.counts()['entries'], 0)
+        # Even an entry stored under its key is never read back for it.
+        cache.backend.set(cache_key(self.model, self.prompt, personal), 'Leaked answer')
+        self.assertIsNone(cache.get([self.model], self.prompt, personal))
+        self.assertEqual(cache.stats()['bypassed'], 1)
+
+    def test_long_messages_and_a_disabled_cache_bypass(self):
+        for cache, message in ((ResponseCache(MemoryBackend()), 'why ' * 100),
+                               (ResponseCache(MemoryBackend(), enabled=False), self.question)):
+            cache.set(self.model, self.prompt, message, 'answer')
+            self.assertIsNone(cache.get([self.model], self.prompt, message))
+            self.assertEqual(cache.stats()['entries'], 0)
+            self.assertEqual(cache.stats()['bypassed'], 1)
+
+    def test_hits_come_from_any_listed_model(self):
+        cache = ResponseCache(MemoryBackend())
+        self.assertIsNone(cache.get(['model-a', 'model-b'], self.prompt, self.question))
+        cache.set('model-b', self.prompt, self.question, 'Below 120/80.')
+        self.assertEqual(cache.get(['model-a', 'model-b'], self.prompt, 'what is normal blood pressure'), 'Below 120/80.')
+        self.assertIsNone(cache.get(['model-a'], self.prompt, self.question))
+        cache.set('model-a', self.prompt, self.question, '')  # Empty answers are not kept.
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'bypassed': 0, 'entries': 1,
+                                         'hit_ratio': 0.3333, 'backend': 'memory'})
+
+    def test_entries_expire_after_the_ttl(self):
+        backend = MemoryBackend(ttl=60)
+        with mock.patch('chatbot.response_cache.time.monotonic', return_value=1000.0):
+            backend.set('k', 'v')
+        with mock.patch('chatbot.response_cache.time.monotonic', return_value=1059.0):
+            self.assertEqual(backend.get('k'), 'v')
+        with mock.patch('chatbot.response_cache.time.monotonic', return_value=1060.0):
+            self.assertIsNone(backend.get('k'))
+        self.assertEqual(backend.counts()['entries'], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        backend = MemoryBackend(maxsize=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)
+        self.assertEqual((backend.get('a'), backend.get('b'), backend.get('c')), (1, None, 3))
+        backend.set('a', 4)  # Overwriting does not grow the cache.
+        self.assertEqual((backend.get('a'), backend.counts()['entries']), (4, 2))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                           'LOCATION': 'chat-cache-tests'}})
+    def test_django_cache_backend_is_shared(self):
+        first, second = ResponseCache(DjangoCacheBackend()), ResponseCache(DjangoCacheBackend())
+        first.backend.cache.clear()
+        self.addCleanup(first.backend.cache.clear)
+        first.set(self.model, self.prompt, self.question, 'Below 120/80.')
+        self.assertEqual(second.get([self.model], self.prompt, self.question), 'Below 120/80.')
+        self.assertIsNone(second.get([self.model], self.prompt, 'My pressure is 150/95'))
+        self.assertEqual(first.stats(), {'hits': 1, 'misses': 0, 'bypassed': 1, 'hit_ratio': 1.0, 'backend': 'cache'})
+
+
+class ChatResponseCacheTests(FakeProviderTestCase):
+    def setUp(self):
+        super().setUp()
+        response_cache.enabled = True
+        patcher = mock.patch.object(response_cache, 'backend', MemoryBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ask(self, message):
+        response = Client().post('/chatbot/api/', json.dumps({'message': message}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response['X-Cache'], response.json()['response']
+
+    def upstream_requests(self):
+        return self.groq.requests + self.openrouter.requests
+
+    def test_repeated_general_question_is_served_from_the_cache(self):
+        answer = ''.join(CANNED_CHUNKS)
+        self.assertEqual(self.ask('What is normal blood pressure?'), ('MISS', answer))
+        self.assertEqual(self.ask('  what is NORMAL blood pressure'), ('HIT', answer))
+        self.assertEqual(self.upstream_requests(), 1)
+
+    def test_personalized_question_is_never_cached_or_shared(self):
+        message = 'My blood pressure is 150/95, is that high?'
+        self.assertEqual(self.ask(message)[0], 'BYPASS')
+        self.assertEqual(self.ask(message)[0], 'BYPASS')
+        self.assertEqual(self.upstream_requests(), 2)
+        self.assertEqual(response_cache.stats()['entries'], 0)
+
+    async def test_streamed_answers_follow_the_same_rules(self):
+        async def stream(message):
+            response = await self.async_client.post('/chatbot/api/stream/', json.dumps({'message': message}),
+                                                    content_type='application/json')
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+            text = ''.join(data['delta'] for event, data in parse_sse(body) if event is None)
+            return response['X-Cache'], text
+
+        answer = ''.join(CANNED_CHUNKS)
+        self.assertEqual(await stream('I have a headache, what should I take?'), ('BYPASS', answer))
+        self.assertEqual(await stream('What is normal blood pressure?'), ('MISS', answer))
+        self.assertEqual(await stream('what is normal blood pressure'), ('HIT', answer))
+        self.assertEqual(self.upstream_requests(), 2)
+        self.assertEqual(response_cache.stats()['entries'], 1)
+
+
+class FakeClock:
+    """Stands in for the time module in chatbot.routing."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class RoutingTestCase(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        for patcher in (mock.patch('chatbot.routing.time', self.clock), mock.patch('chatbot.routing.logger')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class CircuitBreakerTests(RoutingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.breaker = CircuitBreaker('test', window=6, min_calls=4, failure_rate=0.5, cooldown=30.0)
+
+    def trip(self):
+        for _ in range(4):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_opens_at_the_failure_rate_once_enough_calls_were_made(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CLOSED)  # Under min_calls.
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)  # 3 of 4 failed, but this was a success.
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.snapshot(), {'state': OPEN, 'window_calls': 5, 'window_failures': 4,
+                                                   'failure_rate': 0.8})
+
+    def test_stays_closed_below_the_failure_rate(self):
+        for _ in range(10):
+            self.breaker.record_success()
+            self.breaker.record_failure()
+            self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_old_results_leave_the_window(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        for _ in range(6):
+            self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.snapshot()['window_failures'], 1)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_open_breaker_refuses_until_the_cooldown_ends(self):
+        self.trip()
+        self.assertFalse(self.breaker.allow())
+        self.clock.advance(20)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.retry_in(), 10)
+        self.clock.advance(10)
+        self.assertEqual(self.breaker.retry_in(), 0)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+
+    def test_successful_probe_closes_the_breaker(self):
+        self.trip()
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.snapshot()['window_failures'], 0)
+        self.assertTrue(self.breaker.allow())
+        # The old failures are forgotten: reopening needs min_calls fresh results.
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_failed_probe_reopens_for_another_cooldown(self):
+        self.trip()
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.retry_in(), 30)
+        self.clock.advance(29)
+        self.assertFalse(self.breaker.allow())
+        self.clock.advance(1)
+        self.assertTrue(self.breaker.allow())
+
+    def test_half_open_lets_one_probe_through(self):
+        self.trip()
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual([self.breaker.allow() for _ in range(5)], [False] * 5)
+        # A probe that never reports back is replaced after a cooldown.
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+    def test_one_probe_among_concurrent_callers(self):
+        self.trip()
+        self.clock.advance(30)
+        results = run_concurrently(16, lambda i: self.breaker.allow())
+        self.assertEqual(results.count(True), 1)
+
+
+class ProviderRouterTests(RoutingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.router = ProviderRouter(window=4, min_calls=2, failure_rate=0.5, cooldown=30.0, alpha=0.5)
+        self.fast, self.slow, self.new = (
+            mock.Mock(model=f'{name}-model') for name in ('fast', 'slow', 'new')
+        )
+        for provider, name in ((self.fast, 'fast'), (self.slow, 'slow'), (self.new, 'new')):
+            provider.name = name
+
+    def timed(self, provider, seconds, kind='complete'):
+        def answer():
+            self.clock.advance(seconds)
+            return 'ok'
+        return self.router.call(provider, kind, answer)
+
+    def names(self, providers, kind='complete'):
+        return [provider.name for provider in self.router.route(providers, kind)]
+
+    def test_latency_is_an_exponentially_weighted_average(self):
+        self.assertEqual(self.timed(self.fast, 1.0), 'ok')
+        self.timed(self.fast, 3.0)
+        self.timed(self.fast, 1.0)
+        self.assertEqual(self.router.health(self.fast).latency, {'complete': 1.5})
+        self.timed(self.fast, 0.25, kind='stream')
+        self.assertEqual(self.router.health(self.fast).latency, {'complete': 1.5, 'stream': 0.25})
+
+    def test_fastest_first_and_unmeasured_before_both(self):
+        self.assertEqual(self.names([self.slow, self.fast]), ['slow', 'fast'])  # Ties keep the configured order.
+        self.timed(self.slow, 2.0)
+        self.timed(self.fast, 0.5)
+        self.assertEqual(self.names([self.slow, self.fast]), ['fast', 'slow'])
+        self.assertEqual(self.names([self.slow, self.fast, self.new]), ['new', 'fast', 'slow'])
+        # Each kind is ranked on its own samples.
+        self.timed(self.slow, 0.1, kind='stream')
+        self.timed(self.fast, 0.3, kind='stream')
+        self.assertEqual(self.names([self.fast, self.slow], kind='stream'), ['slow', 'fast'])
+
+    def test_ranking_follows_a_slowdown(self):
+        self.timed(self.fast, 0.5)
+        self.timed(self.slow, 1.0)
+        for _ in range(3):
+            self.timed(self.fast, 4.0)
+        self.assertEqual(self.names([self.fast, self.slow]), ['slow', 'fast'])
+
+    def test_open_breaker_is_skipped(self):
+        failing = mock.Mock(side_effect=ProviderError('down'))
+        for _ in range(2):
+            with self.assertRaises(ProviderError):
+                self.router.call(self.fast, 'complete', failing)
+        self.assertEqual(self.names([self.fast, self.slow]), ['slow'])
+        report = {row['name']: row for row in self.router.status([self.fast, self.slow])}
+        self.assertEqual((report['fast']['state'], report['fast']['skipped'], report['fast']['failures']), (OPEN, 1, 2))
+        self.assertEqual(report['fast']['retry_in'], 30.0)
+        self.assertEqual(self.router.retry_in([self.fast]), 30.0)
+        self.assertEqual(self.router.retry_in([self.fast, self.slow]), 0.0)
+
+    def test_probe_is_only_granted_to_a_provider_that_is_called(self):
+        failing = mock.Mock(side_effect=ProviderError('down'))
+        for provider in (self.fast, self.slow):
+            for _ in range(2):
+                with self.assertRaises(ProviderError):
+                    self.router.call(provider, 'complete', failing)
+        self.clock.advance(30)
+        route = self.router.route([self.fast, self.slow], 'complete')
+        self.assertIs(next(route), self.fast)
+        route.close()  # The first provider answered; the second was never asked.
+        self.assertEqual(self.router.health(self.slow).breaker.state, OPEN)
+        self.assertEqual(self.names([self.fast, self.slow]), ['slow'])
+
+
+def make_wav(frames, framerate=22050, channels=1, sampwidth=2):
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as writer:
+        writer.setnchannels(channels)
+        writer.setsampwidth(sampwidth)
+        writer.setframerate(framerate)
+        writer.writeframes(frames)
+    return output.getvalue()
+
+
+class SplitTextTests(SimpleTestCase):
+    def test_sentences_are_packed_up_to_the_limit(self):
+        text = 'One two.  Three four!\nFive six?   Seven.'
+        self.assertEqual(tts.split_text(text, max_chars=20), ['One two. Three four!', 'Five six? Seven.'])
+        self.assertEqual(tts.split_text(text, max_chars=1000), ['One two. Three four! Five six? Seven.'])
+        self.assertEqual(tts.split_text('  \n '), [])
+
+    def test_devanagari_danda_ends_a_sentence(self):
+        text = '\u0928\u092e\u0938\u094d\u0924\u0947\u0964 \u0906\u092a \u0915\u0948\u0938\u0947 \u0939\u0948\u0902? \u0920\u0940\u0915 \u0939\u0948\u0964'
+        chunks = tts.split_text(text, max_chars=12)
+        self.assertEqual(chunks, ['\u0928\u092e\u0938\u094d\u0924\u0947\u0964', '\u0906\u092a \u0915\u0948\u0938\u0947 \u0939\u0948\u0902?', '\u0920\u0940\u0915 \u0939\u0948\u0964'])
+        # A danda inside a word (no space after it) is not a break.
+        self.assertEqual(tts.split_text('\u0915\u0964\u0916 \u0917', max_chars=3), ['\u0915\u0964\u0916', '\u0917'])
+
+    def test_long_sentence_breaks_at_clauses_then_words_then_anywhere(self):
+        sentence = 'first clause here, second clause here; third one'
+        chunks = tts.split_text(f'Short. {sentence}.', max_chars=20)
+        self.assertEqual(chunks, ['Short.', 'first clause here,', 'second clause here;', 'third one.'])
+
+        words = 'alpha beta gamma delta epsilon zeta'
+        self.assertEqual(tts.split_text(words, max_chars=12), ['alpha beta', 'gamma delta', 'epsilon zeta'])
+        self.assertEqual(tts.split_text('x' * 25, max_chars=10), ['x' * 10, 'x' * 10, 'x' * 5])
+
+    def test_chunks_never_exceed_the_limit(self):
+        text = ' '.join(f'Sentence {i}, with a clause; and {"word " * (i % 7)}end{"!" if i % 2 else "."}' for i in range(60))
+        text += ' ' + 'y' * 95
+        for max_chars in (15, 40, 450):
+            with self.subTest(max_chars=max_chars):
+                chunks = tts.split_text(text, max_chars)
+                self.assertTrue(all(0 < len(chunk) <= max_chars for chunk in chunks))
+                self.assertEqual(''.join(''.join(chunks).split()), ''.join(text.split()))
+
+    def test_truncate_keeps_whole_chunks(self):
+        self.assertEqual(tts.truncate_chunks(['aaaa', 'bbbb', 'cccc'], max_chars=9), ['aaaa', 'bbbb'])
+        self.assertEqual(tts.truncate_chunks(['a' * 20], max_chars=9), ['a' * 20])  # Always at least one.
+
+
+class ConcatWavsTests(SimpleTestCase):
+    def test_frames_are_joined(self):
+        joined = tts.concat_wavs([make_wav(b'\x01\x00' * 10), make_wav(b'\x02\x00' * 5)])
+        with wave.open(io.BytesIO(joined), 'rb') as reader:
+            self.assertEqual((reader.getframerate(), reader.getnframes()), (22050, 15))
+            self.assertEqual(reader.readframes(15), b'\x01\x00' * 10 + b'\x02\x00' * 5)
+
+    def test_single_part_is_returned_as_is(self):
+        part = make_wav(b'\x00\x00')
+        self.assertIs(tts.concat_wavs([part]), part)
+
+    def test_format_mismatch_is_refused(self):
+        for other in (make_wav(b'\x00\x00', framerate=16000), make_wav(b'\x00\x00\x00\x00', channels=2),
+                      make_wav(b'\x00', sampwidth=1)):
+            with self.subTest(other=other[:44]), self.assertRaises(tts.TtsError):
+                tts.concat_wavs([make_wav(b'\x00\x00'), other])
+
+
+class AudioCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = tts.AudioCache(directory.name, max_bytes=1000)
+
+    def put(self, key, size, age):
+        path = self.cache.put(key, b'x' * size)
+        then = time.time() - age
+        os.utime(path, (then, then))
+        return path
+
+    def test_least_recently_used_files_are_evicted(self):
+        self.put('a' * 64, 300, age=40)
+        self.put('b' * 64, 300, age=30)
+        self.put('c' * 64, 300, age=20)
+        self.cache.get('a' * 64)  # A hit makes it the most recent.
+        self.cache.put('d' * 64, b'x' * 300)
+        self.assertIsNone(self.cache.get('b' * 64))
+        for key in ('a', 'c', 'd'):
+            self.assertIsNotNone(self.cache.get(key * 64), key)
+        self.assertLessEqual(self.cache._scan_size(), 1000 * tts.EVICT_TO)
+
+    def test_file_larger_than_the_cache_survives_its_own_write(self):
+        self.put('a' * 64, 300, age=10)
+        path = self.cache.put('b' * 64, b'y' * 2000)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'y' * 2000)
+        self.assertIsNone(self.cache.get('a' * 64))
+        # The next write is free to evict it.
+        os.utime(path, (time.time() - 5, time.time() - 5))
+        self.cache.put('c' * 64, b'z' * 10)
+        self.assertIsNone(self.cache.get('b' * 64))
+        self.assertEqual(self.cache.read('c' * 64), b'z' * 10)
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get('e' * 64))
+        self.assertIsNone(self.cache.read('e' * 64))
+
+
+@override_settings(SARVAM_API_KEY='fake', RATE_LIMIT_ENABLED=False)
+class TtsApiTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.audio = make_wav(b'\x01\x00' * 100)
+        for patcher in (
+            mock.patch.object(tts, 'audio_cache', tts.AudioCache(directory.name, max_bytes=len(self.audio) // 2)),
+            mock.patch.object(tts.http_client, 'post', return_value=mock.Mock(
+                status_code=200, json=mock.Mock(return_value={'audios': [base64.b64encode(self.audio).decode()]}),
+            )),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def speak(self, **extra):
+        return self.client.post('/chatbot/api/tts/', json.dumps({'text': 'Hello there.', **extra}),
+                                content_type='application/json')
+
+    @override_settings(TTS_CACHE_SHARED=True)
+    def test_audio_larger_than_the_cache_is_still_returned(self):
+        response = self.speak()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(base64.b64decode(response.json()['audio']), self.audio)
+        wav = self.speak(format='wav')
+        self.assertEqual(b''.join(wav.streaming_content), self.audio)
+        self.assertEqual(wav['Content-Location'], response.json()['audio_url'])
+
+        ranged = self.client.get(response.json()['audio_url'], HTTP_RANGE='bytes=0-3')
+        self.assertEqual(ranged.status_code, 206)
+        self.assertEqual(b''.join(ranged.streaming_content), b'RIFF')
+
+    @override_settings(TTS_CACHE_SHARED=False)
+    def test_unshared_cache_returns_the_audio_inline_only(self):
+        response = self.speak()
+        self.assertEqual(base64.b64decode(response.json()['audio']), self.audio)
+        self.assertIsNone(response.json()['audio_url'])
+        wav = self.speak(format='wav')
+        self.assertEqual(b''.join(wav.streaming_content), self.audio)
+        self.assertNotIn('Content-Location', wav)
+
+    def test_file_evicted_before_it_is_read_is_synthesized_again(self):
+        synthesize = tts.synthesize
+        calls = []
+
+        def evicted_first(text, api_key):
+            key, path = synthesize(text, api_key)
+            calls.append(key)
+            if len(calls) == 1:
+                os.unlink(path)
+            return key, path
+
+        with mock.patch.object(tts, 'synthesize', evicted_first):
+            for fmt in ('json', 'wav'):
+                calls.clear()
+                with self.subTest(fmt):
+                    response = self.speak(format=fmt)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(calls), 2)
@@ -0,0 +1,289 @@
+"""
+Text-to-speech through Sarvam, with an on-disk audio cache.
+
+synthesize() returns the key and path of a WAV file for (text, voice). The
+text is split at sentence boundaries into chunks of at most TTS_CHUNK_CHARS
+(Sarvam accepts up to 500 characters per input). Chunks are synthesized
+concurrently, up to TTS_CONCURRENCY at a time, and joined into one WAV.
+
+The cache is content-addressed. A file's name is the SHA-256 of the text
+and every voice parameter, so identical requests, and sentences repeated
+across answers such as the medical disclaimer, are synthesized once. Both
+the whole audio and each chunk are cached under TTS_CACHE_DIR. Once the
+directory grows past TTS_CACHE_MAX_BYTES, the least recently used files
+are deleted, since a hit refreshes the file's mtime. The file just written
+is never evicted by its own write, even when it alone exceeds the limit.
+Files are written to a temporary name and renamed into place, so concurrent
+workers never see a partial file.
+
+The cache is local to the machine unless TTS_CACHE_DIR is shared storage.
+On serverless hosts each instance has its own /tmp, so a later request for a
+cached file's URL can land on an instance that doesn't have it. Set
+TTS_CACHE_SHARED to False there and chatbot.views.tts_api returns the audio
+inline without a URL.
+"""
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+CHUNK_CHARS = getattr(settings, 'TTS_CHUNK_CHARS', 450)
+MAX_CHARS = getattr(settings, 'TTS_MAX_CHARS', 3000)
+CONCURRENCY = getattr(settings, 'TTS_CONCURRENCY', 4)
+# Eviction trims the cache to this fraction of its limit, so it doesn't run on every write.
+EVICT_TO = 0.9
+
+DEFAULT_VOICE = {
+    "target_language_code": "hi-IN",
+    "speaker": "priya",  # Valid speakers for hi-IN include anushka, priya
+    "pitch": 0,
+    "pace": 1.0,
+    "loudness": 1.5,
+    "speech_sample_rate": 22050,
+    "enable_preprocessing": True,
+}
+
+# Sentence ends: Latin punctuation, or the Devanagari danda, followed by whitespace.
+SENTENCE_END_RE = re.compile(r'(?<=[.!?।])\s+')
+CLAUSE_END_RE = re.compile(r'(?<=[,;:])\s+')
+
+
+class TtsError(Exception):
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+
+def _split_long(piece, max_chars):
+    """Split one over-long sentence at clause breaks, then spaces, then anywhere."""
+    for pattern in (CLAUSE_END_RE, re.compile(r'\s+')):
+        parts = pattern.split(piece)
+        if len(parts) > 1:
+            return _pack(parts, max_chars)
+    return [piece[i:i + max_chars] for i in range(0, len(piece), max_chars)]
+
+
+def _pack(pieces, max_chars):
+    chunks = []
+    current = ''
+    for piece in pieces:
+        if len(piece) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.extend(_split_long(piece, max_chars))
+        elif not current:
+            current = piece
+        elif len(current) + 1 + len(piece) <= max_chars:
+            current = f'{current} {piece}'
+        else:
+            chunks.append(current)
+            current = piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_text(text, max_chars=CHUNK_CHARS):
+    """Chunks of at most `max_chars`, broken at sentence boundaries where possible."""
+    return _pack([s for s in SENTENCE_END_RE.split(' '.join(text.split())) if s], max_chars)
+
+
+def truncate_chunks(chunks, max_chars=MAX_CHARS):
+    """Whole chunks from the start, up to about `max_chars` characters in total."""
+    kept = []
+    total = 0
+    for chunk in chunks:
+        if kept and total + len(chunk) > max_chars:
+            break
+        kept.append(chunk)
+        total += len(chunk)
+    return kept
+
+
+def audio_key(text, voice):
+    return hashlib.sha256(json.dumps({'text': text, **voice}, sort_keys=True).encode()).hexdigest()
+
+
+def concat_wavs(parts):
+    """Join WAV files with identical formats into one."""
+    if len(parts) == 1:
+        return parts[0]
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as writer:
+        params = None
+        for part in parts:
+            with wave.open(io.BytesIO(part), 'rb') as reader:
+                if params is None:
+                    params = reader.getparams()
+                    writer.setnchannels(params.nchannels)
+                    writer.setsampwidth(params.sampwidth)
+                    writer.setframerate(params.framerate)
+                elif (reader.getnchannels(), reader.getsampwidth(), reader.getframerate()) != (
+                    params.nchannels, params.sampwidth, params.framerate
+                ):
+                    raise TtsError('TTS chunks came back in different audio formats')
+                writer.writeframes(reader.readframes(reader.getnframes()))
+    return output.getvalue()
+
+
+class AudioCache:
+    """Size-bounded, content-addressed WAV files; see the module docstring."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None  # Estimated; recomputed by each eviction scan.
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.wav')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            os.utime(path)  # Mark as recently used.
+        except FileNotFoundError:
+            return None
+        return path
+
+    def read(self, key):
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None  # Evicted in between.
+
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            over = self._size > self.max_bytes
+        if over:
+            self.evict(keep=path)
+        return path
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.wav'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._files())
+
+    def evict(self, keep=None):
+        """
+        Delete least recently used files until the cache is under EVICT_TO of
+        its limit. `keep` (a path) is spared, so a caller can still serve it.
+        """
+        with self._lock:
+            files = sorted(self._files())
+            total = sum(size for _, size, _ in files)
+            target = self.max_bytes * EVICT_TO
+            for _, size, path in files:
+                if total <= target:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._size = total
+
+
+def default_cache_dir():
+    return getattr(settings, 'TTS_CACHE_DIR', None) or os.path.join(tempfile.gettempdir(), 'healthtrack-tts-cache')
+
+
+audio_cache = AudioCache(default_cache_dir(), getattr(settings, 'TTS_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+
+
+def synthesize_chunk(text, voice, api_key):
+    """WAV bytes for one chunk, from the cache or from Sarvam."""
+    key = audio_key(text, voice)
+    cached = audio_cache.read(key)
+    if cached is not None:
+        return cached
+    try:
+        response = http_client.post(
+            settings.SARVAM_TTS_URL,
+            json={"inputs": [text], **voice},
+            headers={"Content-Type": "application/json", "api-subscription-key": api_key},
+        )
+    except Exception as e:
+        raise TtsError(f'TTS request failed: {e}') from e
+    if response.status_code != 200:
+        logger.error(f"Sarvam API error: {response.status_code} - {response.text}")
+        raise TtsError(f'TTS service error: {response.status_code}')
+    result = response.json()
+    if not result.get("audios"):
+        logger.error(f"Sarvam API returned unexpected format: {result}")
+        raise TtsError('Invalid response from TTS service')
+    audio = base64.b64decode(result["audios"][0])
+    audio_cache.put(key, audio)
+    return audio
+
+
+def synthesize(text, api_key, voice=DEFAULT_VOICE):
+    """
+    Synthesize `text` (up to TTS_MAX_CHARS, cut at a chunk boundary).
+    Returns (key, path) of the cached WAV file.
+    """
+    chunks = truncate_chunks(split_text(text))
+    if not chunks:
+        raise TtsError('No text provided', status=400)
+    key = audio_key(' '.join(chunks), voice)
+    path = audio_cache.get(key)
+    if path is not None:
+        return key, path
+
+    start = time.monotonic()
+    if len(chunks) == 1:
+        parts = [synthesize_chunk(chunks[0], voice, api_key)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(CONCURRENCY, len(chunks))) as pool:
+            parts = list(pool.map(lambda chunk: synthesize_chunk(chunk, voice, api_key), chunks))
+    try:
+        audio = concat_wavs(parts)
+    except (wave.Error, EOFError) as e:
+        raise TtsError(f'TTS service returned unreadable audio: {e}') from e
+    logger.info('Synthesized %d chunk(s) in %.2fs', len(chunks), time.monotonic() - start)
+    return key, audio_cache.put(key, audio)
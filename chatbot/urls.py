@@ -1,7 +1,11 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 urlpatterns = [
     path('api/', views.chat_api, name='chat_api'),
+    path('api/stream/', views.chat_stream_api, name='chat_stream_api'),
     path('api/tts/', views.tts_api, name='tts_api'),
+    re_path(r'^api/tts/(?P<key>[0-9a-f]{64})\.wav$', views.tts_audio_api, name='tts_audio_api'),
+    path('api/cache-stats/', views.chat_cache_stats_api, name='chat_cache_stats_api'),
+    path('api/providers/', views.provider_status_api, name='provider_status_api'),
 ]
@@ -1,22 +1,63 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_GET, require_http_methods
 from django.conf import settings
+from asgiref.sync import sync_to_async
 # from openai import OpenAI # Moved inside view to prevent startup errors if missing
+import base64
 import json
 import logging
+import math
 import os
-import requests
+
+from admin_portal.api_views import admin_required
+from core.ranges import ranged_file_response
+from core.singleflight import SingleFlight
+
+from . import tts
+from .providers import ProviderError, configured_providers, system_instruction
+from .response_cache import cache_key, is_personalized, response_cache
+from .routing import router
 
 logger = logging.getLogger(__name__)
 
-system_instruction = """
-You are HealthTrack+ AI, a helpful and professional medical assistant. 
-Your goal is to help users understand their health data, provide general wellness advice, 
-and assist with navigating the HealthTrack+ platform.
-Always include a disclaimer that you are an AI and not a substitute for professional medical advice.
-"""
+
+def cached_reply(model, user_message, completion_text):
+    response_cache.set(model, system_instruction, user_message, completion_text)
+    response = JsonResponse({'response': completion_text})
+    response['X-Cache'] = 'MISS' if response_cache.cacheable(user_message) else 'BYPASS'
+    return response
+
+
+def providers_unavailable(providers, error):
+    if error is not None:
+        logger.error(f"Chatbot API error: {error}")
+        return JsonResponse({'error': f'Chat service failed: {error}'}, status=500)
+    # Nothing was tried: every provider's circuit is open.
+    retry_after = max(1, math.ceil(router.retry_in(providers)))
+    response = JsonResponse({'error': 'Chat service is temporarily unavailable. Please try again shortly.'}, status=503)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+def ask_providers(providers, user_message):
+    """
+    (provider, answer) from the fastest healthy provider that answers, or
+    (None, last error) if none did; the error is None when every circuit is open.
+    """
+    error = None
+    for provider in router.route(providers, 'complete'):
+        try:
+            return provider, router.call(provider, 'complete', provider.complete, user_message)
+        except ProviderError as e:
+            error = e
+            logger.warning(f"Chat provider {provider.name} failed: {e}")
+    return None, error
+
+
+chat_flight = SingleFlight()
+
 
 @csrf_exempt
 @require_http_methods(["POST", "OPTIONS"])
@@ -25,7 +66,6 @@ def chat_api(request):
     if request.method == "OPTIONS":
         return JsonResponse({}, status=200)
 
-    api_key = None
     try:
         data = json.loads(request.body)
         user_message = data.get('message', '')
@@ -33,82 +73,27 @@ def chat_api(request):
         if not user_message:
             return JsonResponse({'error': 'No message provided'}, status=400)
 
-        # Check for Groq API Key first if preferred
-        groq_key = getattr(settings, 'GROQ_API_KEY', None) or os.environ.get('GROQ_API_KEY')
-        print(f"DEBUG: Chatbot attempt - Groq Key Present: {bool(groq_key and groq_key != 'your_groq_api_key_here')}")
-        
-        if groq_key and groq_key != 'your_groq_api_key_here':
-            try:
-                print("DEBUG: Calling Groq API...")
-                response = requests.post(
-                    url="https://api.groq.com/openai/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {groq_key}",
-                        "Content-Type": "application/json"
-                    },
-                    data=json.dumps({
-                        "model": "llama-3.3-70b-versatile",
-                        "messages": [
-                            {"role": "system", "content": system_instruction},
-                            {"role": "user", "content": user_message}
-                        ]
-                    })
-                )
-                print(f"DEBUG: Groq Response Status: {response.status_code}")
-                if response.status_code == 200:
-                    data = response.json()
-                    completion_text = data['choices'][0]['message']['content']
-                    return JsonResponse({'response': completion_text})
-                else:
-                    print(f"DEBUG: Groq Error Body: {response.text}")
-                    logger.warning(f"Groq API error: {response.text}. Falling back to OpenRouter.")
-            except Exception as e:
-                print(f"DEBUG: Groq Exception: {str(e)}")
-                logger.warning(f"Groq connection failed: {str(e)}. Falling back to OpenRouter.")
-
-        # Fallback to OpenRouter
-        api_key = getattr(settings, 'OPENAI_API_KEY', None) or os.environ.get('OPENAI_API_KEY')
-        print(f"DEBUG: Fallback to OpenRouter - Key Present: {bool(api_key)}")
-        
-        if not api_key:
-            # Try fallback to GOOGLE_API_KEY if the user put the OR key there
-            legacy_key = getattr(settings, 'GOOGLE_API_KEY', None) or os.environ.get('GOOGLE_API_KEY')
-            if legacy_key and legacy_key.startswith('sk-or-v1'):
-                api_key = legacy_key
-            else:
-                logger.error("OpenAI API Key is missing.")
-                return JsonResponse({'error': 'Server configuration error: API key missing'}, status=503)
+        providers = configured_providers()
+        if not providers:
+            logger.error("No chatbot provider API key is configured.")
+            return JsonResponse({'error': 'Server configuration error: API key missing'}, status=503)
 
-        try:
-            print("DEBUG: Calling OpenRouter API...")
-            response = requests.post(
-                url="https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                data=json.dumps({
-                    "model": "google/gemini-2.0-flash-001",
-                    "messages": [
-                        {"role": "system", "content": system_instruction},
-                        {"role": "user", "content": user_message}
-                    ]
-                })
-            )
-            print(f"DEBUG: OpenRouter Response Status: {response.status_code}")
-            
-            if response.status_code != 200:
-                print(f"DEBUG: OpenRouter Error Body: {response.text}")
-                raise Exception(f"OpenRouter API error: {response.text}")
-                
-            data = response.json()
-            completion_text = data['choices'][0]['message']['content']
-            return JsonResponse({'response': completion_text})
-            
-        except Exception as e:
-            print(f"DEBUG: Chatbot Final Exception: {str(e)}")
-            logger.error(f"Chatbot API error: {str(e)}")
-            return JsonResponse({'error': f'Chat service failed: {str(e)}'}, status=500)
+        # Answers are cached per model; take one from any model we would ask.
+        cached = response_cache.get([p.model for p in providers], system_instruction, user_message)
+        if cached is not None:
+            response = JsonResponse({'response': cached})
+            response['X-Cache'] = 'HIT'
+            return response
+
+        if not is_personalized(user_message):
+            # The same general question asked concurrently goes to the provider once.
+            key = cache_key('|'.join(p.model for p in providers), system_instruction, user_message)
+            provider, result = chat_flight.do(key, ask_providers, providers, user_message)
+        else:
+            provider, result = ask_providers(providers, user_message)
+        if provider is None:
+            return providers_unavailable(providers, result)
+        return cached_reply(provider.model, user_message, result)
 
     except json.JSONDecodeError:
         logger.error("Invalid JSON in request body")
@@ -117,16 +102,137 @@ def chat_api(request):
         logger.error(f"Error in chat_api: {str(e)}", exc_info=True)
         # Don't leak internal errors in production responses.
         if getattr(settings, "DEBUG", False):
-            error_message = f"DEBUG ERROR: {str(e)} | KeyPresent: {bool(api_key)}"
+            error_message = f"DEBUG ERROR: {str(e)}"
             return JsonResponse({'error': error_message}, status=500)
         return JsonResponse({'error': 'Chat service error. Please try again later.'}, status=500)
 
+def sse_event(data, event=None):
+    prefix = f'event: {event}\n' if event else ''
+    return f'{prefix}data: {json.dumps(data)}\n\n'
+
+
+def sse_response(events, cache_status):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    response['X-Cache'] = cache_status
+    return response
+
+
+async def replay_cached(answer):
+    yield sse_event({'delta': answer})
+    yield sse_event({'cached': True}, event='done')
+
+
+async def relay_stream(provider, user_message, stream):
+    """SSE events for a provider stream; the answer is cached once it is complete."""
+    parts = []
+    try:
+        while True:
+            # Blocking reads run in the thread pool; the event loop stays free.
+            delta = await sync_to_async(next, thread_sensitive=False)(stream, None)
+            if delta is None:
+                break
+            parts.append(delta)
+            yield sse_event({'delta': delta})
+    except Exception as e:
+        # Too late to fall back: the client already has part of this answer.
+        logger.warning(f"Chat stream from {provider.name} broke off: {e}")
+        router.record_failure(provider)
+        yield sse_event({'error': 'The answer was interrupted. Please try again.'}, event='error')
+        return
+    finally:
+        # Also runs when the client disconnects, releasing the upstream connection.
+        stream.close()
+    await sync_to_async(response_cache.set, thread_sensitive=False)(
+        provider.model, system_instruction, user_message, ''.join(parts)
+    )
+    yield sse_event({'provider': provider.name, 'model': provider.model}, event='done')
+
+
+@csrf_exempt
+@require_http_methods(["POST", "OPTIONS"])
+async def chat_stream_api(request):
+    """
+    Streaming variant of chat_api: relays the provider's tokens as
+    Server-Sent Events (`data: {"delta": ...}`, then `event: done`, or
+    `event: error` if the provider breaks off). Needs an ASGI server; under
+    WSGI the whole stream is buffered before it is sent.
+
+    Providers are tried in routing order (chatbot/routing.py) until one
+    delivers its first token, so a provider failing to connect, answering
+    with an error or timing out still falls back to the next. Failures
+    before any token arrives get the same JSON errors as chat_api.
+    """
+    if request.method == "OPTIONS":
+        return JsonResponse({}, status=200)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON format'}, status=400)
+    user_message = data.get('message', '') if isinstance(data, dict) else ''
+    if not user_message:
+        return JsonResponse({'error': 'No message provided'}, status=400)
+
+    providers = configured_providers()
+    if not providers:
+        logger.error("No chatbot provider API key is configured.")
+        return JsonResponse({'error': 'Server configuration error: API key missing'}, status=503)
+
+    cached = await sync_to_async(response_cache.get, thread_sensitive=False)(
+        [p.model for p in providers], system_instruction, user_message
+    )
+    if cached is not None:
+        return sse_response(replay_cached(cached), 'HIT')
+
+    error = None
+    for provider in router.route(providers, 'stream'):
+        try:
+            stream = await sync_to_async(router.call, thread_sensitive=False)(
+                provider, 'stream', provider.open_stream, user_message
+            )
+        except ProviderError as e:
+            error = e
+            logger.warning(f"Chat provider {provider.name} failed: {e}")
+            continue
+        cache_status = 'MISS' if response_cache.cacheable(user_message) else 'BYPASS'
+        return sse_response(relay_stream(provider, user_message, stream), cache_status)
+
+    return providers_unavailable(providers, error)
+
+def wants_wav(request, data):
+    return data.get('format') == 'wav' or request.headers.get('Accept', '').startswith('audio/')
+
+
+def tts_response(request, data, key, path):
+    """The cached audio at `path` as the client asked for it: raw WAV, or base64 in JSON."""
+    # A URL into a per-instance cache would 404 on every other instance.
+    audio_url = reverse('tts_audio_api', args=[key]) if getattr(settings, 'TTS_CACHE_SHARED', True) else None
+    if wants_wav(request, data):
+        response = ranged_file_response(request, path, 'audio/wav', etag=key)
+        if audio_url:
+            response['Content-Location'] = audio_url
+        return response
+    with open(path, 'rb') as f:
+        audio_base64 = base64.b64encode(f.read()).decode()
+    return JsonResponse({'audio': audio_base64, 'audio_url': audio_url})
+
+
 @csrf_exempt
 @require_http_methods(["POST", "OPTIONS"])
 def tts_api(request):
     """
     Endpoint to convert text to speech using Sarvam API.
     Expects JSON: { "text": "Hello world" }
+
+    Returns the audio as raw audio/wav when asked for with "format": "wav"
+    or an `Accept: audio/...` header. Otherwise the JSON response carries it
+    base64-encoded, as before. When the audio cache is shared by every
+    instance (TTS_CACHE_SHARED), the audio is also served, with Range
+    support, from the audio_url/Content-Location given in the response;
+    otherwise audio_url is null.
     """
     if request.method == "OPTIONS":
         return JsonResponse({}, status=200)
@@ -143,46 +249,47 @@ def tts_api(request):
         if not text:
             return JsonResponse({'error': 'No text provided'}, status=400)
 
-        # Truncate text if necessary to fit within limits (500 chars per Sarvam API docs request)
-        if len(text) > 450:
-             text = text[:450] + "..."
-
-        url = "https://api.sarvam.ai/text-to-speech"
-        
-        # Determine language (e.g., if it has Hindi characters, use hi-IN, else fallback to en-IN)
-        # Using hi-IN for Hindi setup or en-IN for English with Indian accent. Let's use en-IN by default.
-        payload = {
-            "inputs": [text],
-            "target_language_code": "hi-IN",
-            "speaker": "priya", # Valid speakers for hi-IN include anushka, priya
-            "pitch": 0,
-            "pace": 1.0,
-            "loudness": 1.5,
-            "speech_sample_rate": 22050,
-            "enable_preprocessing": True
-        }
-        
-        headers = {
-            "Content-Type": "application/json",
-            "api-subscription-key": api_key
-        }
-
-        response = requests.post(url, json=payload, headers=headers)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if "audios" in result and len(result["audios"]) > 0:
-                audio_base64 = result["audios"][0]
-                return JsonResponse({'audio': audio_base64})
-            else:
-                 logger.error(f"Sarvam API returned unexpected format: {result}")
-                 return JsonResponse({'error': 'Invalid response from TTS service'}, status=500)
-        else:
-            logger.error(f"Sarvam API error: {response.status_code} - {response.text}")
-            return JsonResponse({'error': f'TTS service error: {response.status_code}'}, status=500)
+        key, path = tts.synthesize(text, api_key)
+        try:
+            return tts_response(request, data, key, path)
+        except FileNotFoundError:
+            # Evicted by another worker in between; the chunks are most likely still cached.
+            key, path = tts.synthesize(text, api_key)
+            return tts_response(request, data, key, path)
 
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON format'}, status=400)
+    except tts.TtsError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
     except Exception as e:
         logger.error(f"Error in tts_api: {str(e)}", exc_info=True)
         return JsonResponse({'error': 'TTS service encountered an error.'}, status=500)
+
+
+@require_GET
+def tts_audio_api(request, key):
+    """Cached TTS audio by content hash; immutable, so clients and CDNs may keep it."""
+    path = tts.audio_cache.get(key)
+    if path is None:
+        return JsonResponse({'error': 'Audio not found'}, status=404)
+    try:
+        return ranged_file_response(
+            request, path, 'audio/wav', etag=key, cache_control='public, max-age=31536000, immutable'
+        )
+    except FileNotFoundError:
+        return JsonResponse({'error': 'Audio not found'}, status=404)
+
+
+@csrf_exempt
+@admin_required
+@require_GET
+def chat_cache_stats_api(request):
+    return JsonResponse({'success': True, 'stats': response_cache.stats()})
+
+
+@csrf_exempt
+@admin_required
+@require_GET
+def provider_status_api(request):
+    """Circuit breaker state and latency of each configured chat provider."""
+    return JsonResponse({'success': True, 'providers': router.status(configured_providers())})
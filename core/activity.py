@@ -0,0 +1,289 @@
+"""
+Buffered ActivityLog writer.
+
+log_activity() appends the event to an in-process buffer and returns; rows are
+written with one bulk_create per batch, off the request path. A batch is
+flushed when:
+- the buffer reaches ACTIVITY_LOG_BUFFER_SIZE (by the background flusher thread),
+- ACTIVITY_LOG_FLUSH_INTERVAL seconds have passed,
+- a request finishes, after its response has been sent (ACTIVITY_LOG_FLUSH_ON_REQUEST_END),
+- the process exits.
+
+For durability, each event is also appended to a spool segment file under
+ACTIVITY_LOG_SPOOL_DIR before log_activity() returns. The segment is
+deleted once its batch is committed. Segments left behind by a crash or a
+failed flush are replayed by recover_spool(). The flusher runs it
+periodically, and `manage.py flush_activity_log` runs it on demand.
+
+bulk_create skips post_save, so the flush refreshes the dashboard summaries
+and data versions of the affected users itself.
+"""
+import atexit
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ActivityLog, DashboardSummary
+from .signals import update_summary
+from .versioning import bump_data_version
+
+logger = logging.getLogger(__name__)
+
+# Spool segments: "<host>-<pid>-<seq>.open" while being written, ".ready" once
+# handed to a flush, ".claimed-<pid>" while being replayed by recover_spool().
+READY_SUFFIX = '.ready'
+OPEN_SUFFIX = '.open'
+# A .ready segment older than this is assumed to belong to a failed flush.
+RECOVERY_AGE = 60
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ActivityBuffer:
+    """Thread-safe buffer of pending ActivityLog rows; see the module docstring."""
+
+    def __init__(self, max_size=100, flush_interval=2.0, spool_dir=None, fsync=False):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.spool_dir = spool_dir
+        self.fsync = fsync
+        self.prefix = f'{socket.gethostname()}-{os.getpid()}'
+        self._events = []
+        self._segment = None  # (path, file) of the open spool segment
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = os.getpid()
+        self._last_recovery = 0.0
+
+    # Producer side
+
+    def log(self, user_id, action, details='', ip_address=None):
+        event = {
+            'user_id': user_id,
+            'action': action,
+            'details': details or '',
+            'ip_address': ip_address,
+            'created_at': timezone.now().isoformat(),
+        }
+        with self._lock:
+            self._events.append(event)
+            self._spool(event)
+            full = len(self._events) >= self.max_size
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def _spool(self, event):
+        if not self.spool_dir:
+            return
+        try:
+            if self._segment is None:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                self._sequence += 1
+                path = os.path.join(self.spool_dir, f'{self.prefix}-{self._sequence}{OPEN_SUFFIX}')
+                self._segment = (path, open(path, 'a', encoding='utf-8'))
+            spool_file = self._segment[1]
+            spool_file.write(json.dumps(event) + '\n')
+            spool_file.flush()
+            if self.fsync:
+                os.fsync(spool_file.fileno())
+        except OSError:
+            logger.exception('Activity spool unavailable; continuing without it')
+            self.spool_dir = None
+
+    def _ensure_thread(self):
+        if os.getpid() != self._pid:
+            # Forked worker: the parent's thread and spool segment don't exist here.
+            self._pid = os.getpid()
+            self.prefix = f'{socket.gethostname()}-{self._pid}'
+            self._segment = None
+            self._thread = None
+            self._events = []  # Still owned (and spooled) by the parent.
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='activity-log-flusher', daemon=True)
+                    self._thread.start()
+
+    # Consumer side
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+                if self.spool_dir and time.monotonic() - self._last_recovery > RECOVERY_AGE:
+                    self._last_recovery = time.monotonic()
+                    recover_spool(self.spool_dir)
+            except Exception:
+                logger.exception('Activity log flush failed')
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+                segment, self._segment = self._segment, None
+            if segment is not None:
+                path, spool_file = segment
+                spool_file.close()
+                ready = path[:-len(OPEN_SUFFIX)] + READY_SUFFIX
+                os.replace(path, ready)
+            if not events:
+                return 0
+            try:
+                written = write_events(events)
+            except Exception:
+                if segment is None:
+                    # Nothing on disk: keep the events for the next attempt.
+                    with self._lock:
+                        self._events[:0] = events
+                    raise
+                # The .ready segment stays on disk for recover_spool().
+                logger.exception('Could not write %d activity events; left in spool', len(events))
+                return 0
+            if segment is not None:
+                os.unlink(ready)
+            return written
+
+    def pending(self):
+        with self._lock:
+            return len(self._events)
+
+
+def write_events(events):
+    """
+    bulk_create the events, then refresh what post_save would have. Returns
+    the number of rows written.
+    """
+    # Users deleted since the event was queued would fail the whole batch.
+    existing = set(
+        get_user_model().objects.filter(pk__in={event['user_id'] for event in events}).values_list('pk', flat=True)
+    )
+    rows = [
+        ActivityLog(
+            user_id=event['user_id'],
+            action=event['action'],
+            details=event['details'],
+            ip_address=event['ip_address'],
+            created_at=parse_datetime(event['created_at']),
+        )
+        for event in events
+        if event['user_id'] in existing
+    ]
+    user_ids = {row.user_id for row in rows}
+    with transaction.atomic():
+        ActivityLog.objects.bulk_create(rows, batch_size=500)
+        for user_id in user_ids:
+            update_summary(user_id, DashboardSummary.refresh_recent_activities)
+    bump_data_version(*user_ids)
+    return len(rows)
+
+
+def recover_spool(spool_dir):
+    """
+    Replay segments left by crashed processes (.open files of dead pids on this
+    host) and by failed flushes (.ready files older than RECOVERY_AGE). Each
+    file is claimed with an atomic rename so concurrent recoveries don't
+    double-insert. Returns the number of rows written.
+    """
+    try:
+        names = os.listdir(spool_dir)
+    except FileNotFoundError:
+        return 0
+
+    host = socket.gethostname()
+    written = 0
+    for name in names:
+        path = os.path.join(spool_dir, name)
+        if name.endswith(OPEN_SUFFIX):
+            owner, _, pid = name[:-len(OPEN_SUFFIX)].rpartition('-')[0].rpartition('-')
+            if owner != host or not pid.isdigit() or _process_alive(int(pid)):
+                continue
+        elif name.endswith(READY_SUFFIX):
+            try:
+                if time.time() - os.path.getmtime(path) < RECOVERY_AGE:
+                    continue
+            except FileNotFoundError:
+                continue
+        else:
+            continue
+
+        claimed = f'{path}.claimed-{os.getpid()}'
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            continue  # Claimed by someone else.
+        with open(claimed, encoding='utf-8') as spool_file:
+            # A crash can leave a torn last line; skip anything unparseable.
+            events = []
+            for line in spool_file:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+        try:
+            if events:
+                written += write_events(events)
+        except Exception:
+            os.rename(claimed, path)
+            raise
+        os.unlink(claimed)
+    return written
+
+
+def default_spool_dir():
+    return getattr(settings, 'ACTIVITY_LOG_SPOOL_DIR', None) or os.path.join(
+        tempfile.gettempdir(), 'healthtrack-activity-spool'
+    )
+
+
+activity_buffer = ActivityBuffer(
+    max_size=getattr(settings, 'ACTIVITY_LOG_BUFFER_SIZE', 100),
+    flush_interval=getattr(settings, 'ACTIVITY_LOG_FLUSH_INTERVAL', 2.0),
+    spool_dir=default_spool_dir(),
+    fsync=getattr(settings, 'ACTIVITY_LOG_FSYNC', False),
+)
+
+
+def log_activity(user, action, details='', ip_address=None):
+    """Queue an ActivityLog row for `user` (a User or a user id)."""
+    user_id = getattr(user, 'pk', user)
+    activity_buffer.log(user_id, action, details, ip_address)
+
+
+def _flush_after_request(sender, **kwargs):
+    if activity_buffer.pending():
+        try:
+            activity_buffer.flush()
+        except Exception:
+            logger.exception('Activity log flush failed')
+
+
+if getattr(settings, 'ACTIVITY_LOG_FLUSH_ON_REQUEST_END', True):
+    request_finished.connect(_flush_after_request, dispatch_uid='core.activity.flush_after_request')
+atexit.register(_flush_after_request, None)
@@ -1,75 +1,87 @@
-from django.http import JsonResponse
+import json
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
 from django.db.models import Avg
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET
-from django.utils.timesince import timesince
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date, parse_datetime
 from django.middleware.csrf import get_token
 
 from accounts.api_views import jwt_required
 
+from .activity import log_activity
+from .export import (
+    ExportError, content_type, export_filename, iter_export, parse_types,
+    start_export_job, validate_format
+)
+from .ingest import BatchError, ingest_readings, parse_batch
+from .outbox import send_pending
+from .pagination import CursorPaginator, PaginationError
+from .serializers import (
+    AppointmentSerializer, HealthRecordSerializer, InsurancePolicySerializer,
+    LifestyleLogSerializer, MedicineSerializer, MentalHealthLogSerializer,
+    PastHealthRecordSerializer, PastPrescriptionSerializer, PrescriptionSerializer,
+    ServiceRequestSerializer
+)
+from .streaming import StreamingJsonResponse
+from .sync import SyncTokenError, changes_since, head_token, parse_token
+from .timeseries import METRICS, bucketed_series, lttb_series
+from .versioning import user_data_etag
+
 from .models import (
     HealthRecord, Medicine, Prescription, MentalHealthLog,
-    InsurancePolicy, LifestyleLog, ActivityLog, Appointment, ServiceRequest
+    InsurancePolicy, LifestyleLog, Appointment, ServiceRequest,
+    DashboardSummary, ExportJob
 )
 
+# Keyset orderings for the paginated list endpoints; the trailing id breaks ties.
+recorded_at_paginator = CursorPaginator(('-recorded_at', '-id'))
+created_at_paginator = CursorPaginator(('-created_at', '-id'))
+# past_records_api pages its two lists independently.
+past_health_records_paginator = CursorPaginator(('-recorded_at', '-id'), prefix='health_records_')
+past_prescriptions_paginator = CursorPaginator(('-prescription_date', '-id'), prefix='prescriptions_')
+
 @csrf_exempt
 @jwt_required
+@user_data_etag
 @require_GET
 def dashboard_api(request):
     """
     API endpoint to return dashboard data as JSON.
+    Served from the user's DashboardSummary row, rebuilt on a miss.
     """
     user = request.user
-    
-    # Latest Health Record
-    latest_record = HealthRecord.objects.filter(user=user).first()
-    latest_record_data = None
-    if latest_record:
-        latest_record_data = {
-            'blood_pressure_systolic': latest_record.blood_pressure_systolic,
-            'blood_pressure_diastolic': latest_record.blood_pressure_diastolic,
-            'bp_status': latest_record.bp_status,
-            'blood_sugar': str(latest_record.blood_sugar) if latest_record.blood_sugar else None,
-            'weight': str(latest_record.weight) if latest_record.weight else None,
-            'heart_rate': latest_record.heart_rate,
-            'recorded_at': latest_record.recorded_at.isoformat()
-        }
-
-    # Active Medicines
-    active_medicines = Medicine.objects.filter(user=user, is_active=True).count()
-
-    # Recent Activity
-    recent_activities_qs = ActivityLog.objects.filter(user=user)[:5]
+
+    summary = DashboardSummary.objects.filter(user_id=user.id).first()
+    if summary is None:
+        summary = DashboardSummary.rebuild(user)
+
+    # No server-rendered "time since": a 304 would freeze it. The SPA derives
+    # it from created_at.
     recent_activities = []
-    for activity in recent_activities_qs:
+    for activity in summary.recent_activities:
         recent_activities.append({
-            'action': activity.get_action_display(),
-            'action_display': activity.get_action_display(), # Frontend uses this
-            'details': activity.details,
-            'created_at': activity.created_at.isoformat(),
-            'created_at_since': timesince(activity.created_at)
+            'action': activity['action'],
+            'action_display': activity['action'], # Frontend uses this
+            'details': activity['details'],
+            'created_at': activity['created_at'],
         })
 
-    # Mental Health
-    latest_mental_health = MentalHealthLog.objects.filter(user=user).first()
-    mental_health_data = None
-    if latest_mental_health:
-        mental_health_data = {
-            'sleep_hours': str(latest_mental_health.sleep_hours) if latest_mental_health.sleep_hours else None,
-            'mood_score': latest_mental_health.mood_score,
-            'stress_level': latest_mental_health.stress_level
-        }
-
     data = {
         'user': {
-            'name': f"{user.first_name} {user.last_name}".strip() or user.username,
-            'email': user.email
+            'name': summary.display_name,
+            'email': summary.email
         },
-        'latest_record': latest_record_data,
-        'active_medicines': active_medicines,
-        'active_medicines_count': active_medicines, # Redundant but safe for frontend interface
+        'latest_record': summary.latest_record,
+        'active_medicines': summary.active_medicines,
+        'active_medicines_count': summary.active_medicines, # Redundant but safe for frontend interface
         'recent_activities': recent_activities,
-        'latest_mental_health': mental_health_data
+        'latest_mental_health': summary.latest_mental_health
     }
 
     return JsonResponse(data)
@@ -87,7 +99,7 @@ def add_health_record_api(request):
         
         # Create HealthRecord
         HealthRecord.objects.create(
-            user=user,
+            user_id=user.id,
             blood_pressure_systolic=data.get('blood_pressure_systolic') or None,
             blood_pressure_diastolic=data.get('blood_pressure_diastolic') or None,
             blood_sugar=data.get('blood_sugar') or None,
@@ -104,6 +116,29 @@ def add_health_record_api(request):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
+@csrf_exempt
+@jwt_required
+def add_health_records_bulk_api(request):
+    """
+    Batch ingestion for device syncs. Accepts a JSON array (or NDJSON) of
+    readings, each with an ISO `recorded_at`; readings already stored for the
+    same timestamp are reported as duplicates. Returns per-item results.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        items = parse_batch(request.body, request.content_type)
+    except BatchError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    results = ingest_readings(request.user.id, items)
+    summary = {status: 0 for status in ('created', 'duplicate', 'invalid')}
+    for result in results:
+        summary[result['status']] += 1
+
+    return JsonResponse({**summary, 'results': results})
+
 @csrf_exempt
 @jwt_required
 def add_medicine_api(request):
@@ -127,7 +162,7 @@ def add_medicine_api(request):
             end_date = None
 
         Medicine.objects.create(
-            user=user,
+            user_id=user.id,
             name=data.get('name'),
             dosage=data.get('dosage'),
             frequency=data.get('frequency'),
@@ -160,7 +195,7 @@ def add_prescription_api(request):
             data = json.loads(request.body)
             user = request.user
             Prescription.objects.create(
-                user=user,
+                user_id=user.id,
                 doctor_name=data.get('doctor_name'),
                 hospital_name=data.get('hospital_name'),
                 notes=data.get('notes', '')
@@ -175,7 +210,7 @@ def add_prescription_api(request):
             image = request.FILES.get('image')
             
             Prescription.objects.create(
-                user=user,
+                user_id=user.id,
                 doctor_name=doctor_name,
                 hospital_name=hospital_name,
                 notes=notes,
@@ -188,69 +223,143 @@ def add_prescription_api(request):
 
 @csrf_exempt
 @jwt_required
+@user_data_etag
 @require_GET
 def medicines_api(request):
     user = request.user
-    medicines = Medicine.objects.filter(user=user).order_by('-created_at')
+    medicines = Medicine.objects.filter(user_id=user.id)
+    try:
+        page, next_cursor = created_at_paginator.paginate(
+            MedicineSerializer.values(medicines, *created_at_paginator.fields), request
+        )
+    except PaginationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
-    meds_data = []
-    for med in medicines:
-        meds_data.append({
-            'name': med.name,
-            'dosage': med.dosage,
-            'frequency_display': med.get_frequency_display(),
-            'start_date': med.start_date.isoformat() if med.start_date else None,
-            'end_date': med.end_date.isoformat() if med.end_date else None,
-            'is_active': med.is_active
-        })
+    meds_data = MedicineSerializer.dump(page)
 
     active_count = medicines.filter(is_active=True).count()
 
     return JsonResponse({
         'medicines': meds_data,
-        'active_count': active_count
+        'active_count': active_count,
+        'next_cursor': next_cursor
     })
 
 @csrf_exempt
 @jwt_required
+@user_data_etag
 @require_GET
 def health_track_api(request):
     user = request.user
-    records = HealthRecord.objects.filter(user=user).order_by('-recorded_at')
+    records = HealthRecord.objects.filter(user_id=user.id).with_bp_status()
+    bp_status = request.GET.get('bp_status')
+    if bp_status:
+        records = records.filter(bp_category=bp_status)
+    try:
+        page, next_cursor = recorded_at_paginator.paginate(
+            HealthRecordSerializer.values(records, *recorded_at_paginator.fields), request
+        )
+    except PaginationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
-    data = []
-    for record in records:
-        data.append({
-            'recorded_at': record.recorded_at.strftime('%Y-%m-%d %H:%M'),
-            'blood_pressure_systolic': record.blood_pressure_systolic,
-            'blood_pressure_diastolic': record.blood_pressure_diastolic,
-            'blood_sugar': str(record.blood_sugar) if record.blood_sugar else None,
-            'weight': str(record.weight) if record.weight else None,
-            'heart_rate': record.heart_rate,
-            'oxygen_level': str(record.oxygen_level) if record.oxygen_level else None,
-            'bp_status': record.bp_status
-        })
-        
-    return JsonResponse({'records': data})
+    # Unpaginated (legacy) requests get the whole history, so stream it.
+    return StreamingJsonResponse({
+        'records': HealthRecordSerializer.stream(page),
+        'next_cursor': next_cursor
+    })
 
 @csrf_exempt
 @jwt_required
+@user_data_etag
+@require_GET
+def health_series_api(request):
+    """
+    Downsampled chart data for one HealthRecord metric.
+    GET params: metric, start/end (ISO date or datetime, default: the last year),
+    points (target point count, default 500) and mode ('buckets' for SQL
+    min/avg/max per time bucket, or 'lttb').
+    """
+    metric = request.GET.get('metric')
+    field = METRICS.get(metric)
+    if field is None:
+        return JsonResponse({'error': f"metric must be one of: {', '.join(METRICS)}"}, status=400)
+
+    mode = request.GET.get('mode', 'buckets')
+    if mode not in ('buckets', 'lttb'):
+        return JsonResponse({'error': "mode must be 'buckets' or 'lttb'"}, status=400)
+
+    try:
+        points = min(int(request.GET.get('points', 500)), 5000)
+        end = _parse_series_bound(request.GET.get('end')) or timezone.now()
+        start = _parse_series_bound(request.GET.get('start')) or end - timedelta(days=365)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if points < 3 or start >= end:
+        return JsonResponse({'error': 'Invalid range or point count'}, status=400)
+
+    records = HealthRecord.objects.filter(
+        user_id=request.user.id, recorded_at__gte=start, recorded_at__lte=end
+    )
+    data = {'metric': metric, 'mode': mode, 'start': start.isoformat(), 'end': end.isoformat()}
+    if mode == 'buckets':
+        data['bucket'], data['points'] = bucketed_series(records, field, start, end, points)
+    else:
+        data['points'] = lttb_series(records, field, points)
+    return JsonResponse(data)
+
+@csrf_exempt
+@jwt_required
+@user_data_etag
+@require_GET
+def bp_histogram_api(request):
+    """
+    Count of the user's readings per blood pressure category, computed in SQL.
+    Optional start/end (ISO date or datetime) restrict the range.
+    """
+    records = HealthRecord.objects.filter(user_id=request.user.id)
+    try:
+        start = _parse_series_bound(request.GET.get('start'))
+        end = _parse_series_bound(request.GET.get('end'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if start:
+        records = records.filter(recorded_at__gte=start)
+    if end:
+        records = records.filter(recorded_at__lte=end)
+
+    histogram = records.bp_status_histogram()
+    return JsonResponse({'histogram': histogram, 'total': sum(histogram.values())})
+
+def _parse_series_bound(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value}')
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+@csrf_exempt
+@jwt_required
+@user_data_etag
 @require_GET
 def prescriptions_api(request):
     user = request.user
-    prescriptions = Prescription.objects.filter(user=user).order_by('-created_at')
+    prescriptions = Prescription.objects.filter(user_id=user.id)
+    try:
+        page, next_cursor = created_at_paginator.paginate(
+            PrescriptionSerializer.values(prescriptions, *created_at_paginator.fields), request
+        )
+    except PaginationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
-    data = []
-    for p in prescriptions:
-        data.append({
-            'prescription_date': p.created_at.strftime('%Y-%m-%d'), # Using created_at as prescription date for simpler logic
-            'doctor_name': p.doctor_name,
-            'hospital_name': p.hospital_name,
-            'diagnosis': p.notes[:50] + '...' if len(p.notes) > 50 else p.notes, # Using notes as diagnosis placeholder
-            'follow_up_date': None # Add this field to model if needed
-        })
+    data = PrescriptionSerializer.dump(page)
         
-    return JsonResponse({'prescriptions': data})
+    return JsonResponse({'prescriptions': data, 'next_cursor': next_cursor})
 
 @csrf_exempt
 @jwt_required
@@ -284,105 +393,240 @@ def profile_api(request):
 
 @csrf_exempt
 @jwt_required
+@user_data_etag
 @require_GET
 def mental_health_api(request):
     user = request.user
-    logs = MentalHealthLog.objects.filter(user=user).order_by('-recorded_at')
+    logs = MentalHealthLog.objects.filter(user_id=user.id)
+    try:
+        page, next_cursor = recorded_at_paginator.paginate(
+            MentalHealthLogSerializer.values(logs, *recorded_at_paginator.fields), request
+        )
+    except PaginationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
     # Calculate average mood
     avg_mood = logs.aggregate(Avg('mood_score'))['mood_score__avg'] or 0
     
-    logs_data = []
-    for log in logs:
-        logs_data.append({
-            'recorded_at': log.recorded_at.strftime('%Y-%m-%d %H:%M'),
-            'mood_score': log.mood_score,
-            'mood_score_display': log.get_mood_score_display(),
-            'stress_level_display': log.get_stress_level_display(),
-            'sleep_hours': float(log.sleep_hours) if log.sleep_hours else None,
-            'notes': log.notes
-        })
+    logs_data = MentalHealthLogSerializer.dump(page)
 
     return JsonResponse({
         'avg_mood': round(avg_mood, 1),
-        'logs': logs_data
+        'logs': logs_data,
+        'next_cursor': next_cursor
     })
 
 @csrf_exempt
 @jwt_required
+@user_data_etag
 @require_GET
 def lifestyle_api(request):
     user = request.user
-    logs = LifestyleLog.objects.filter(user=user).order_by('-recorded_at')
+    logs = LifestyleLog.objects.filter(user_id=user.id)
+    try:
+        page, next_cursor = recorded_at_paginator.paginate(
+            LifestyleLogSerializer.values(logs, *recorded_at_paginator.fields), request
+        )
+    except PaginationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
-    logs_data = []
-    for log in logs:
-        logs_data.append({
-            'recorded_at': log.recorded_at.isoformat(),
-            'water_intake': log.water_intake,
-            'exercise_minutes': log.exercise_minutes,
-            'steps_count': log.steps_count,
-            'calories_consumed': log.calories_consumed
-        })
+    logs_data = LifestyleLogSerializer.dump(page)
 
     return JsonResponse({
-        'logs': logs_data
+        'logs': logs_data,
+        'next_cursor': next_cursor
     })
 
 @csrf_exempt
 @jwt_required
+@user_data_etag
 @require_GET
 def insurance_api(request):
     user = request.user
-    policies = InsurancePolicy.objects.filter(user=user).order_by('-created_at')
+    policies = InsurancePolicy.objects.filter(user_id=user.id)
+    try:
+        page, next_cursor = created_at_paginator.paginate(
+            InsurancePolicySerializer.values(policies, *created_at_paginator.fields), request
+        )
+    except PaginationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
-    policies_data = []
-    for policy in policies:
-        policies_data.append({
-            'provider_name': policy.provider_name,
-            'policy_type_display': policy.get_policy_type_display(),
-            'policy_number': policy.policy_number,
-            'coverage_amount': float(policy.coverage_amount),
-            'end_date': policy.end_date.isoformat(),
-            'is_active': policy.is_active
-        })
+    policies_data = InsurancePolicySerializer.dump(page)
 
     active_policies = policies.filter(is_active=True).count()
 
     return JsonResponse({
         'policies': policies_data,
-        'active_policies': active_policies
+        'active_policies': active_policies,
+        'next_cursor': next_cursor
     })
 
 @csrf_exempt
 @jwt_required
+@user_data_etag
 @require_GET
 def past_records_api(request):
     user = request.user
-    health_records = HealthRecord.objects.filter(user=user).order_by('-recorded_at')
-    prescriptions = Prescription.objects.filter(user=user).order_by('-prescription_date')
-    
-    health_data = []
-    for record in health_records:
-        health_data.append({
-            'recorded_at': record.recorded_at.strftime('%Y-%m-%d'),
-            'blood_pressure_systolic': record.blood_pressure_systolic,
-            'blood_pressure_diastolic': record.blood_pressure_diastolic
-        })
+    try:
+        health_records, health_next_cursor = past_health_records_paginator.paginate(
+            PastHealthRecordSerializer.values(
+                HealthRecord.objects.filter(user_id=user.id), *past_health_records_paginator.fields
+            ),
+            request
+        )
+        prescriptions, prescriptions_next_cursor = past_prescriptions_paginator.paginate(
+            PastPrescriptionSerializer.values(
+                Prescription.objects.filter(user_id=user.id), *past_prescriptions_paginator.fields
+            ),
+            request
+        )
+    except PaginationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # Lists the client did not paginate are the full history; both are streamed.
+    return StreamingJsonResponse({
+        'health_records': PastHealthRecordSerializer.stream(health_records),
+        'prescriptions': PastPrescriptionSerializer.stream(prescriptions),
+        'health_records_next_cursor': health_next_cursor,
+        'prescriptions_next_cursor': prescriptions_next_cursor
+    })
 
-    prescription_data = []
-    for p in prescriptions:
-        prescription_data.append({
-            'prescription_date': p.prescription_date.isoformat(),
-            'doctor_name': p.doctor_name
+
+@csrf_exempt
+@jwt_required
+@user_data_etag
+@require_GET
+def sync_api(request):
+    """
+    Delta sync for mobile clients.
+    Without `since`: returns the feed head and full_resync=true (download the
+    lists once, then sync from that token). With `since`: returns rows changed
+    after the token, grouped by type, plus tombstone ids for deletions.
+    """
+    user_id = request.user.id
+    if 'since' not in request.GET:
+        return JsonResponse({
+            'full_resync': True,
+            'next_token': head_token(user_id),
+            'has_more': False,
+            'changes': {},
+            'deleted': {},
         })
 
+    try:
+        since = parse_token(request.GET['since'])
+        limit = min(int(request.GET.get('limit', 500)), 2000)
+    except (SyncTokenError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if limit < 1:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    changes, deleted, next_token, has_more = changes_since(user_id, since, limit)
     return JsonResponse({
-        'health_records': health_data,
-        'prescriptions': prescription_data
+        'full_resync': False,
+        'next_token': next_token,
+        'has_more': has_more,
+        'changes': changes,
+        'deleted': deleted,
     })
 
 
+@csrf_exempt
+@jwt_required
+@require_GET
+def export_api(request):
+    """
+    Stream all of the user's data as a download.
+    ?format=csv|ndjson|fhir (default ndjson), ?types=health_records,medicines,...
+    (default all), ?gzip=1 to compress. Use export jobs for very large histories.
+    """
+    try:
+        fmt = validate_format(request.GET.get('format', 'ndjson'))
+        types = parse_types(request.GET.get('types', ''))
+    except ExportError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    compress = request.GET.get('gzip') in ('1', 'true')
+
+    response = StreamingHttpResponse(
+        iter_export(request.user.id, fmt, types, compress),
+        content_type=content_type(fmt, compress)
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(fmt, compress)}"'
+    return response
+
+
+def _export_job_data(job):
+    return {
+        'id': job.id,
+        'format': job.format,
+        'types': job.types,
+        'gzip': job.compress,
+        'status': job.status,
+        'row_count': job.row_count,
+        'error': job.error,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+        'download_url': f'/api/export/jobs/{job.id}/download/' if job.status == 'done' else None,
+    }
+
+
+@csrf_exempt
+@jwt_required
+def export_jobs_api(request):
+    """
+    GET: the user's recent export jobs.
+    POST: queue a background export; body {"format", "types", "gzip"} as for
+    export_api. Only one job per user may be pending or running at a time.
+    """
+    user_id = request.user.id
+    if request.method == 'GET':
+        jobs = ExportJob.objects.filter(user_id=user_id).order_by('-created_at', '-id')[:20]
+        return JsonResponse({'jobs': [_export_job_data(job) for job in jobs]})
+
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        data = json.loads(request.body or '{}')
+        fmt = validate_format(data.get('format', 'ndjson'))
+        types = parse_types(data.get('types') or [])
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    active = ExportJob.objects.filter(user_id=user_id, status__in=['pending', 'running']).first()
+    if active is not None:
+        return JsonResponse({'error': 'An export is already in progress', 'job': _export_job_data(active)}, status=409)
+
+    job = ExportJob.objects.create(user_id=user_id, format=fmt, types=types, compress=bool(data.get('gzip')))
+    start_export_job(job)
+    return JsonResponse({'job': _export_job_data(job)}, status=202)
+
+
+@csrf_exempt
+@jwt_required
+@require_GET
+def export_job_api(request, job_id):
+    job = ExportJob.objects.filter(user_id=request.user.id, id=job_id).first()
+    if job is None:
+        return JsonResponse({'error': 'Export not found'}, status=404)
+    return JsonResponse({'job': _export_job_data(job)})
+
+
+@csrf_exempt
+@jwt_required
+@require_GET
+def export_job_download_api(request, job_id):
+    job = ExportJob.objects.filter(user_id=request.user.id, id=job_id, status='done').first()
+    if job is None or not job.file:
+        return JsonResponse({'error': 'Export not found'}, status=404)
+    return FileResponse(
+        job.file.open('rb'),
+        as_attachment=True,
+        filename=export_filename(job.format, job.compress, job.created_at),
+        content_type=content_type(job.format, job.compress)
+    )
+
+
 @csrf_exempt
 @jwt_required
 def appointments_api(request):
@@ -409,19 +653,7 @@ def appointments_api(request):
             # Patient
             appointments = Appointment.objects.filter(patient=request.user)
             
-        data = []
-        for appt in appointments:
-            data.append({
-                'id': appt.id,
-                'patient_name': appt.patient.get_full_name(),
-                'doctor_name': appt.doctor.get_full_name(),
-                'date': appt.date,
-                'time': appt.time,
-                'reason': appt.reason,
-                'status': appt.status,
-                'type': appt.type,
-                'meeting_link': appt.meeting_link
-            })
+        data = AppointmentSerializer.serialize(appointments)
             
         return JsonResponse({'success': True, 'appointments': data})
 
@@ -447,9 +679,9 @@ def appointments_api(request):
                 type=type
             )
             
-            ActivityLog.objects.create(
-                user=request.user,
-                action='appointment_booked',
+            log_activity(
+                request.user,
+                'appointment_booked',
                 details=f"Booked appointment with Dr. {doctor.last_name}"
             )
             
@@ -472,18 +704,7 @@ def service_requests_api(request):
         else:
              requests = ServiceRequest.objects.filter(patient=request.user)
              
-        data = []
-        for req in requests:
-            data.append({
-                'id': req.id,
-                'patient_name': req.patient.get_full_name(),
-                'provider_name': req.provider.get_full_name(),
-                'service_name': req.service_name,
-                'price': req.service_price,
-                'status': req.status,
-                'address': req.address,
-                'scheduled_date': req.scheduled_date
-            })
+        data = ServiceRequestSerializer.serialize(requests)
             
         return JsonResponse({'success': True, 'requests': data})
 
@@ -507,9 +728,9 @@ def service_requests_api(request):
                 address=address
             )
             
-            ActivityLog.objects.create(
-                user=request.user,
-                action='service_requested',
+            log_activity(
+                request.user,
+                'service_requested',
                 details=f"Requested {service_name} from {provider.username}"
             )
             
@@ -591,3 +812,17 @@ def service_request_action_api(request, request_id):
             return JsonResponse({'success': False, 'error': str(e)}, status=400)
             
     return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
+
+
+@csrf_exempt
+@require_GET
+def send_queued_mail_cron(request):
+    """
+    Vercel Cron target: sends outbox mail that is due for a retry. Vercel
+    passes CRON_SECRET as a bearer token; without the setting this is disabled.
+    """
+    secret = settings.CRON_SECRET
+    if not secret or not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {secret}'):
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+    sent, failed = send_pending()
+    return JsonResponse({'success': True, 'sent': sent, 'failed': failed})
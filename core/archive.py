@@ -0,0 +1,363 @@
+"""
+ActivityLog retention: rows older than a horizon move to compressed monthly
+NDJSON archives on the local filesystem and are deleted from the table in
+bounded chunks.
+
+Layout of the archive directory:
+- activity-YYYY-MM.ndjson.gz: one file per month. Each archiving run appends
+  a gzip member, and gzip readers see the members as one stream.
+- index.json: per month, the file name, row count, time range and user ids,
+  so searches can skip months. It also holds the ids of the chunk being
+  deleted, so an interrupted run finishes that delete instead of archiving
+  the rows twice. Archiving is at-least-once: a crash between writing a chunk
+  and recording it can duplicate that chunk in the archive, but never loses it.
+
+On PostgreSQL the table can optionally be range-partitioned by month. Whole
+months past the horizon are then archived and dropped as partitions rather
+than deleted row by row. The conversion is a manual, one-way schema change
+that Django's models and migrations don't know about; see
+convert_to_partitioned().
+"""
+import datetime
+import gzip
+import json
+import os
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ActivityLog
+
+FIELDS = ('id', 'user_id', 'action', 'details', 'ip_address', 'created_at')
+TABLE = ActivityLog._meta.db_table
+
+
+def month_key(value):
+    return value.strftime('%Y-%m')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class ActivityArchive:
+    """Monthly archive files plus their index.json in `directory`."""
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self.index_path = os.path.join(self.directory, 'index.json')
+        self.index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as index_file:
+                return json.load(index_file)
+        except FileNotFoundError:
+            return {'months': {}, 'pending_delete': []}
+
+    def save_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as index_file:
+            json.dump(self.index, index_file, indent=1, sort_keys=True)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    @property
+    def months(self):
+        return self.index['months']
+
+    def path(self, month):
+        return os.path.join(self.directory, f'activity-{month}.ndjson.gz')
+
+    def append(self, month, rows):
+        """
+        Durably append `rows` (an iterable of dicts of FIELDS) to the month's
+        file and update its index entry; call save_index() afterwards.
+        Returns the number of rows written.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        count = 0
+        first_at = last_at = None
+        user_ids = set()
+        with open(self.path(month), 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as archive_file:
+                for row in rows:
+                    archive_file.write((json.dumps(row) + '\n').encode('utf-8'))
+                    count += 1
+                    user_ids.add(row['user_id'])
+                    first_at = min(first_at or row['created_at'], row['created_at'])
+                    last_at = max(last_at or row['created_at'], row['created_at'])
+            raw.flush()
+            os.fsync(raw.fileno())
+        if not count:
+            return 0
+
+        entry = self.months.setdefault(month, {
+            'file': os.path.basename(self.path(month)),
+            'rows': 0,
+            'first_at': None,
+            'last_at': None,
+            'user_ids': [],
+        })
+        entry['rows'] += count
+        entry['first_at'] = min(entry['first_at'] or first_at, first_at)
+        entry['last_at'] = max(entry['last_at'] or last_at, last_at)
+        entry['user_ids'] = sorted(set(entry['user_ids']) | user_ids)
+        return count
+
+    def read(self, month):
+        if month not in self.months:
+            raise ArchiveError(f'No archive for {month}')
+        with gzip.open(self.path(month), 'rt', encoding='utf-8') as archive_file:
+            for line in archive_file:
+                yield json.loads(line)
+
+    def search(self, user_id=None, action=None, month=None):
+        """Yield archived rows matching all given filters, oldest month first."""
+        for key in sorted(self.months):
+            if month and key != month:
+                continue
+            if user_id is not None and user_id not in self.months[key]['user_ids']:
+                continue
+            for row in self.read(key):
+                if user_id is not None and row['user_id'] != user_id:
+                    continue
+                if action and row['action'] != action:
+                    continue
+                yield row
+
+    def restore(self, month, chunk_size=5000):
+        """
+        Re-insert a month into the table (keeping ids), then drop it from the
+        archive. If it is still past the horizon, the next run archives it again.
+        Returns the number of rows inserted; rows whose id is already in the
+        table are skipped and not counted.
+        """
+        rows = []
+        restored = 0
+        with transaction.atomic():
+            for row in self.read(month):
+                rows.append(ActivityLog(**{**row, 'created_at': parse_datetime(row['created_at'])}))
+                if len(rows) >= chunk_size:
+                    restored += _insert_missing(rows)
+                    rows = []
+            if rows:
+                restored += _insert_missing(rows)
+        del self.months[month]
+        self.save_index()
+        os.unlink(self.path(month))
+        return restored
+
+    def finish_pending_delete(self):
+        """Complete a delete interrupted after its rows were archived."""
+        ids = self.index.get('pending_delete') or []
+        if ids:
+            _delete_ids(ids)
+            self.index['pending_delete'] = []
+            self.save_index()
+        return len(ids)
+
+
+def _insert_missing(rows):
+    # bulk_create(ignore_conflicts=True) returns every object it was given, so
+    # count the rows actually inserted from the table itself.
+    ids = [row.id for row in rows]
+    existing = ActivityLog.objects.filter(id__in=ids)
+    before = existing.count()
+    ActivityLog.objects.bulk_create(rows, ignore_conflicts=True)
+    return existing.count() - before
+
+
+def _delete_ids(ids):
+    # _raw_delete: a plain DELETE, without loading rows or per-row post_delete
+    # signals (which would rebuild dashboard summaries for history nobody shows).
+    ActivityLog.objects.filter(id__in=ids)._raw_delete(ActivityLog.objects.db)
+
+
+def _row(values):
+    row = dict(zip(FIELDS, values))
+    row['created_at'] = row['created_at'].isoformat()
+    return row
+
+
+def archive_before(archive, cutoff, chunk_size=5000, dry_run=False):
+    """
+    Archive and delete every row created before `cutoff`, `chunk_size` rows at
+    a time. Each chunk is fsynced to its month files and recorded in the index
+    before it is deleted. Returns {month: rows archived}.
+    """
+    archive.finish_pending_delete()
+    queryset = ActivityLog.objects.filter(created_at__lt=cutoff).order_by('id').values_list(*FIELDS)
+    archived = {}
+    last_id = 0
+    while True:
+        chunk = [_row(values) for values in queryset.filter(id__gt=last_id)[:chunk_size]]
+        if not chunk:
+            break
+        last_id = chunk[-1]['id']
+
+        by_month = {}
+        for row in chunk:
+            by_month.setdefault(row['created_at'][:7], []).append(row)
+        for month, rows in by_month.items():
+            archived[month] = archived.get(month, 0) + len(rows)
+        if dry_run:
+            continue
+
+        for month, rows in by_month.items():
+            archive.append(month, rows)
+        archive.index['pending_delete'] = [row['id'] for row in chunk]
+        archive.save_index()
+        archive.finish_pending_delete()
+    return archived
+
+
+# PostgreSQL range partitioning by month.
+
+def _month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(value):
+    return (value.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+def _partition_name(month_start):
+    return f'{TABLE}_p{month_start:%Y%m}'
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+            'WHERE c.relname = %s AND pg_table_is_visible(c.oid)',
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def monthly_partitions():
+    """Return [(name, month_start)] of the table's monthly partitions, oldest first."""
+    prefix = f'{TABLE}_p'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s',
+            [TABLE],
+        )
+        names = [name for (name,) in cursor.fetchall() if name.startswith(prefix)]
+    partitions = []
+    for name in names:
+        stamp = name[len(prefix):]
+        if len(stamp) == 6 and stamp.isdigit():
+            start = datetime.datetime(int(stamp[:4]), int(stamp[4:]), 1, tzinfo=datetime.timezone.utc)
+            partitions.append((name, start))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def ensure_partitions(months_ahead=3):
+    """Create monthly partitions from the current month through `months_ahead` ahead."""
+    month = _month_start(timezone.now().astimezone(datetime.timezone.utc))
+    existing = {name for name, _ in monthly_partitions()}
+    created = []
+    with connection.cursor() as cursor:
+        for _ in range(months_ahead + 1):
+            name = _partition_name(month)
+            if name not in existing:
+                cursor.execute(
+                    f'CREATE TABLE {connection.ops.quote_name(name)} PARTITION OF {connection.ops.quote_name(TABLE)} '
+                    'FOR VALUES FROM (%s) TO (%s)',
+                    [month, _next_month(month)],
+                )
+                created.append(name)
+            month = _next_month(month)
+    return created
+
+
+def convert_to_partitioned(months_ahead=3):
+    """
+    Rebuild the table as a monthly range-partitioned table, copying existing
+    rows. Runs in one transaction and holds an exclusive lock for the copy.
+
+    This is an unmanaged schema change, run by hand with
+    `archive_activity_logs --partition --convert`. The primary key becomes
+    (id, created_at), as PostgreSQL requires the partition key in unique
+    constraints. ActivityLog and the migrations still describe a plain table
+    with `id` as its key: ids stay unique because they all come from the same
+    identity, but the database no longer enforces it. There is no way back
+    short of rebuilding the table, and later migrations touching this table
+    must be checked against the partitioned layout.
+    """
+    if connection.vendor != 'postgresql':
+        raise ArchiveError('Partitioning is only supported on PostgreSQL')
+    if is_partitioned():
+        return []
+
+    qn = connection.ops.quote_name
+    legacy = f'{TABLE}_unpartitioned'
+    user_table = ActivityLog._meta.get_field('user').related_model._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {qn(TABLE)} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'SELECT MIN(created_at) FROM {qn(TABLE)}')
+        oldest = cursor.fetchone()[0] or timezone.now()
+        cursor.execute(f'ALTER TABLE {qn(TABLE)} RENAME TO {qn(legacy)}')
+        cursor.execute(
+            f'CREATE TABLE {qn(TABLE)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            'PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(f'CREATE TABLE {qn(TABLE + "_default")} PARTITION OF {qn(TABLE)} DEFAULT')
+
+        month = _month_start(oldest.astimezone(datetime.timezone.utc))
+        current = _month_start(timezone.now().astimezone(datetime.timezone.utc))
+        while month <= current:
+            cursor.execute(
+                f'CREATE TABLE {qn(_partition_name(month))} PARTITION OF {qn(TABLE)} FOR VALUES FROM (%s) TO (%s)',
+                [month, _next_month(month)],
+            )
+            month = _next_month(month)
+
+        cursor.execute(f'INSERT INTO {qn(TABLE)} SELECT * FROM {qn(legacy)}')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE((SELECT MAX(id) FROM {qn(TABLE)}), 1))",
+            [TABLE],
+        )
+        cursor.execute(f'DROP TABLE {qn(legacy)}')
+        # Recreate constraints and indexes under their original names.
+        cursor.execute(f'ALTER TABLE {qn(TABLE)} ADD PRIMARY KEY (id, created_at)')
+        cursor.execute(
+            f'ALTER TABLE {qn(TABLE)} ADD CONSTRAINT {qn(TABLE + "_user_id_fk")} FOREIGN KEY (user_id) '
+            f'REFERENCES {qn(user_table)} (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+        for index in ActivityLog._meta.indexes:
+            cursor.execute(str(index.create_sql(ActivityLog, connection.schema_editor())))
+    return ensure_partitions(months_ahead)
+
+
+def archive_partitions(archive, cutoff, chunk_size=5000, dry_run=False):
+    """
+    Archive every monthly partition that ends on or before `cutoff`, then drop
+    it. Rows in later months, and in the default partition, are left alone.
+    """
+    archived = {}
+    qn = connection.ops.quote_name
+    for name, start in monthly_partitions():
+        end = _next_month(start)
+        if end > cutoff:
+            break
+        month = month_key(start)
+        partition = ActivityLog.objects.filter(created_at__gte=start, created_at__lt=end)
+        if dry_run:
+            archived[month] = partition.count()
+            continue
+        rows = (_row(values) for values in partition.order_by('id').values_list(*FIELDS).iterator(chunk_size=chunk_size))
+        archived[month] = archive.append(month, rows)
+        archive.save_index()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(name)}')
+            cursor.execute(f'DROP TABLE {qn(name)}')
+    return archived
@@ -0,0 +1,284 @@
+"""
+Full per-user data exports as CSV, NDJSON or a FHIR-style Bundle.
+
+Rows are read per type with queryset.iterator(chunk_size), which uses a
+server-side cursor on PostgreSQL (set DISABLE_SERVER_SIDE_CURSORS when going
+through a transaction-mode pooler). They are encoded as they are read, so
+memory stays flat however long the history is. Output may be gzipped on the
+fly.
+
+Small exports can be streamed straight to the client (export_api). Large ones
+run as an ExportJob. The job writes its artifact to default storage, either
+in a background thread started after commit, or from
+`manage.py run_export_jobs` on hosts where threads don't outlive the request
+(set EXPORT_RUN_IN_THREAD = False there).
+"""
+import csv
+import json
+import logging
+import tempfile
+import threading
+import uuid
+import zlib
+
+from django.conf import settings
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .models import ExportJob, HealthRecord, Medicine
+from .sync import SYNC_MODELS
+
+logger = logging.getLogger(__name__)
+
+# Format -> (content type, file extension).
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'fhir': ('application/fhir+json', 'json'),
+}
+CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+# Encoded text is handed on (and compressed) in pieces of about this many characters.
+BUFFER_SIZE = 64 * 1024
+
+# FHIR: only vitals and medicines have a natural FHIR shape.
+FHIR_TYPES = ('health_records', 'medicines')
+LOINC = 'http://loinc.org'
+UCUM = 'http://unitsofmeasure.org'
+# HealthRecord field -> (LOINC code, display, UCUM unit).
+VITAL_CODES = {
+    'heart_rate': ('8867-4', 'Heart rate', '/min'),
+    'weight': ('29463-7', 'Body weight', 'kg'),
+    'temperature': ('8310-5', 'Body temperature', 'Cel'),
+    'oxygen_level': ('59408-5', 'Oxygen saturation in Arterial blood by Pulse oximetry', '%'),
+    'blood_sugar': ('2339-0', 'Glucose [Mass/volume] in Blood', 'mg/dL'),
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_types(value):
+    """`value` is a list or comma-separated string of SYNC_MODELS keys; empty means all."""
+    if isinstance(value, str):
+        value = [item.strip() for item in value.split(',') if item.strip()]
+    if not value:
+        return list(SYNC_MODELS)
+    unknown = [key for key in value if key not in SYNC_MODELS]
+    if unknown:
+        raise ExportError(f"Unknown types: {', '.join(map(str, unknown))}")
+    return [key for key in SYNC_MODELS if key in value]
+
+
+def validate_format(fmt):
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    return fmt
+
+
+def columns(model):
+    return [field.attname for field in model._meta.concrete_fields if field.name != 'user']
+
+
+def iter_rows(user_id, key, fields=None):
+    model = SYNC_MODELS[key]
+    return (
+        model.objects.filter(user_id=user_id)
+        .order_by('id')
+        .values(*(fields or columns(model)))
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+class _Echo:
+    """File-like object for csv.writer that returns the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(user_id, types, stats):
+    # One section per type: a header row, then its rows; record_type leads every row.
+    writer = csv.writer(_Echo())
+    for key in types:
+        fields = columns(SYNC_MODELS[key])
+        yield writer.writerow(['record_type', *fields])
+        for row in iter_rows(user_id, key, fields):
+            stats['rows'] += 1
+            yield writer.writerow([key, *(row[field] for field in fields)])
+
+
+def iter_ndjson(user_id, types, stats):
+    encode = DjangoJSONEncoder().encode
+    for key in types:
+        for row in iter_rows(user_id, key):
+            stats['rows'] += 1
+            yield encode({'record_type': key, **row}) + '\n'
+
+
+def _quantity(value, unit):
+    return {'value': float(value), 'unit': unit, 'system': UCUM, 'code': unit}
+
+
+def _concept(code, display):
+    return {'coding': [{'system': LOINC, 'code': code, 'display': display}], 'text': display}
+
+
+def fhir_observations(user_id, record):
+    """Vital-sign Observations for one HealthRecord values() row."""
+    base = {
+        'resourceType': 'Observation',
+        'status': 'final',
+        'category': [{'coding': [{
+            'system': 'http://terminology.hl7.org/CodeSystem/observation-category',
+            'code': 'vital-signs',
+        }]}],
+        'subject': {'reference': f'Patient/{user_id}'},
+        'effectiveDateTime': record['recorded_at'].isoformat(),
+    }
+    systolic = record['blood_pressure_systolic']
+    diastolic = record['blood_pressure_diastolic']
+    if systolic and diastolic:
+        yield {
+            **base,
+            'id': f"health-record-{record['id']}-bp",
+            'code': _concept('85354-9', 'Blood pressure panel'),
+            'component': [
+                {'code': _concept('8480-6', 'Systolic blood pressure'), 'valueQuantity': _quantity(systolic, 'mm[Hg]')},
+                {'code': _concept('8462-4', 'Diastolic blood pressure'), 'valueQuantity': _quantity(diastolic, 'mm[Hg]')},
+            ],
+        }
+    for field, (code, display, unit) in VITAL_CODES.items():
+        if record[field]:
+            yield {
+                **base,
+                'id': f"health-record-{record['id']}-{code}",
+                'code': _concept(code, display),
+                'valueQuantity': _quantity(record[field], unit),
+            }
+
+
+def fhir_medication_statement(user_id, medicine, frequency_labels):
+    period = {'start': medicine['start_date'].isoformat()}
+    if medicine['end_date']:
+        period['end'] = medicine['end_date'].isoformat()
+    return {
+        'resourceType': 'MedicationStatement',
+        'id': f"medicine-{medicine['id']}",
+        'status': 'active' if medicine['is_active'] else 'completed',
+        'medicationCodeableConcept': {'text': medicine['name']},
+        'subject': {'reference': f'Patient/{user_id}'},
+        'effectivePeriod': period,
+        'dosage': [{'text': f"{medicine['dosage']}, {frequency_labels.get(medicine['frequency'], medicine['frequency'])}"}],
+    }
+
+
+def iter_fhir(user_id, types, stats):
+    encode = DjangoJSONEncoder().encode
+    frequency_labels = dict(Medicine.FREQUENCY_CHOICES)
+    yield '{"resourceType": "Bundle", "type": "collection", '
+    yield f'"timestamp": {encode(timezone.now().isoformat())}, "entry": ['
+    first = True
+    for key in types:
+        if key not in FHIR_TYPES:
+            continue
+        for row in iter_rows(user_id, key):
+            stats['rows'] += 1
+            if SYNC_MODELS[key] is HealthRecord:
+                resources = fhir_observations(user_id, row)
+            else:
+                resources = [fhir_medication_statement(user_id, row, frequency_labels)]
+            for resource in resources:
+                yield ('' if first else ', ') + encode({'fullUrl': f"urn:uuid:{uuid.uuid4()}", 'resource': resource})
+                first = False
+    yield ']}'
+
+
+FORMAT_WRITERS = {
+    'csv': iter_csv,
+    'ndjson': iter_ndjson,
+    'fhir': iter_fhir,
+}
+
+
+def iter_export(user_id, fmt, types, compress=False, stats=None):
+    """
+    Yield the encoded export as bytes, gzipped when `compress` is set. The
+    number of exported rows is counted in `stats['rows']`.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault('rows', 0)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    buffer = []
+    size = 0
+    for text in FORMAT_WRITERS[fmt](user_id, types, stats):
+        buffer.append(text)
+        size += len(text)
+        if size >= BUFFER_SIZE:
+            data = ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = ''.join(buffer).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def export_filename(fmt, compress, when=None):
+    extension = EXPORT_FORMATS[fmt][1]
+    stamp = (when or timezone.now()).strftime('%Y%m%d-%H%M%S')
+    return f"healthtrack-export-{stamp}.{extension}{'.gz' if compress else ''}"
+
+
+def content_type(fmt, compress):
+    return 'application/gzip' if compress else EXPORT_FORMATS[fmt][0]
+
+
+def run_export_job(job_id):
+    """
+    Claim and run a pending job. Returns False if another worker claimed it
+    first. Failures are recorded on the job rather than raised.
+    """
+    now = timezone.now()
+    if not ExportJob.objects.filter(pk=job_id, status='pending').update(status='running', started_at=now):
+        return False
+    job = ExportJob.objects.get(pk=job_id)
+    stats = {'rows': 0}
+    try:
+        with tempfile.TemporaryFile() as artifact:
+            for data in iter_export(job.user_id, job.format, job.types, job.compress, stats):
+                artifact.write(data)
+            artifact.seek(0)
+            # Random name: artifacts must not be guessable if the storage is public.
+            extension = EXPORT_FORMATS[job.format][1] + ('.gz' if job.compress else '')
+            job.file.save(f'{uuid.uuid4().hex}.{extension}', File(artifact), save=False)
+        job.status = 'done'
+    except Exception as e:
+        logger.exception('Export job %s failed', job_id)
+        job.status = 'failed'
+        job.error = str(e)
+    job.row_count = stats['rows']
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'status', 'error', 'row_count', 'finished_at'])
+    return True
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        run_export_job(job_id)
+    finally:
+        connections.close_all()
+
+
+def start_export_job(job):
+    """Run `job` in a background thread once the creating transaction commits."""
+    if getattr(settings, 'EXPORT_RUN_IN_THREAD', True):
+        transaction.on_commit(
+            lambda: threading.Thread(target=_run_in_thread, args=(job.pk,), daemon=True).start()
+        )
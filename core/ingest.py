@@ -0,0 +1,145 @@
+"""
+Batch ingestion of HealthRecord readings from wearables and device syncs.
+
+A batch is validated in one pass, de-duplicated on (user, recorded_at) both
+within itself and against stored readings, and written with chunked
+bulk_create inside a single transaction. The unique constraint on
+(user, recorded_at) backs the de-duplication: a reading that a concurrent
+batch stores between the check and the insert is skipped by the database.
+"""
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import DashboardSummary, HealthRecord
+from .signals import update_summary
+from .sync import record_changes
+from .versioning import bump_data_version
+
+READING_FIELDS = [
+    'blood_pressure_systolic', 'blood_pressure_diastolic', 'blood_sugar',
+    'weight', 'heart_rate', 'temperature', 'oxygen_level',
+]
+MAX_BATCH_SIZE = 5000
+CHUNK_SIZE = 500
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_batch(body, content_type):
+    """
+    Accept a JSON array, a {"records": [...]} object, or NDJSON (one reading
+    per line, for content types application/x-ndjson and application/ndjson).
+    """
+    try:
+        if content_type in ('application/x-ndjson', 'application/ndjson'):
+            items = [json.loads(line) for line in body.decode('utf-8').splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+            if isinstance(items, dict):
+                items = items.get('records')
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise BatchError(f'Malformed body: {e}')
+
+    if not isinstance(items, list):
+        raise BatchError('Expected a JSON array of readings')
+    if len(items) > MAX_BATCH_SIZE:
+        raise BatchError(f'At most {MAX_BATCH_SIZE} readings per batch')
+    return items
+
+
+def validate_reading(item):
+    """Return (field values, errors) for one reading."""
+    if not isinstance(item, dict):
+        return None, {'__all__': 'Reading must be an object'}
+
+    errors = {}
+    values = {}
+    recorded_at = item.get('recorded_at')
+    try:
+        parsed = parse_datetime(recorded_at) if isinstance(recorded_at, str) else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        errors['recorded_at'] = 'An ISO 8601 datetime is required'
+    else:
+        values['recorded_at'] = timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+    for name in READING_FIELDS:
+        value = item.get(name)
+        if value in (None, ''):
+            continue
+        try:
+            values[name] = HealthRecord._meta.get_field(name).clean(value, None)
+        except ValidationError as e:
+            errors[name] = ' '.join(e.messages)
+
+    if not errors and not any(name in values for name in READING_FIELDS):
+        errors['__all__'] = 'At least one measurement is required'
+    if isinstance(item.get('notes'), str):
+        values['notes'] = item['notes']
+    return values, errors
+
+
+def stored_ids(user_id, timestamps):
+    """Ids of the user's readings at `timestamps`, in the same order."""
+    ids = {}
+    for start in range(0, len(timestamps), CHUNK_SIZE):
+        ids.update(
+            HealthRecord.objects.filter(user_id=user_id, recorded_at__in=timestamps[start:start + CHUNK_SIZE])
+            .values_list('recorded_at', 'id')
+        )
+    return [ids[recorded_at] for recorded_at in timestamps]
+
+
+def ingest_readings(user_id, items):
+    """
+    Validate and store `items` for the user. Returns one result per item, in
+    order: {'index', 'status': created|duplicate|invalid, ['id'], ['errors']}.
+    """
+    results = []
+    pending = {}  # recorded_at -> (index, values)
+    for index, item in enumerate(items):
+        values, errors = validate_reading(item)
+        if errors:
+            results.append({'index': index, 'status': 'invalid', 'errors': errors})
+        elif values['recorded_at'] in pending:
+            results.append({'index': index, 'status': 'duplicate'})
+        else:
+            pending[values['recorded_at']] = (index, values)
+            results.append(None)
+
+    with transaction.atomic():
+        timestamps = list(pending)
+        for start in range(0, len(timestamps), CHUNK_SIZE):
+            existing = HealthRecord.objects.filter(
+                user_id=user_id, recorded_at__in=timestamps[start:start + CHUNK_SIZE]
+            ).values_list('recorded_at', flat=True)
+            for recorded_at in existing:
+                if recorded_at in pending:
+                    index, _ = pending.pop(recorded_at)
+                    results[index] = {'index': index, 'status': 'duplicate'}
+
+        # ignore_conflicts leaves pk unset, so the new rows are looked up by
+        # their timestamps. A reading that lost the race to a concurrent batch
+        # is reported as created by both; the table holds it once.
+        HealthRecord.objects.bulk_create(
+            [HealthRecord(user_id=user_id, **values) for _, values in pending.values()],
+            batch_size=CHUNK_SIZE,
+            ignore_conflicts=True,
+        )
+        ids = stored_ids(user_id, list(pending))
+        for (index, _), record_id in zip(pending.values(), ids):
+            results[index] = {'index': index, 'status': 'created', 'id': record_id}
+
+        if ids:
+            # bulk_create skips post_save, so feed the summary and change feed here.
+            update_summary(user_id, DashboardSummary.refresh_latest_record)
+            record_changes(HealthRecord, user_id, ids)
+            bump_data_version(user_id)
+    return results
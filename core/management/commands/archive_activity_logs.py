@@ -0,0 +1,99 @@
+import datetime
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core import archive as activity_archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move ActivityLog rows older than the retention horizon into compressed monthly "
+        "archives and delete them in chunks. Also lists, searches and restores archived "
+        "months, and on PostgreSQL can convert the table to monthly partitions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ACTIVITY_LOG_RETENTION_DAYS,
+                            help='Archive rows older than this many days')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--dir', default=str(settings.ACTIVITY_ARCHIVE_DIR), help='Archive directory')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be archived')
+
+        actions = parser.add_mutually_exclusive_group()
+        actions.add_argument('--list', action='store_true', help='List archived months')
+        actions.add_argument('--search', action='store_true',
+                             help='Print archived rows as NDJSON (filter with --user, --action, --month)')
+        actions.add_argument('--restore', metavar='YYYY-MM', help='Re-insert an archived month into the table')
+        actions.add_argument('--partition', action='store_true',
+                             help='PostgreSQL: create upcoming monthly partitions of a partitioned table')
+        parser.add_argument('--convert', action='store_true',
+                            help='With --partition: rebuild an unpartitioned table as a partitioned one. '
+                                 'This is a one-way schema change outside the migrations; see '
+                                 'core.archive.convert_to_partitioned')
+
+        parser.add_argument('--user', type=int)
+        parser.add_argument('--action')
+        parser.add_argument('--month', metavar='YYYY-MM')
+        parser.add_argument('--months-ahead', type=int, default=3)
+
+    def handle(self, *args, **options):
+        archive = activity_archive.ActivityArchive(options['dir'])
+        try:
+            if options['list']:
+                self._list(archive)
+            elif options['search']:
+                for row in archive.search(options['user'], options['action'], options['month']):
+                    self.stdout.write(json.dumps(row))
+            elif options['restore']:
+                restored = archive.restore(options['restore'], options['chunk_size'])
+                self.stdout.write(f"Restored {restored} row(s) from {options['restore']}")
+            elif options['partition']:
+                self._partition(options['months_ahead'], options['convert'])
+            else:
+                self._archive(archive, options)
+        except activity_archive.ArchiveError as e:
+            raise CommandError(str(e))
+
+    def _list(self, archive):
+        for month, entry in sorted(archive.months.items()):
+            self.stdout.write(
+                f"{month}  {entry['rows']:>9} rows  {len(entry['user_ids']):>6} users  {entry['file']}"
+            )
+
+    def _partition(self, months_ahead, convert):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning is only supported on PostgreSQL')
+        if activity_archive.is_partitioned():
+            created = activity_archive.ensure_partitions(months_ahead)
+        elif not convert:
+            raise CommandError(
+                'The activity log table is not partitioned. Converting it changes its primary key '
+                'outside the migrations; rerun with --convert to do so.'
+            )
+        else:
+            created = activity_archive.convert_to_partitioned(months_ahead)
+            self.stdout.write('Converted the activity log to a partitioned table')
+        for name in created:
+            self.stdout.write(f'Created partition {name}')
+
+    def _archive(self, archive, options):
+        cutoff = timezone.now() - datetime.timedelta(days=options['days'])
+        archived = {}
+        if activity_archive.is_partitioned():
+            # Whole months past the horizon go by dropping their partition.
+            archived = activity_archive.archive_partitions(
+                archive, cutoff, options['chunk_size'], options['dry_run']
+            )
+        for month, count in activity_archive.archive_before(
+            archive, cutoff, options['chunk_size'], options['dry_run']
+        ).items():
+            archived[month] = archived.get(month, 0) + count
+
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        for month, count in sorted(archived.items()):
+            self.stdout.write(f'{verb} {count} row(s) from {month}')
+        self.stdout.write(f"{verb} {sum(archived.values())} row(s) older than {cutoff:%Y-%m-%d}")
@@ -0,0 +1,63 @@
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.activity import ActivityBuffer
+from core.models import ActivityLog
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-call ActivityLog.objects.create with the buffered writer: the "
+        "cost on the caller's path and end-to-end throughput. Rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=5000)
+        parser.add_argument('--batch', type=int, default=100, help='Events per flush')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options['events'], options['batch'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _run(self, events, batch):
+        User = get_user_model()
+        user = User.objects.create_user(username='bench-activity', email='bench-activity@example.com')
+
+        self.stdout.write(f"{'case':<32}{'caller us/event':>17}{'events/s':>12}")
+
+        start = time.perf_counter()
+        for i in range(events):
+            ActivityLog.objects.create(user=user, action='login', details=f'event {i}')
+        elapsed = time.perf_counter() - start
+        self._report('objects.create', elapsed, elapsed, events)
+
+        with tempfile.TemporaryDirectory() as spool_dir:
+            for name, directory in (('buffered', None), ('buffered + spool', spool_dir)):
+                # Thresholds the background thread never reaches; flushes happen here,
+                # on this connection, so they stay inside the rolled-back transaction.
+                buffer = ActivityBuffer(max_size=events + 1, flush_interval=3600, spool_dir=directory)
+                caller = 0.0
+                start = time.perf_counter()
+                for i in range(events):
+                    t = time.perf_counter()
+                    buffer.log(user.pk, 'login', f'event {i}')
+                    caller += time.perf_counter() - t
+                    if buffer.pending() >= batch:
+                        buffer.flush()
+                buffer.flush()
+                self._report(name, caller, time.perf_counter() - start, events)
+
+    def _report(self, name, caller, total, events):
+        self.stdout.write(f'{name:<32}{caller / events * 1e6:>17.1f}{events / total:>12.0f}')
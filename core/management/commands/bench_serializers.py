@@ -0,0 +1,124 @@
+import datetime
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import HealthRecord, Medicine
+from core.serializers import HealthRecordSerializer, MedicineSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_health_records(queryset):
+    # The per-instance loop health_track_api used before the serializers.
+    return [
+        {
+            'recorded_at': record.recorded_at.strftime('%Y-%m-%d %H:%M'),
+            'blood_pressure_systolic': record.blood_pressure_systolic,
+            'blood_pressure_diastolic': record.blood_pressure_diastolic,
+            'blood_sugar': str(record.blood_sugar) if record.blood_sugar else None,
+            'weight': str(record.weight) if record.weight else None,
+            'heart_rate': record.heart_rate,
+            'oxygen_level': str(record.oxygen_level) if record.oxygen_level else None,
+            'bp_status': record.bp_category,
+        }
+        for record in queryset
+    ]
+
+
+def legacy_medicines(queryset):
+    return [
+        {
+            'name': med.name,
+            'dosage': med.dosage,
+            'frequency_display': med.get_frequency_display(),
+            'start_date': med.start_date.isoformat() if med.start_date else None,
+            'end_date': med.end_date.isoformat() if med.end_date else None,
+            'is_active': med.is_active,
+        }
+        for med in queryset
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-row cost of the model-instance list loops with the values()-based "
+        "serializers. Seeds rows inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options['sizes'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _run(self, sizes, repeat):
+        User = get_user_model()
+        user = User.objects.create_user(username='bench-serializers', email='bench-serializers@example.com')
+        now = timezone.now()
+        seeded = 0
+
+        self.stdout.write(f"{'case':<34}{'rows':>8}{'us/row':>10}")
+        for size in sorted(sizes):
+            HealthRecord.objects.bulk_create(
+                [
+                    HealthRecord(
+                        user=user,
+                        blood_pressure_systolic=100 + i % 60,
+                        blood_pressure_diastolic=65 + i % 30,
+                        blood_sugar=Decimal('95.50'),
+                        weight=Decimal('72.40'),
+                        heart_rate=60 + i % 40,
+                        oxygen_level=97,
+                        recorded_at=now - datetime.timedelta(minutes=i),
+                    )
+                    for i in range(seeded, size)
+                ],
+                batch_size=2000,
+            )
+            Medicine.objects.bulk_create(
+                [
+                    Medicine(
+                        user=user,
+                        name=f'Medicine {i}',
+                        dosage='10mg',
+                        frequency=('once', 'twice', 'thrice', 'asneeded')[i % 4],
+                        start_date=now.date(),
+                        is_active=i % 3 != 0,
+                    )
+                    for i in range(seeded, size)
+                ],
+                batch_size=2000,
+            )
+            seeded = size
+
+            records = HealthRecord.objects.filter(user=user).with_bp_status()
+            medicines = Medicine.objects.filter(user=user)
+            cases = [
+                ('health records: model loop', lambda: legacy_health_records(records.all())),
+                ('health records: serializer', lambda: HealthRecordSerializer.serialize(records)),
+                ('medicines: model loop', lambda: legacy_medicines(medicines.all())),
+                ('medicines: serializer', lambda: MedicineSerializer.serialize(medicines)),
+            ]
+            for name, fn in cases:
+                self._report(name, size, min(self._time(fn) for _ in range(repeat)))
+
+    def _time(self, fn):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+
+    def _report(self, name, size, seconds):
+        self.stdout.write(f'{name:<34}{size:>8}{seconds / size * 1e6:>10.2f}')
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.queryplans import SUPPORTED_VENDORS, capture_queries, explain, plan_problems, sample_data
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN for every query issued by the per-user API endpoints and OTP "
+        "helpers, and fail if any of them needs a full table scan or a sort."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not only failures')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SUPPORTED_VENDORS:
+            raise CommandError(f'Plan checks are not implemented for {connection.vendor}')
+
+        failures = []
+        checked = 0
+        try:
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    # Tiny sample tables would otherwise always be seq-scanned.
+                    with connection.cursor() as cursor:
+                        cursor.execute('SET LOCAL enable_seqscan = off')
+
+                for label, queries in capture_queries(*sample_data()):
+                    for sql in queries:
+                        if not sql.lstrip().upper().startswith('SELECT'):
+                            continue
+                        checked += 1
+                        plan = explain(sql)
+                        problems = plan_problems(plan)
+                        if problems or options['verbose_plans']:
+                            self.stdout.write(f'{label}: {sql}')
+                            for line in plan:
+                                self.stdout.write(f'    {line}')
+                        if problems:
+                            failures.append(f"{label}: {', '.join(problems)}")
+                raise Rollback
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError('Queries without a usable index:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS(f'{checked} queries checked, all index-backed.'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.activity import activity_buffer, recover_spool
+
+
+class Command(BaseCommand):
+    help = "Write buffered activity events and replay spool segments left by crashed or failed writers."
+
+    def handle(self, *args, **options):
+        flushed = activity_buffer.flush()
+        recovered = recover_spool(activity_buffer.spool_dir) if activity_buffer.spool_dir else 0
+        self.stdout.write(f'Flushed {flushed} buffered and {recovered} spooled activity event(s)')
@@ -0,0 +1,46 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.export import run_export_job
+from core.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Run pending data export jobs, requeue jobs whose worker died, and delete "
+        "export artifacts older than EXPORT_RETENTION_DAYS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requeue-after', type=int, default=60,
+            help='Minutes after which a running job is assumed dead and requeued'
+        )
+        parser.add_argument('--retention-days', type=int, default=settings.EXPORT_RETENTION_DAYS)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        stale = ExportJob.objects.filter(
+            status='running', started_at__lt=now - datetime.timedelta(minutes=options['requeue_after'])
+        ).update(status='pending', started_at=None)
+        if stale:
+            self.stdout.write(f'Requeued {stale} stale job(s)')
+
+        for job_id in ExportJob.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True):
+            if run_export_job(job_id):
+                job = ExportJob.objects.get(pk=job_id)
+                self.stdout.write(f'Export #{job_id}: {job.status} ({job.row_count} rows)')
+
+        expired = ExportJob.objects.filter(created_at__lt=now - datetime.timedelta(days=options['retention_days']))
+        removed = 0
+        for job in expired.exclude(status__in=['pending', 'running']).iterator():
+            if job.file:
+                job.file.delete(save=False)
+            job.delete()
+            removed += 1
+        if removed:
+            self.stdout.write(f'Deleted {removed} expired export(s)')
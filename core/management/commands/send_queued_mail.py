@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.outbox import send_pending
+
+
+class Command(BaseCommand):
+    help = "Send due messages from the email outbox, batching them over one SMTP connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='Keep running, polling the outbox at this interval')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_pending()
+            if sent or failed or not options['loop']:
+                self.stdout.write(f'Sent {sent} message(s), {failed} failed')
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_appointment_service_servicerequest'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('display_name', models.CharField(blank=True, max_length=300)),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('latest_record', models.JSONField(blank=True, null=True)),
+                ('active_medicines', models.IntegerField(default=0)),
+                ('latest_mental_health', models.JSONField(blank=True, null=True)),
+                ('recent_activities', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='dashboard_summary', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
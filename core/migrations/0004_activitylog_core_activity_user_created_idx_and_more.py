@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_dashboardsummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['user', '-created_at'], name='core_activity_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'date', 'time'], name='core_appt_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'date', 'time'], name='core_appt_doctor_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthrecord',
+            index=models.Index(fields=['user', '-recorded_at', '-id'], name='core_health_user_recorded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='insurancepolicy',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='core_policy_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='insurancepolicy',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='core_policy_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lifestylelog',
+            index=models.Index(fields=['user', '-recorded_at', '-id'], name='core_lifestyle_user_rec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='core_medicine_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='core_medicine_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mentalhealthlog',
+            index=models.Index(fields=['user', '-recorded_at', '-id'], name='core_mental_user_recorded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['user', '-prescription_date', '-id'], name='core_rx_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='core_rx_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['patient', '-created_at'], name='core_svcreq_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['provider', '-created_at'], name='core_svcreq_provider_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_changeevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('ndjson', 'NDJSON'), ('fhir', 'FHIR Bundle')], max_length=10)),
+                ('types', models.JSONField(default=list)),
+                ('compress', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('file', models.FileField(blank=True, upload_to='exports/')),
+                ('row_count', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', '-created_at', '-id'], name='core_export_user_created_idx'), models.Index(condition=models.Q(('status__in', ['pending', 'running'])), fields=['status', 'created_at'], name='core_export_active_idx')],
+            },
+        ),
+    ]
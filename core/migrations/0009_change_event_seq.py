@@ -0,0 +1,53 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def number_existing_events(apps, schema_editor):
+    # Existing tokens are event ids, so existing events keep their id as seq and
+    # each user's sequence continues from there.
+    ChangeEvent = apps.get_model('core', 'ChangeEvent')
+    ChangeSequence = apps.get_model('core', 'ChangeSequence')
+    ChangeEvent.objects.update(seq=models.F('id'))
+    ChangeSequence.objects.bulk_create([
+        ChangeSequence(user_id=row['user_id'], last_seq=row['last_seq'])
+        for row in ChangeEvent.objects.values('user_id').annotate(last_seq=Max('seq'))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_outboxemail'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='change_sequence', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_seq', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='changeevent',
+            name='seq',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunPython(number_existing_events, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='changeevent',
+            name='seq',
+            field=models.BigIntegerField(),
+        ),
+        migrations.RemoveIndex(
+            model_name='changeevent',
+            name='core_change_user_seq_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='changeevent',
+            constraint=models.UniqueConstraint(fields=('user', 'seq'), name='core_change_user_seq_uniq'),
+        ),
+    ]
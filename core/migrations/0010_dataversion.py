@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_otp_hashed_codes'),
+        ('core', '0009_change_event_seq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='data_version', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('version', models.BigIntegerField()),
+            ],
+        ),
+    ]
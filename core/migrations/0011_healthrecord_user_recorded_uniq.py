@@ -0,0 +1,31 @@
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicate_readings(apps, schema_editor):
+    # Keep the first stored reading for each (user, recorded_at).
+    HealthRecord = apps.get_model('core', 'HealthRecord')
+    duplicated = (
+        HealthRecord.objects.values('user_id', 'recorded_at')
+        .annotate(first_id=Min('id'), count=Count('id'))
+        .filter(count__gt=1)
+    )
+    for row in duplicated:
+        HealthRecord.objects.filter(user_id=row['user_id'], recorded_at=row['recorded_at']).exclude(
+            id=row['first_id']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_dataversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_readings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='healthrecord',
+            constraint=models.UniqueConstraint(fields=('user', 'recorded_at'), name='core_health_user_recorded_uniq'),
+        ),
+    ]
@@ -3,10 +3,55 @@ Core models for the HealthTracker application.
 Includes models for health records, medicines, prescriptions, and more.
 """
 from django.db import models
+from django.db.models import Case, Count, Q, Value, When
 from django.conf import settings
 from django.utils import timezone
 
 
+# Blood pressure categories, in ascending severity; 'Unknown' when a reading is missing.
+BP_STATUSES = ['Normal', 'Elevated', 'High (Stage 1)', 'High (Stage 2)', 'Unknown']
+
+
+class HealthRecordQuerySet(models.QuerySet):
+    """
+    Database-side equivalent of HealthRecord.bp_status, so readings can be
+    filtered, counted and grouped by category without loading rows.
+    """
+
+    @staticmethod
+    def bp_status_expression():
+        return Case(
+            When(
+                Q(blood_pressure_systolic__isnull=True) | Q(blood_pressure_diastolic__isnull=True)
+                | Q(blood_pressure_systolic=0) | Q(blood_pressure_diastolic=0),
+                then=Value('Unknown'),
+            ),
+            When(blood_pressure_systolic__lt=120, blood_pressure_diastolic__lt=80, then=Value('Normal')),
+            When(blood_pressure_systolic__lt=130, blood_pressure_diastolic__lt=80, then=Value('Elevated')),
+            When(Q(blood_pressure_systolic__lt=140) | Q(blood_pressure_diastolic__lt=90), then=Value('High (Stage 1)')),
+            default=Value('High (Stage 2)'),
+            output_field=models.CharField(),
+        )
+
+    def with_bp_status(self):
+        # Named bp_category because bp_status is a read-only property on the model.
+        return self.annotate(bp_category=self.bp_status_expression())
+
+    def filter_bp_status(self, status):
+        return self.with_bp_status().filter(bp_category=status)
+
+    def bp_status_histogram(self):
+        """Return {category: count} for every category, including empty ones."""
+        counts = dict(
+            self.with_bp_status()
+            .order_by()
+            .values('bp_category')
+            .annotate(count=Count('id'))
+            .values_list('bp_category', 'count')
+        )
+        return {status: counts.get(status, 0) for status in BP_STATUSES}
+
+
 class HealthRecord(models.Model):
     """
     Stores daily health metrics for a user including BP, weight, and heart rate.
@@ -33,8 +78,17 @@ class HealthRecord(models.Model):
     recorded_at = models.DateTimeField(default=timezone.now)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = HealthRecordQuerySet.as_manager()
+
     class Meta:
         ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['user', '-recorded_at', '-id'], name='core_health_user_recorded_idx'),
+        ]
+        constraints = [
+            # One reading per user per instant; device re-syncs rely on it (core/ingest.py).
+            models.UniqueConstraint(fields=['user', 'recorded_at'], name='core_health_user_recorded_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.recorded_at.strftime('%Y-%m-%d')}"
@@ -44,6 +98,7 @@ class HealthRecord(models.Model):
         """
         Calculates blood pressure status based on systolic and diastolic values.
         Returns a string indicating the category (Normal, Elevated, High).
+        Keep in sync with HealthRecordQuerySet.bp_status_expression.
         """
         if not self.blood_pressure_systolic or not self.blood_pressure_diastolic:
             return 'Unknown'
@@ -84,6 +139,10 @@ class Medicine(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='core_medicine_user_created_idx'),
+            models.Index(fields=['user'], condition=models.Q(is_active=True), name='core_medicine_active_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.dosage}"
@@ -105,6 +164,10 @@ class Prescription(models.Model):
 
     class Meta:
         ordering = ['-prescription_date']
+        indexes = [
+            models.Index(fields=['user', '-prescription_date', '-id'], name='core_rx_user_date_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='core_rx_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.prescription_date}"
@@ -134,6 +197,9 @@ class MentalHealthLog(models.Model):
 
     class Meta:
         ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['user', '-recorded_at', '-id'], name='core_mental_user_recorded_idx'),
+        ]
 
 
 class InsurancePolicy(models.Model):
@@ -157,6 +223,10 @@ class InsurancePolicy(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='core_policy_user_created_idx'),
+            models.Index(fields=['user'], condition=models.Q(is_active=True), name='core_policy_active_idx'),
+        ]
 
     def __str__(self):
         return f"{self.provider_name} - {self.policy_number}"
@@ -178,6 +248,9 @@ class LifestyleLog(models.Model):
     class Meta:
         ordering = ['-recorded_at']
         unique_together = ['user', 'recorded_at']
+        indexes = [
+            models.Index(fields=['user', '-recorded_at', '-id'], name='core_lifestyle_user_rec_idx'),
+        ]
 
 
 class ActivityLog(models.Model):
@@ -198,10 +271,14 @@ class ActivityLog(models.Model):
     action = models.CharField(max_length=50, choices=ACTION_CHOICES)
     details = models.TextField(blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: buffered rows (core/activity.py) keep their enqueue time.
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='core_activity_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.action}"
@@ -242,6 +319,10 @@ class Appointment(models.Model):
 
     class Meta:
         ordering = ['date', 'time']
+        indexes = [
+            models.Index(fields=['patient', 'date', 'time'], name='core_appt_patient_date_idx'),
+            models.Index(fields=['doctor', 'date', 'time'], name='core_appt_doctor_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.patient} with {self.doctor} on {self.date}"
@@ -282,6 +363,247 @@ class ServiceRequest(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['patient', '-created_at'], name='core_svcreq_patient_idx'),
+            models.Index(fields=['provider', '-created_at'], name='core_svcreq_provider_idx'),
+        ]
 
     def __str__(self):
         return f"Request for {self.provider} from {self.patient}"
+
+
+class DashboardSummary(models.Model):
+    """
+    Denormalized per-user snapshot of everything dashboard_api shows, so the
+    dashboard is served from a single indexed read. Kept current by the
+    post_save/post_delete handlers in core/signals.py and rebuilt from the
+    source tables whenever the row is missing.
+    """
+    RECENT_ACTIVITY_LIMIT = 5
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='dashboard_summary')
+    display_name = models.CharField(max_length=300, blank=True)
+    email = models.EmailField(blank=True)
+    latest_record = models.JSONField(null=True, blank=True)
+    active_medicines = models.IntegerField(default=0)
+    latest_mental_health = models.JSONField(null=True, blank=True)
+    recent_activities = models.JSONField(default=list, blank=True)  # Newest first, capped at RECENT_ACTIVITY_LIMIT
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dashboard summary for user {self.user_id}"
+
+    @staticmethod
+    def health_record_data(record):
+        if record is None:
+            return None
+        return {
+            'blood_pressure_systolic': record.blood_pressure_systolic,
+            'blood_pressure_diastolic': record.blood_pressure_diastolic,
+            'bp_status': record.bp_status,
+            'blood_sugar': str(record.blood_sugar) if record.blood_sugar else None,
+            'weight': str(record.weight) if record.weight else None,
+            'heart_rate': record.heart_rate,
+            'recorded_at': record.recorded_at.isoformat()
+        }
+
+    @staticmethod
+    def mental_health_data(log):
+        if log is None:
+            return None
+        return {
+            'sleep_hours': str(log.sleep_hours) if log.sleep_hours else None,
+            'mood_score': log.mood_score,
+            'stress_level': log.stress_level
+        }
+
+    @staticmethod
+    def activity_data(activity):
+        return {
+            'action': activity.get_action_display(),
+            'details': activity.details,
+            'created_at': activity.created_at.isoformat(),
+        }
+
+    def refresh_user(self, user):
+        self.display_name = f"{user.first_name} {user.last_name}".strip() or user.username
+        self.email = user.email
+
+    def refresh_latest_record(self):
+        self.latest_record = self.health_record_data(
+            HealthRecord.objects.filter(user_id=self.user_id).first()
+        )
+
+    def refresh_active_medicines(self):
+        self.active_medicines = Medicine.objects.filter(user_id=self.user_id, is_active=True).count()
+
+    def refresh_latest_mental_health(self):
+        self.latest_mental_health = self.mental_health_data(
+            MentalHealthLog.objects.filter(user_id=self.user_id).first()
+        )
+
+    def refresh_recent_activities(self):
+        self.recent_activities = [
+            self.activity_data(activity)
+            for activity in ActivityLog.objects.filter(user_id=self.user_id)[:self.RECENT_ACTIVITY_LIMIT]
+        ]
+
+    def push_activity(self, activity):
+        self.recent_activities = (
+            [self.activity_data(activity)] + list(self.recent_activities)
+        )[:self.RECENT_ACTIVITY_LIMIT]
+
+    @classmethod
+    def rebuild(cls, user):
+        """Recompute the whole row for `user` from the source tables and save it."""
+        summary, _ = cls.objects.get_or_create(user_id=user.pk)
+        summary.refresh_user(user)
+        summary.refresh_latest_record()
+        summary.refresh_active_medicines()
+        summary.refresh_latest_mental_health()
+        summary.refresh_recent_activities()
+        summary.save()
+        return summary
+
+
+class ChangeEvent(models.Model):
+    """
+    Per-user change feed for delta sync. `seq` is the sync sequence: a client
+    keeps the last seq it has seen and asks for anything newer. Written by the
+    signal handlers in core/signals.py (and explicitly by bulk writers such as
+    core/ingest.py) through core.sync.record_changes, which numbers events
+    from the user's ChangeSequence.
+    """
+    OPERATION_CHOICES = [
+        ('upsert', 'Created or updated'),
+        ('delete', 'Deleted'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='change_events')
+    seq = models.BigIntegerField()
+    model = models.CharField(max_length=50)  # Key of core.sync.SYNC_MODELS
+    object_id = models.BigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'seq'], name='core_change_user_seq_uniq'),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} {self.operation} {self.model}:{self.object_id}"
+
+
+class ChangeSequence(models.Model):
+    """
+    The last ChangeEvent.seq handed out to a user. Sequence numbers are taken
+    under a lock on this row that is held until the writing transaction ends,
+    so a user's events commit in seq order and a sync can never move past one
+    that is still in flight. Table-wide auto-increment ids give no such
+    guarantee.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='change_sequence')
+    last_seq = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Change sequence for user {self.user_id} at {self.last_seq}"
+
+
+class DataVersion(models.Model):
+    """
+    Per-user data version behind the read APIs' ETags (see core/versioning.py).
+    Kept in the database so every worker and serverless instance agrees on it.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='data_version')
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"Data version {self.version} for user {self.user_id}"
+
+
+class ExportJob(models.Model):
+    """
+    A background export of a user's data (see core/export.py). The artifact is
+    written to default storage under a random name and is only served through
+    the authenticated download endpoint.
+    """
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+        ('fhir', 'FHIR Bundle'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='export_jobs')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    types = models.JSONField(default=list)  # Keys of core.sync.SYNC_MODELS
+    compress = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    file = models.FileField(upload_to='exports/', blank=True)
+    row_count = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='core_export_user_created_idx'),
+            models.Index(
+                fields=['status', 'created_at'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='core_export_active_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Export #{self.pk} ({self.format}) for {self.user_id}: {self.status}"
+
+
+class OutboxEmail(models.Model):
+    """
+    Durable queue of outgoing mail (see core/outbox.py). Requests only insert a
+    row; a worker sends due messages in batches over one SMTP connection.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['status', 'next_attempt_at'],
+                condition=models.Q(status__in=['pending', 'sending']),
+                name='core_outbox_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
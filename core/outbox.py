@@ -0,0 +1,187 @@
+"""
+Email outbox.
+
+enqueue_email() stores the message as an OutboxEmail row and returns. A
+worker then sends due messages in batches: one get_connection() is opened per
+batch and reused for every message in it. Failed messages are retried with
+exponential backoff until OUTBOX_MAX_ATTEMPTS, then marked failed.
+
+Workers claim rows with a token and a lease (locked_until). Several workers
+can run at once, and rows claimed by a worker that died are picked up again
+once the lease expires. The worker runs in a background thread started after
+the enqueueing transaction commits (OUTBOX_RUN_IN_THREAD). `manage.py
+send_queued_mail` does the same from a cron job or a long-running process.
+Any EMAIL_BACKEND works, including locmem and filebased for tests.
+
+Serverless hosts freeze the process after the response, which would strand
+a background thread. With OUTBOX_SEND_INLINE each message is instead sent
+by the request that queued it, right after its transaction commits, and
+only retries are left to the cron.
+"""
+import datetime
+import logging
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'OUTBOX_BATCH_SIZE', 50)
+MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+# Retry n waits BACKOFF_BASE * 2**(n-1) seconds, capped at BACKOFF_MAX.
+BACKOFF_BASE = getattr(settings, 'OUTBOX_BACKOFF_BASE', 30)
+BACKOFF_MAX = 60 * 60
+LEASE = datetime.timedelta(minutes=5)
+
+
+def enqueue_email(subject, body, from_email, to):
+    """Queue a plain-text message; it is sent after the current transaction commits."""
+    message = OutboxEmail.objects.create(subject=subject, body=body, from_email=from_email, to=list(to))
+    if getattr(settings, 'OUTBOX_SEND_INLINE', False):
+        transaction.on_commit(lambda: send_now(message.pk))
+    elif getattr(settings, 'OUTBOX_RUN_IN_THREAD', True):
+        transaction.on_commit(worker.wake)
+    return message
+
+
+def backoff(attempts):
+    return datetime.timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+def claim_batch(batch_size=BATCH_SIZE, ids=None):
+    """Lease up to `batch_size` due messages (among `ids`, if given) to this worker and return them."""
+    now = timezone.now()
+    due = OutboxEmail.objects.filter(
+        Q(status='pending', next_attempt_at__lte=now) | Q(status='sending', locked_until__lt=now)
+    )
+    if ids is not None:
+        due = due.filter(id__in=ids)
+    due = due.order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size]
+    token = uuid.uuid4().hex
+    # The status/lease re-check in the UPDATE keeps two workers from claiming the same row.
+    OutboxEmail.objects.filter(
+        Q(status='pending') | Q(status='sending', locked_until__lt=now), id__in=list(due)
+    ).update(status='sending', claim_token=token, locked_until=now + LEASE)
+    return list(OutboxEmail.objects.filter(claim_token=token, status='sending').order_by('id'))
+
+
+def send_batch(messages):
+    """Send `messages` over one connection. Returns (sent, failed) counts."""
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        for i, message in enumerate(messages):
+            try:
+                # No-op while the session is open; reconnects after a failure.
+                connection.open()
+            except Exception as e:
+                # Server unreachable: retry the rest of the batch later instead of
+                # attempting one connection per message.
+                for pending in messages[i:]:
+                    _retry_later(pending, e)
+                return sent, failed + len(messages) - i
+            try:
+                connection.send_messages([
+                    EmailMessage(message.subject, message.body, message.from_email, message.to, connection=connection)
+                ])
+            except Exception as e:
+                failed += 1
+                _retry_later(message, e)
+                # The SMTP session may be broken; start a fresh one for the next message.
+                _close_quietly(connection)
+                continue
+            sent += 1
+            message.status = 'sent'
+            message.sent_at = timezone.now()
+            message.attempts += 1
+            message.locked_until = None
+            message.save(update_fields=['status', 'sent_at', 'attempts', 'locked_until'])
+    finally:
+        _close_quietly(connection)
+    return sent, failed
+
+
+def _retry_later(message, error):
+    message.attempts += 1
+    message.last_error = f'{type(error).__name__}: {error}'
+    message.locked_until = None
+    if message.attempts >= MAX_ATTEMPTS:
+        message.status = 'failed'
+        logger.error('Giving up on outbox email %s after %d attempts: %s', message.pk, message.attempts, error)
+    else:
+        message.status = 'pending'
+        message.next_attempt_at = timezone.now() + backoff(message.attempts)
+        logger.warning('Outbox email %s failed (attempt %d): %s', message.pk, message.attempts, error)
+    message.save(update_fields=['attempts', 'last_error', 'locked_until', 'status', 'next_attempt_at'])
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+def send_pending(batch_size=BATCH_SIZE):
+    """Send every due message, batch by batch. Returns (sent, failed) totals."""
+    sent = failed = 0
+    while True:
+        messages = claim_batch(batch_size)
+        if not messages:
+            return sent, failed
+        batch_sent, batch_failed = send_batch(messages)
+        sent += batch_sent
+        failed += batch_failed
+
+
+def send_now(*ids):
+    """
+    Send the given messages from this process. Failures are scheduled for
+    retry as usual and never raised: the caller is a request that has
+    already committed.
+    """
+    try:
+        messages = claim_batch(len(ids), ids)
+        return send_batch(messages) if messages else (0, 0)
+    except Exception:
+        logger.exception('Inline outbox send failed')
+        return 0, len(ids)
+
+
+class OutboxWorker:
+    """Background thread that drains the outbox whenever it is woken."""
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='outbox-worker', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            # Also wakes up periodically for retries whose backoff has expired.
+            self._wake.wait(BACKOFF_BASE)
+            self._wake.clear()
+            close_old_connections()
+            try:
+                send_pending()
+            except Exception:
+                logger.exception('Outbox worker failed')
+            finally:
+                connections.close_all()
+
+
+worker = OutboxWorker()
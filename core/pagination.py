@@ -0,0 +1,106 @@
+"""
+Keyset (cursor) pagination shared by the per-user list APIs.
+
+Contract: a client passes `?limit=N` (and `?cursor=...` for later pages); the
+response carries `next_cursor`, which is null on the last page. Each page is
+fetched with a `WHERE (recorded_at, id) < (last seen)` style predicate over
+the list's ordering, so the cost stays O(limit) at any depth, unlike OFFSET.
+
+Requests without `limit` or `cursor` keep the legacy unpaginated response the
+bundled SPA relies on.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+
+
+class PaginationError(ValueError):
+    pass
+
+
+class CursorPaginator:
+    """
+    Paginates querysets over a fixed, unique ordering such as
+    ('-recorded_at', '-id'). The last field must be unique (normally id) so
+    rows sharing a timestamp are neither skipped nor repeated.
+
+    `prefix` namespaces the query parameters when one response carries several
+    paginated lists, e.g. `health_records_cursor`.
+    """
+
+    def __init__(self, ordering, prefix=''):
+        self.ordering = tuple(ordering)
+        self.fields = tuple(field.lstrip('-') for field in self.ordering)
+        self.limit_param = f'{prefix}limit'
+        self.cursor_param = f'{prefix}cursor'
+
+    def is_requested(self, request):
+        return self.limit_param in request.GET or self.cursor_param in request.GET
+
+    def get_limit(self, request):
+        default = settings.API_PAGE_SIZE
+        maximum = settings.API_MAX_PAGE_SIZE
+        try:
+            limit = int(request.GET.get(self.limit_param, default))
+        except ValueError:
+            raise PaginationError(f'Invalid {self.limit_param}')
+        if limit < 1:
+            raise PaginationError(f'Invalid {self.limit_param}')
+        return min(limit, maximum)
+
+    def encode_cursor(self, item):
+        values = [
+            item[field] if isinstance(item, dict) else getattr(item, field)
+            for field in self.fields
+        ]
+        # Full isoformat: DjangoJSONEncoder would truncate microseconds and break ties.
+        raw = json.dumps(values, default=lambda value: value.isoformat(), separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, queryset, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            values = json.loads(raw.decode('utf-8'))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            opts = queryset.model._meta
+            return [
+                opts.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except Exception:
+            raise PaginationError(f'Invalid {self.cursor_param}')
+
+    def keyset_filter(self, values):
+        # Lexicographic "after": (a < a0) OR (a = a0 AND b < b0) OR ...
+        condition = Q()
+        for i, ordering in enumerate(self.ordering):
+            lookup = 'lt' if ordering.startswith('-') else 'gt'
+            branch = Q(**{f'{self.fields[i]}__{lookup}': values[i]})
+            for field, value in zip(self.fields[:i], values[:i]):
+                branch &= Q(**{field: value})
+            condition |= branch
+        return condition
+
+    def paginate(self, queryset, request):
+        """
+        Return `(items, next_cursor)`. When the client did not ask for a page,
+        the whole ordered queryset is returned with `next_cursor` None.
+        """
+        queryset = queryset.order_by(*self.ordering)
+        if not self.is_requested(request):
+            return queryset, None
+
+        limit = self.get_limit(request)
+        cursor = request.GET.get(self.cursor_param)
+        if cursor:
+            queryset = queryset.filter(self.keyset_filter(self.decode_cursor(queryset, cursor)))
+
+        items = list(queryset[:limit + 1])
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = self.encode_cursor(items[-1])
+        return items, next_cursor
@@ -0,0 +1,142 @@
+"""
+EXPLAIN-based checks that the per-user API queries are index-backed.
+
+capture_queries() calls every per-user read endpoint (ENDPOINTS) for a
+patient and a doctor, plus the OTP helpers, and records the SQL they run.
+plan_problems() flags full table scans and sorts in each query's plan. Used
+by core.tests.QueryPlanTests and by `manage.py check_query_plans`, which runs
+the same check against the configured database.
+
+Only SQLite and PostgreSQL plans are understood.
+"""
+import datetime
+import json
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+
+from accounts.api_views import generate_token
+from accounts.models import ServiceProvider
+from accounts.otp import DatabaseOTPBackend
+
+from .models import (
+    HealthRecord, Medicine, Prescription, MentalHealthLog,
+    InsurancePolicy, LifestyleLog, ActivityLog, Appointment, ServiceRequest
+)
+
+SUPPORTED_VENDORS = ('sqlite', 'postgresql')
+
+# Per-user read endpoints and the query string variants to exercise.
+ENDPOINTS = [
+    ('/api/dashboard/', {}),
+    ('/api/medicines/', {}),
+    ('/api/medicines/', {'limit': 2}),
+    ('/api/health-track/', {}),
+    ('/api/health-track/', {'limit': 2}),
+    ('/api/health-track/', {'limit': 2, 'bp_status': 'Normal'}),
+    ('/api/health-track/series/', {'metric': 'systolic'}),
+    ('/api/health-track/bp-histogram/', {}),
+    ('/api/prescriptions/', {'limit': 2}),
+    ('/api/mental-health/', {'limit': 2}),
+    ('/api/lifestyle/', {'limit': 2}),
+    ('/api/insurance/', {'limit': 2}),
+    ('/api/past-records/', {}),
+    ('/api/past-records/', {'health_records_limit': 2, 'prescriptions_limit': 2}),
+    ('/api/sync/', {}),
+    ('/api/sync/', {'since': 0}),
+    ('/api/export/', {}),
+    ('/api/export/jobs/', {}),
+    ('/api/appointments/', {}),
+    ('/api/service-requests/', {}),
+]
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+def sample_data():
+    """A patient with a few rows in every table and a doctor they book; returns (patient, doctor)."""
+    User = get_user_model()
+    now = timezone.now()
+    patient = User.objects.create_user(username='plan-check-patient', email='plan-check-patient@example.com')
+    doctor = User.objects.create_user(username='plan-check-doctor', email='plan-check-doctor@example.com', user_type='provider')
+    ServiceProvider.objects.create(user=doctor, provider_type='doctor', business_name='Plan Check Clinic')
+
+    for i in range(5):
+        day = now - datetime.timedelta(days=i)
+        HealthRecord.objects.create(user=patient, blood_pressure_systolic=120, blood_pressure_diastolic=80, recorded_at=day)
+        Medicine.objects.create(user=patient, name=f'Medicine {i}', dosage='1', frequency='once', start_date=day.date())
+        Prescription.objects.create(user=patient, doctor_name='Dr. Plan', diagnosis='-', prescription_date=day.date())
+        MentalHealthLog.objects.create(user=patient, mood_score=3, stress_level=3, recorded_at=day)
+        LifestyleLog.objects.create(user=patient, recorded_at=day.date())
+        InsurancePolicy.objects.create(
+            user=patient, policy_type='health', provider_name='Plan', policy_number=str(i),
+            coverage_amount=1000, premium_amount=10, start_date=day.date(), end_date=day.date()
+        )
+        ActivityLog.objects.create(user=patient, action='login')
+        Appointment.objects.create(patient=patient, doctor=doctor, date=day.date(), time=day.time(), reason='-')
+        ServiceRequest.objects.create(patient=patient, provider=doctor, service_name='-', service_price=1, address='-')
+    return patient, doctor
+
+
+def capture_queries(patient, doctor):
+    """Yield (label, [sql]) for every endpoint in ENDPOINTS as each user, then the OTP helpers."""
+    factory = RequestFactory()
+    for user in (patient, doctor):
+        auth = 'Bearer ' + generate_token(user)
+
+        def get(path, params):
+            # Call the views directly: host validation and other middleware are irrelevant here.
+            request = factory.get(path, params, HTTP_AUTHORIZATION=auth)
+            response = resolve(path).func(request)
+            # Streamed lists only query while the body is consumed.
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            return response.status_code, body
+
+        for path, params in ENDPOINTS:
+            with CaptureQueriesContext(connection) as captured:
+                status, body = get(path, params)
+                if 'limit' in params and status == 200:
+                    # Follow up with a keyset page to cover the cursor predicate.
+                    cursor = json.loads(body).get('next_cursor')
+                    if cursor:
+                        get(path, {**params, 'cursor': cursor})
+            yield f'{user.username} GET {path} {params or ""}'.strip(), [q['sql'] for q in captured]
+
+    with CaptureQueriesContext(connection) as captured:
+        otp = DatabaseOTPBackend()
+        otp.verify(patient.email, otp.issue(patient.email, 'login'), 'login')
+        otp.verify(patient.email, '000000', 'login')
+    yield 'OTP issue/verify', [q['sql'] for q in captured]
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}')
+        return [row[0] for row in cursor.fetchall()]
+
+
+def plan_problems(plan):
+    """Full table scans and sorts in an EXPLAIN plan, as readable strings."""
+    problems = []
+    for line in plan:
+        text = line.strip().lstrip('->').strip()
+        if connection.vendor == 'sqlite':
+            match = SQLITE_FULL_SCAN.match(text)
+            if match:
+                problems.append(f'full scan of {match.group(1)}')
+            if text.startswith('USE TEMP B-TREE FOR ORDER BY'):
+                problems.append('sort')
+        else:
+            if text.startswith('Seq Scan on '):
+                problems.append(f"full scan of {text.split()[3]}")
+            if text.startswith(('Sort ', 'Incremental Sort ')):
+                problems.append('sort')
+    return problems
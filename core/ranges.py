@@ -0,0 +1,87 @@
+"""
+File responses with HTTP Range support.
+
+Browsers seek and resume <audio> and <video> sources with `Range: bytes=`
+requests, which FileResponse ignores. ranged_file_response() answers a
+single byte range with 206 Partial Content and an unsatisfiable range with
+416. Anything else, including multi-range requests, gets the whole file
+with a 200, as RFC 9110 allows. With an `etag`, a matching If-None-Match
+returns 304, and If-Range falls back to the whole file when the ETag no
+longer matches.
+"""
+import os
+import re
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single-range header, None to send everything, or 'invalid'."""
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if not length or not size:
+            # Zero bytes, or nothing to take them from.
+            return 'invalid'
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'invalid'
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(BLOCK_SIZE, length))
+            if not block:
+                return
+            length -= len(block)
+            yield block
+
+
+def ranged_file_response(request, path, content_type, etag=None, cache_control=None):
+    size = os.path.getsize(path)
+    quoted_etag = f'"{etag}"' if etag else None
+    headers = {'Accept-Ranges': 'bytes'}
+    if quoted_etag:
+        headers['ETag'] = quoted_etag
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+
+    if quoted_etag and quoted_etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=304)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    byte_range = parse_range(request.headers.get('Range'), size)
+    if_range = request.headers.get('If-Range')
+    if byte_range is not None and if_range and if_range != quoted_etag:
+        byte_range = None  # The client's copy is stale: send the current file whole.
+
+    if byte_range == 'invalid':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(path, start, end - start + 1), status=206,
+                                         content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    for name, value in headers.items():
+        response[name] = value
+    return response
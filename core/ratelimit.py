@@ -0,0 +1,243 @@
+"""
+Rate limiting for the auth, registration, OTP and chatbot endpoints.
+
+RateLimitMiddleware looks up the resolved URL name in RATE_LIMITS, which maps
+it to a list of (key, rate) rules:
+
+    RATE_LIMITS = {
+        'api_login': [('ip', '10/m'), ('username', '5/10m')],
+    }
+
+A key is 'ip' (the client address), 'user' (the user id of a valid bearer
+token, falling back to the address), or the name of a field in the JSON body
+such as 'email'. A rate is '<count>/<period>', where the period is s, m, h or
+d with an optional multiplier ('5/10m'). Every rule must pass. Otherwise the
+view is not called and the response is a 429 with a Retry-After header.
+
+Limits use a sliding window: a hit is counted in the current fixed window,
+and the previous window's total is weighted by how much of it still overlaps
+the last `period` seconds. Two backends are available (RATE_LIMIT_BACKEND):
+- 'cache': counters in the Django cache, shared by every worker. Each window
+  is one key, counted with incr(); the first hit of a window creates it with
+  add() (and falls back to incr() if another worker won that race). The
+  previous window is final once it has closed, so each process get()s it once
+  and remembers it. A hit therefore usually costs one cache round trip, and
+  the count is exact because incr() and add() are atomic, but a hit is not
+  one atomic operation: the previous window's weight is read separately.
+  Without a shared cache (the local-memory fallback) every process counts on
+  its own, just as with 'memory'.
+- 'memory': counters in a dict in this process. Exact and free, but each
+  worker enforces the limit on its own.
+Rejected hits are counted too, so a client that keeps retrying stays limited.
+"""
+import json
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+RATE_RE = re.compile(r'^(\d+)/(\d*)([smhd])$')
+
+
+def parse_rate(rate):
+    """'5/10m' -> (5, 600)."""
+    match = RATE_RE.match(rate.strip())
+    if not match:
+        raise ValueError(f'Invalid rate {rate!r}; expected e.g. "10/m" or "5/10m"')
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[unit]
+
+
+def sliding_count(previous, current, elapsed, window):
+    return previous * (1 - elapsed / window) + current
+
+
+def retry_after(previous, current, elapsed, window, limit):
+    """Seconds until the sliding count drops back to `limit`."""
+    if current > limit:
+        # This window alone is over the limit: wait for it to close, then for
+        # its weight in the next window to fall to `limit`.
+        return window - elapsed + (1 - limit / current) * window
+    # The previous window's weight falls linearly until its share fits.
+    return max(0.0, (1 - (limit - current) / previous) * window - elapsed)
+
+
+class MemoryBackend:
+    """Per-process counters; see the module docstring."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._windows = OrderedDict()  # key -> [index, previous, current]
+        self._lock = threading.Lock()
+
+    def hit(self, key, window, now):
+        index = int(now // window)
+        with self._lock:
+            entry = self._windows.get(key)
+            if entry is None:
+                entry = self._windows[key] = [index, 0, 0]
+                if len(self._windows) > self.maxsize:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(key)
+            if entry[0] != index:
+                entry[1] = entry[2] if entry[0] == index - 1 else 0
+                entry[0], entry[2] = index, 0
+            entry[2] += 1
+            return entry[1], entry[2]
+
+
+class CacheBackend:
+    """Counters in a shared Django cache; see the module docstring."""
+
+    def __init__(self, alias='default', maxsize=10000):
+        self.cache = caches[alias]
+        self.maxsize = maxsize
+        self._closed = OrderedDict()  # key -> (index, count) of its last closed window
+        self._lock = threading.Lock()
+
+    def hit(self, key, window, now):
+        index = int(now // window)
+        current_key = f'ratelimit:{key}:{index}'
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # First hit of the window; lost add() races fall back to incr().
+            if self.cache.add(current_key, 1, window * 2):
+                current = 1
+            else:
+                current = self.cache.incr(current_key)
+        return self._previous(key, index - 1), current
+
+    def _previous(self, key, index):
+        with self._lock:
+            closed = self._closed.get(key)
+            if closed is not None and closed[0] == index:
+                self._closed.move_to_end(key)
+                return closed[1]
+        count = self.cache.get(f'ratelimit:{key}:{index}', 0)
+        with self._lock:
+            self._closed[key] = (index, count)
+            self._closed.move_to_end(key)
+            if len(self._closed) > self.maxsize:
+                self._closed.popitem(last=False)
+        return count
+
+
+class RateLimiter:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def hit(self, key, rate, now=None):
+        """
+        Count a hit against `key` at `rate`. Returns None if it is allowed, or
+        the number of seconds to wait if it is over the limit.
+        """
+        limit, window = parse_rate(rate)
+        now = time.time() if now is None else now
+        previous, current = self.backend.hit(f'{rate}:{key}', window, now)
+        elapsed = now % window
+        if sliding_count(previous, current, elapsed, window) <= limit:
+            return None
+        return retry_after(previous, current, elapsed, window, limit)
+
+
+def client_ip(request):
+    """The client address; RATE_LIMIT_IP_HEADER names a header set by a trusted proxy."""
+    header = getattr(settings, 'RATE_LIMIT_IP_HEADER', '')
+    if header:
+        value = request.headers.get(header, '')
+        if value:
+            # Proxies append, so the last entry is the one our proxy added.
+            return value.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _token_user_id(request):
+    from accounts.api_views import jwt_verifier, token_cache
+    import jwt
+
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return None
+    try:
+        return token_cache.verify(auth_header.split(' ', 1)[1], jwt_verifier).get('user_id')
+    except jwt.InvalidTokenError:
+        return None
+
+
+def _body_field(request, field):
+    if not hasattr(request, '_rate_limit_body'):
+        request._rate_limit_body = {}
+        if request.content_type == 'application/json':
+            try:
+                body = json.loads(request.body)
+            except ValueError:
+                body = None
+            if isinstance(body, dict):
+                request._rate_limit_body = body
+    value = request._rate_limit_body.get(field)
+    return str(value).strip().lower() if value else None
+
+
+def rate_limit_key(request, key):
+    """The identity `request` is counted under for rule `key`, or None to skip the rule."""
+    if key == 'ip':
+        return f'ip:{client_ip(request)}'
+    if key == 'user':
+        user_id = _token_user_id(request)
+        return f'user:{user_id}' if user_id is not None else f'anon:{client_ip(request)}'
+    value = _body_field(request, key)
+    return f'{key}:{value}' if value else None
+
+
+def get_backend():
+    if getattr(settings, 'RATE_LIMIT_BACKEND', 'memory') == 'cache':
+        return CacheBackend(getattr(settings, 'RATE_LIMIT_CACHE_ALIAS', 'default'))
+    return MemoryBackend()
+
+
+class RateLimitMiddleware:
+    """Applies RATE_LIMITS to the views they name; see the module docstring."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'RATE_LIMIT_ENABLED', True)
+        self.rules = getattr(settings, 'RATE_LIMITS', {})
+        for rules in self.rules.values():
+            for _, rate in rules:
+                parse_rate(rate)  # Fail at startup on a malformed rate.
+        self.limiter = RateLimiter(get_backend())
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.enabled or request.method == 'OPTIONS':
+            return None
+        rules = self.rules.get(request.resolver_match.url_name)
+        if not rules:
+            return None
+        wait = None
+        for key, rate in rules:
+            identity = rate_limit_key(request, key)
+            if identity is None:
+                continue
+            seconds = self.limiter.hit(f'{request.resolver_match.url_name}:{identity}', rate)
+            if seconds is not None:
+                wait = max(wait or 0, seconds)
+        if wait is None:
+            return None
+        retry = max(1, math.ceil(wait))
+        response = JsonResponse(
+            {'success': False, 'error': 'Too many requests. Please try again later.', 'retry_after': retry},
+            status=429,
+        )
+        response['Retry-After'] = str(retry)
+        return response
@@ -0,0 +1,260 @@
+"""
+Declarative row serializers for the JSON list APIs.
+
+A serializer declares its output fields once. They are compiled into a
+`.values()` query that selects only the columns the output needs (following
+foreign keys with `__` lookups instead of per-row related fetches), plus a
+list of per-field converters that run on the plain row dicts. No model
+instances are built, and choice labels come from dicts precomputed from the
+field's choices instead of get_FOO_display() calls.
+
+    class MedicineSerializer(Serializer):
+        model = Medicine
+        name = Field()
+        frequency_display = Choice('frequency')
+
+    MedicineSerializer.serialize(Medicine.objects.filter(user_id=user.id))
+
+With a CursorPaginator, paginate `Serializer.values(qs, *paginator.fields)` so
+the cursor columns are selected too, then pass the page to `dump()` (or to
+`stream()` for core.streaming.StreamingJsonResponse).
+"""
+from django.db.models import QuerySet
+
+from .models import (
+    Appointment, HealthRecord, InsurancePolicy, LifestyleLog, Medicine, MentalHealthLog, Prescription, ServiceRequest
+)
+
+
+def isoformat(value):
+    return value.isoformat()
+
+
+def strftime(fmt):
+    def convert(value):
+        return value.strftime(fmt)
+    return convert
+
+
+class Field:
+    """
+    One output key read from the `source` column (the attribute name by
+    default). `convert` is applied to non-null values; with `blank_as_null`
+    any falsy value, such as Decimal('0') or '', is emitted as None.
+    """
+
+    def __init__(self, source=None, convert=None, blank_as_null=False):
+        self.source = source
+        self.convert = convert
+        self.blank_as_null = blank_as_null
+
+    def bind(self, name, model):
+        if self.source is None:
+            self.source = name
+
+    @property
+    def sources(self):
+        return (self.source,)
+
+    def compile(self):
+        source = self.source
+        convert = self.convert
+        if self.blank_as_null:
+            if convert is None:
+                return lambda row: row[source] or None
+            return lambda row: convert(row[source]) if row[source] else None
+        if convert is None:
+            return lambda row: row[source]
+        return lambda row: None if row[source] is None else convert(row[source])
+
+
+class Choice(Field):
+    """The display label of a choices field, like get_FOO_display()."""
+
+    def bind(self, name, model):
+        super().bind(name, model)
+        field = model._meta.get_field(self.source)
+        labels = {value: str(label) for value, label in field.flatchoices}
+        self.convert = lambda value: labels.get(value, value)
+
+
+class Computed(Field):
+    """An output computed by `function(*values)` from several source columns."""
+
+    def __init__(self, sources, function):
+        super().__init__()
+        self._sources = tuple(sources)
+        self.function = function
+
+    @property
+    def sources(self):
+        return self._sources
+
+    def compile(self):
+        sources = self._sources
+        function = self.function
+        return lambda row: function(*(row[source] for source in sources))
+
+
+def truncate(length):
+    def convert(value):
+        return value[:length] + '...' if len(value) > length else value
+    return convert
+
+
+def full_name(first_name, last_name):
+    """Same result as AbstractUser.get_full_name() from the two columns."""
+    return f'{first_name} {last_name}'.strip()
+
+
+class Serializer:
+    model = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        declared = {}
+        for base in reversed(cls.__mro__[1:]):
+            declared.update(getattr(base, '_declared_fields', {}))
+        declared.update({name: value for name, value in vars(cls).items() if isinstance(value, Field)})
+        cls._declared_fields = declared
+        cls._compiled = None
+
+    @classmethod
+    def _compile(cls):
+        if cls._compiled is None:
+            columns = []
+            converters = []
+            for name, field in cls._declared_fields.items():
+                field.bind(name, cls.model)
+                columns.extend(source for source in field.sources if source not in columns)
+                converters.append((name, field.compile()))
+            cls._compiled = (tuple(columns), tuple(converters))
+        return cls._compiled
+
+    @classmethod
+    def values(cls, queryset, *extra):
+        """`queryset.values()` restricted to the declared sources plus `extra` columns."""
+        columns = cls._compile()[0]
+        return queryset.values(*columns, *(column for column in extra if column not in columns))
+
+    @classmethod
+    def dump(cls, rows):
+        """Convert row dicts from values() into output dicts."""
+        converters = cls._compile()[1]
+        return [{name: convert(row) for name, convert in converters} for row in rows]
+
+    @classmethod
+    def stream(cls, rows, chunk_size=2000):
+        """
+        Lazily convert `rows`. A values() queryset is read with
+        iterator(chunk_size), so only one chunk of rows is held at a time.
+        """
+        converters = cls._compile()[1]
+        if isinstance(rows, QuerySet):
+            rows = rows.iterator(chunk_size=chunk_size)
+        return ({name: convert(row) for name, convert in converters} for row in rows)
+
+    @classmethod
+    def serialize(cls, queryset):
+        return cls.dump(cls.values(queryset))
+
+
+class MedicineSerializer(Serializer):
+    model = Medicine
+    name = Field()
+    dosage = Field()
+    frequency_display = Choice('frequency')
+    start_date = Field(convert=isoformat)
+    end_date = Field(convert=isoformat)
+    is_active = Field()
+
+
+class HealthRecordSerializer(Serializer):
+    """Expects a queryset annotated with HealthRecordQuerySet.with_bp_status()."""
+    model = HealthRecord
+    recorded_at = Field(convert=strftime('%Y-%m-%d %H:%M'))
+    blood_pressure_systolic = Field()
+    blood_pressure_diastolic = Field()
+    blood_sugar = Field(convert=str, blank_as_null=True)
+    weight = Field(convert=str, blank_as_null=True)
+    heart_rate = Field()
+    oxygen_level = Field(convert=str, blank_as_null=True)
+    bp_status = Field('bp_category')
+
+
+class PastHealthRecordSerializer(Serializer):
+    model = HealthRecord
+    recorded_at = Field(convert=strftime('%Y-%m-%d'))
+    blood_pressure_systolic = Field()
+    blood_pressure_diastolic = Field()
+
+
+class PastPrescriptionSerializer(Serializer):
+    model = Prescription
+    prescription_date = Field(convert=isoformat)
+    doctor_name = Field()
+
+
+class PrescriptionSerializer(Serializer):
+    model = Prescription
+    # created_at stands in for the prescription date and notes for the diagnosis, as the SPA expects.
+    prescription_date = Field('created_at', convert=strftime('%Y-%m-%d'))
+    doctor_name = Field()
+    hospital_name = Field()
+    diagnosis = Field('notes', convert=truncate(50))
+    follow_up_date = Computed((), lambda: None)
+
+
+class MentalHealthLogSerializer(Serializer):
+    model = MentalHealthLog
+    recorded_at = Field(convert=strftime('%Y-%m-%d %H:%M'))
+    mood_score = Field()
+    mood_score_display = Choice('mood_score')
+    stress_level_display = Choice('stress_level')
+    sleep_hours = Field(convert=float, blank_as_null=True)
+    notes = Field()
+
+
+class LifestyleLogSerializer(Serializer):
+    model = LifestyleLog
+    recorded_at = Field(convert=isoformat)
+    water_intake = Field()
+    exercise_minutes = Field()
+    steps_count = Field()
+    calories_consumed = Field()
+
+
+class InsurancePolicySerializer(Serializer):
+    model = InsurancePolicy
+    provider_name = Field()
+    policy_type_display = Choice('policy_type')
+    policy_number = Field()
+    coverage_amount = Field(convert=float)
+    end_date = Field(convert=isoformat)
+    is_active = Field()
+
+
+class AppointmentSerializer(Serializer):
+    # date/time are left to DjangoJSONEncoder, as in the original response.
+    model = Appointment
+    id = Field()
+    patient_name = Computed(('patient__first_name', 'patient__last_name'), full_name)
+    doctor_name = Computed(('doctor__first_name', 'doctor__last_name'), full_name)
+    date = Field()
+    time = Field()
+    reason = Field()
+    status = Field()
+    type = Field()
+    meeting_link = Field()
+
+
+class ServiceRequestSerializer(Serializer):
+    model = ServiceRequest
+    id = Field()
+    patient_name = Computed(('patient__first_name', 'patient__last_name'), full_name)
+    provider_name = Computed(('provider__first_name', 'provider__last_name'), full_name)
+    service_name = Field()
+    price = Field('service_price')
+    status = Field()
+    address = Field()
+    scheduled_date = Field()
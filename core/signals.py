@@ -0,0 +1,97 @@
+"""
+Keeps DashboardSummary rows in step with the tables they summarize, appends
+to the per-user ChangeEvent feed used by delta sync, and bumps the per-user
+data versions behind the read APIs' ETags.
+
+Each summary handler refreshes only the section its model feeds. Writes that
+bypass signals (bulk_create, queryset.update) must call update_summary,
+core.sync.record_changes and core.versioning.bump_data_version themselves.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ActivityLog, DashboardSummary, HealthRecord, Medicine, MentalHealthLog
+from .sync import SYNC_MODELS, is_user_deletion, record_changes
+from .versioning import bump_data_version
+
+
+def update_summary(user_id, refresh):
+    """
+    Apply `refresh(summary)` to the user's summary under a row lock. Users
+    without a summary yet are skipped; dashboard_api rebuilds it on first read.
+    """
+    with transaction.atomic():
+        summary = DashboardSummary.objects.select_for_update().filter(user_id=user_id).first()
+        if summary is None:
+            return
+        refresh(summary)
+        summary.save()
+
+
+@receiver([post_save, post_delete], sender=HealthRecord)
+def refresh_summary_vitals(sender, instance, **kwargs):
+    update_summary(instance.user_id, DashboardSummary.refresh_latest_record)
+
+
+@receiver([post_save, post_delete], sender=Medicine)
+def refresh_summary_medicines(sender, instance, **kwargs):
+    update_summary(instance.user_id, DashboardSummary.refresh_active_medicines)
+
+
+@receiver([post_save, post_delete], sender=MentalHealthLog)
+def refresh_summary_mental_health(sender, instance, **kwargs):
+    update_summary(instance.user_id, DashboardSummary.refresh_latest_mental_health)
+
+
+@receiver(post_save, sender=ActivityLog)
+def push_summary_activity(sender, instance, created, **kwargs):
+    if created:
+        update_summary(instance.user_id, lambda summary: summary.push_activity(instance))
+    else:
+        update_summary(instance.user_id, DashboardSummary.refresh_recent_activities)
+
+
+@receiver(post_delete, sender=ActivityLog)
+def refresh_summary_activities(sender, instance, **kwargs):
+    update_summary(instance.user_id, DashboardSummary.refresh_recent_activities)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def refresh_summary_user(sender, instance, created, **kwargs):
+    if not created:
+        update_summary(instance.pk, lambda summary: summary.refresh_user(instance))
+
+
+def record_sync_upsert(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_changes(sender, instance.user_id, [instance.pk])
+
+
+def record_sync_delete(sender, instance, origin=None, **kwargs):
+    if not is_user_deletion(origin):
+        record_changes(sender, instance.user_id, [instance.pk], operation='delete')
+
+
+for model in SYNC_MODELS.values():
+    post_save.connect(record_sync_upsert, sender=model)
+    post_delete.connect(record_sync_delete, sender=model)
+
+
+# Models whose rows are served by the ETag-protected read APIs.
+VERSIONED_MODELS = (*SYNC_MODELS.values(), ActivityLog)
+
+
+def bump_versions(sender, instance, **kwargs):
+    bump_data_version(instance.user_id)
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_versions, sender=model)
+    post_delete.connect(bump_versions, sender=model)
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def bump_user_version(sender, instance, **kwargs):
+    bump_data_version(instance.pk)
@@ -0,0 +1,84 @@
+"""
+Single-flight: collapse concurrent identical computations.
+
+SingleFlight.do(key, function, *args) runs function(*args) unless a call
+with the same key is already running, in which case it waits for that call
+and returns its result (or raises its exception). Only one computation per
+key is in flight at a time; once it finishes the key is free again, so this
+deduplicates concurrent work without caching anything.
+
+do() is for threads (WSGI workers). do_async() is the asyncio counterpart
+for coroutine functions. The leader's work runs as a task that followers
+await through asyncio.shield(), so one cancelled waiter, leader included,
+does not cancel the result for the others. The two maps are separate: a
+thread and a coroutine with the same key do not join each other.
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'followers')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        # Followers served by another caller's computation, for instrumentation.
+        self.coalesced = 0
+
+    def do(self, key, function, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is not None and task.get_loop() is loop and not task.done():
+                self.coalesced += 1
+            else:
+                task = self._tasks[key] = loop.create_task(function(*args, **kwargs))
+                task.add_done_callback(lambda finished: self._forget(key, finished))
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls) + len(self._tasks)
@@ -0,0 +1,67 @@
+"""
+Streaming JSON responses for lists that can grow without bound.
+
+JsonResponse holds the model rows, the built dicts and the encoded body in
+memory at the same time. StreamingJsonResponse instead writes the document
+piece by piece: list values given as iterators (for example
+Serializer.stream() over a queryset, which reads rows with
+queryset.iterator()) are encoded one element at a time. Memory therefore
+stays bounded by the buffer and the DB chunk size, not by the history length.
+"""
+import json
+from collections.abc import Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# Encoded output is flushed to the client in pieces of about this many characters.
+BUFFER_SIZE = 64 * 1024
+
+
+def iter_json(data, encoder=DjangoJSONEncoder, buffer_size=BUFFER_SIZE):
+    """
+    Encode `data` as JSON, yielding strings of roughly `buffer_size`. Iterator
+    values (at any nesting level inside dicts) are written as JSON arrays and
+    consumed lazily; everything else is encoded with `encoder`.
+    """
+    dumps = encoder().encode
+    buffer = []
+    size = 0
+
+    def write(value):
+        if isinstance(value, dict) and any(isinstance(item, (dict, Iterator)) for item in value.values()):
+            yield from write_raw('{')
+            for i, (key, item) in enumerate(value.items()):
+                yield from write_raw(f'{", " if i else ""}{json.dumps(str(key))}: ')
+                yield from write(item)
+            yield from write_raw('}')
+        elif isinstance(value, Iterator):
+            yield from write_raw('[')
+            for i, item in enumerate(value):
+                if i:
+                    yield from write_raw(', ')
+                yield from write(item)
+            yield from write_raw(']')
+        else:
+            yield from write_raw(dumps(value))
+
+    def write_raw(text):
+        nonlocal buffer, size
+        buffer.append(text)
+        size += len(text)
+        if size >= buffer_size:
+            chunk = ''.join(buffer)
+            buffer, size = [], 0
+            yield chunk
+
+    yield from write(data)
+    if buffer:
+        yield ''.join(buffer)
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """A JSON object response whose iterator values are streamed; see iter_json."""
+
+    def __init__(self, data, encoder=DjangoJSONEncoder, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(iter_json(data, encoder), **kwargs)
@@ -0,0 +1,121 @@
+"""
+Delta sync over the ChangeEvent feed.
+
+Clients start without a token: the response carries the current head of the
+feed and `full_resync: true`, telling them to download their history once
+through the list APIs. After that they pass the token back as `since` and get
+only what changed, so each sync costs O(changes) rather than O(history).
+Replaying a change twice is harmless because upserts carry the full row.
+
+Tokens are per-user sequence numbers (ChangeEvent.seq), not row ids. Ids
+are handed out when a row is inserted but become visible when its
+transaction commits, so a long ingest could commit ids below ones a client
+has already synced past. Sequence numbers are allocated under a lock on the
+user's ChangeSequence row, held until the writer commits, so they become
+visible in order.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import QuerySet
+
+from .models import (
+    ChangeEvent, ChangeSequence, HealthRecord, InsurancePolicy, LifestyleLog,
+    Medicine, MentalHealthLog, Prescription
+)
+
+# Feed key -> model. The key is what ChangeEvent.model stores and what the sync
+# response groups rows under.
+SYNC_MODELS = {
+    'health_records': HealthRecord,
+    'medicines': Medicine,
+    'prescriptions': Prescription,
+    'mental_health_logs': MentalHealthLog,
+    'lifestyle_logs': LifestyleLog,
+    'insurance_policies': InsurancePolicy,
+}
+SYNC_KEYS = {model: key for key, model in SYNC_MODELS.items()}
+
+
+class SyncTokenError(ValueError):
+    pass
+
+
+def record_changes(model, user_id, object_ids, operation='upsert'):
+    """
+    Append one feed entry per object; used directly by bulk writers. Call it
+    at the end of a long transaction: other writes for the user wait on the
+    sequence lock until that transaction ends.
+    """
+    if not object_ids:
+        return
+    with transaction.atomic():
+        sequence, _ = ChangeSequence.objects.select_for_update().get_or_create(user_id=user_id)
+        first = sequence.last_seq + 1
+        sequence.last_seq += len(object_ids)
+        sequence.save(update_fields=['last_seq'])
+        ChangeEvent.objects.bulk_create([
+            ChangeEvent(user_id=user_id, seq=first + i, model=SYNC_KEYS[model], object_id=object_id,
+                        operation=operation)
+            for i, object_id in enumerate(object_ids)
+        ])
+
+
+def is_user_deletion(origin):
+    """True when a delete cascades from removing the user, whose feed goes with it."""
+    User = get_user_model()
+    if isinstance(origin, QuerySet):
+        return origin.model is User
+    return isinstance(origin, User)
+
+
+def head_token(user_id):
+    last = ChangeSequence.objects.filter(user_id=user_id).values_list('last_seq', flat=True).first()
+    return str(last or 0)
+
+
+def parse_token(token):
+    try:
+        value = int(token)
+    except (TypeError, ValueError):
+        raise SyncTokenError('Invalid sync token')
+    if value < 0:
+        raise SyncTokenError('Invalid sync token')
+    return value
+
+
+def changes_since(user_id, since, limit):
+    """
+    Return (changes, deleted, next_token, has_more) for events after `since`.
+    Several events for one object collapse into its final state.
+    """
+    events = list(
+        ChangeEvent.objects.filter(user_id=user_id, seq__gt=since)
+        .order_by('seq')
+        .values_list('seq', 'model', 'object_id', 'operation')[:limit + 1]
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    final = {}
+    for _, key, object_id, operation in events:
+        final[(key, object_id)] = operation
+
+    changes = {key: [] for key in SYNC_MODELS}
+    deleted = {key: [] for key in SYNC_MODELS}
+    upserts = {key: [] for key in SYNC_MODELS}
+    for (key, object_id), operation in final.items():
+        if key not in SYNC_MODELS:
+            continue
+        (upserts if operation == 'upsert' else deleted)[key].append(object_id)
+
+    for key, ids in upserts.items():
+        if not ids:
+            continue
+        rows = list(SYNC_MODELS[key].objects.filter(user_id=user_id, id__in=ids).values())
+        changes[key] = rows
+        # Rows deleted after their upsert event are reported as tombstones.
+        found = {row['id'] for row in rows}
+        deleted[key].extend(object_id for object_id in ids if object_id not in found)
+
+    next_token = str(events[-1][0]) if events else str(since)
+    return changes, deleted, next_token, has_more
@@ -1,3 +1,1552 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import re
+import smtplib
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.management import CommandError, call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, IntegrityError, connection, connections, transaction
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.api_views import generate_token
+from accounts.auth import user_snapshots
+
+from . import activity, outbox
+from .archive import ActivityArchive, ArchiveError, archive_before, convert_to_partitioned, is_partitioned
+from .export import BUFFER_SIZE as EXPORT_BUFFER_SIZE, columns, iter_export, run_export_job
+from .ingest import ingest_readings
+from .models import (
+    BP_STATUSES, ActivityLog, Appointment, ChangeEvent, ChangeSequence, DashboardSummary, DataVersion, ExportJob,
+    HealthRecord, InsurancePolicy, LifestyleLog, Medicine, MentalHealthLog, OutboxEmail, Prescription, ServiceRequest,
+)
+from .ranges import parse_range
+from .ratelimit import (
+    CacheBackend, MemoryBackend, RateLimiter, _body_field, _token_user_id, client_ip, parse_rate, rate_limit_key,
+    retry_after, sliding_count,
+)
+from .queryplans import SUPPORTED_VENDORS, capture_queries, explain, plan_problems, sample_data
+from .serializers import (
+    AppointmentSerializer, HealthRecordSerializer, InsurancePolicySerializer, LifestyleLogSerializer,
+    MedicineSerializer, MentalHealthLogSerializer, PastHealthRecordSerializer, PastPrescriptionSerializer,
+    PrescriptionSerializer, ServiceRequestSerializer,
+)
+from .singleflight import SingleFlight
+from .streaming import iter_json
+from .timeseries import choose_bucket, lttb
+
+
+def run_concurrently(n, target):
+    """Call target(i) from n threads released together; returns the results in order."""
+    results = [None] * n
+    barrier = threading.Barrier(n)
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = target(i)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def wait_until(predicate, timeout=5):
+    """Poll predicate() until it holds; lets a single-flight leader wait for its followers."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError('Timed out waiting for concurrent callers')
+        time.sleep(0.001)
+
+
+class QueryPlanTests(TestCase):
+    """Every query behind the per-user read APIs must be answered from an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, cls.doctor = sample_data()
+
+    def setUp(self):
+        if connection.vendor not in SUPPORTED_VENDORS:
+            self.skipTest(f'Plan checks are not implemented for {connection.vendor}')
+        if connection.vendor == 'postgresql':
+            # Tiny sample tables would otherwise always be seq-scanned.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def test_per_user_queries_are_index_backed(self):
+        for label, queries in capture_queries(self.patient, self.doctor):
+            with self.subTest(label):
+                for sql in queries:
+                    if sql.lstrip().upper().startswith('SELECT'):
+                        self.assertEqual(plan_problems(explain(sql)), [], sql)
+
+
+class ReadApiQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, cls.doctor = sample_data()
+
+    def get(self, path, params=None, **headers):
+        response = self.client.get(path, params or {}, HTTP_AUTHORIZATION='Bearer ' + generate_token(self.patient),
+                                   **headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def test_dashboard_is_served_from_the_summary_row(self):
+        self.get('/api/dashboard/')  # Builds the summary.
+        with self.assertNumQueries(2):  # Data version, summary.
+            self.assertEqual(self.get('/api/dashboard/').status_code, 200)
+
+    def test_list_page_cost_does_not_grow_with_history(self):
+        self.get('/api/health-track/', {'limit': 2})
+        with self.assertNumQueries(2):
+            self.get('/api/health-track/', {'limit': 2})
+        now = timezone.now()
+        HealthRecord.objects.bulk_create([
+            HealthRecord(user=self.patient, heart_rate=60, recorded_at=now - datetime.timedelta(hours=i))
+            for i in range(1, 200)
+        ])
+        with self.assertNumQueries(2):
+            self.get('/api/health-track/', {'limit': 2})
+
+    def test_matching_etag_costs_one_query(self):
+        for path in ('/api/dashboard/', '/api/medicines/', '/api/health-track/', '/api/past-records/', '/api/sync/'):
+            with self.subTest(path):
+                etag = self.get(path)['ETag']
+                with self.assertNumQueries(1):
+                    self.assertEqual(self.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_write_invalidates_the_etag(self):
+        for path in ('/api/dashboard/', '/api/health-track/'):
+            with self.subTest(path):
+                etag = self.get(path)['ETag']
+                with self.captureOnCommitCallbacks(execute=True):
+                    HealthRecord.objects.create(user=self.patient, heart_rate=99)
+                response = self.get(path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+                self.assertEqual(self.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_only_versioned_models_bump(self):
+        self.get('/api/dashboard/')
+        version = DataVersion.objects.get(user=self.patient).version
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=timezone.now().date(),
+                                       time=timezone.now().time(), reason='-')
+        self.assertEqual(callbacks, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            ActivityLog.objects.create(user=self.patient, action='login')
+        self.assertGreater(DataVersion.objects.get(user=self.patient).version, version)
+
+    def test_sync_reads_only_the_changed_types(self):
+        head = self.get('/api/sync/').json()['next_token']
+        with self.assertNumQueries(2):  # Data version, feed.
+            self.get('/api/sync/', {'since': head})
+        Medicine.objects.create(user=self.patient, name='New', dosage='1', frequency='once', start_date=timezone.now().date())
+        with self.assertNumQueries(3):
+            changes = self.get('/api/sync/', {'since': head}).json()['changes']
+        self.assertEqual([row['name'] for row in changes['medicines']], ['New'])
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='pages', email='pages@example.com')
+        now = timezone.now()
+        # Three logs share a timestamp, so the id tie-breaker decides their order.
+        for i, (tag, minutes) in enumerate((('a', 0), ('b', 5), ('c', 5), ('d', 5), ('e', 10), ('f', 20), ('g', 30))):
+            MentalHealthLog.objects.create(user=cls.user, mood_score=3, stress_level=3, notes=tag,
+                                           recorded_at=now - datetime.timedelta(minutes=minutes))
+            HealthRecord.objects.create(user=cls.user, heart_rate=60, recorded_at=now - datetime.timedelta(hours=i))
+
+    def get(self, path, params):
+        response = self.client.get(path, params, HTTP_AUTHORIZATION='Bearer ' + generate_token(self.user))
+        if response.streaming:
+            return response.status_code, json.loads(b''.join(response.streaming_content))
+        return response.status_code, response.json()
+
+    def walk(self, limit):
+        seen, params = [], {'limit': limit}
+        while True:
+            status, body = self.get('/api/mental-health/', params)
+            self.assertEqual(status, 200)
+            self.assertLessEqual(len(body['logs']), limit)
+            seen += [log['notes'] for log in body['logs']]
+            if body['next_cursor'] is None:
+                return seen
+            params = {'limit': limit, 'cursor': body['next_cursor']}
+
+    def test_pages_cover_every_row_once_in_order(self):
+        _, legacy = self.get('/api/mental-health/', {})
+        self.assertIsNone(legacy['next_cursor'])
+        everything = [log['notes'] for log in legacy['logs']]
+        self.assertEqual(everything, ['a', 'd', 'c', 'b', 'e', 'f', 'g'])
+        for limit in (1, 2, 3, 7, 50):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.walk(limit), everything)
+
+    def test_prefixed_parameters_page_one_list(self):
+        status, body = self.get('/api/past-records/', {'health_records_limit': 4})
+        self.assertEqual(status, 200)
+        self.assertEqual(len(body['health_records']), 4)
+        self.assertIsNotNone(body['health_records_next_cursor'])
+        self.assertIsNone(body['prescriptions_next_cursor'])
+        status, body = self.get('/api/past-records/', {'health_records_cursor': body['health_records_next_cursor']})
+        self.assertEqual(len(body['health_records']), 3)
+
+    def test_bad_cursor_or_limit_is_a_400(self):
+        cursor = self.get('/api/health-track/', {'limit': 2})[1]['next_cursor']
+        for params in (
+            {'cursor': 'not-base64!'},
+            {'cursor': cursor[:-3]},
+            {'cursor': base64.urlsafe_b64encode(b'["2024-01-01T00:00:00+00:00"]').decode()},
+            {'cursor': base64.urlsafe_b64encode(b'["yesterday", 1]').decode()},
+            {'limit': 'ten'},
+            {'limit': 0},
+        ):
+            with self.subTest(params):
+                status, body = self.get('/api/health-track/', params)
+                self.assertEqual(status, 400)
+                self.assertIn('error', body)
+
+
+class DownsamplingTests(SimpleTestCase):
+    def test_lttb_keeps_the_endpoints_and_returns_threshold_points(self):
+        data = [(x, (x * 37) % 11) for x in range(1000)]
+        for threshold in (3, 10, 250, 999):
+            with self.subTest(threshold=threshold):
+                sampled = lttb(data, threshold)
+                self.assertEqual(len(sampled), threshold)
+                self.assertEqual((sampled[0], sampled[-1]), (data[0], data[-1]))
+                self.assertEqual(sampled, sorted(sampled))
+                self.assertTrue(set(sampled) <= set(data))
+
+    def test_lttb_keeps_a_spike(self):
+        data = [(x, 1000 if x == 517 else 70) for x in range(1000)]
+        self.assertIn((517, 1000), lttb(data, 20))
+
+    def test_lttb_returns_short_input_unchanged(self):
+        data = [(x, x) for x in range(5)]
+        self.assertEqual(lttb(data, 5), data)
+        self.assertEqual(lttb(data, 50), data)
+        self.assertEqual(lttb(data, 2), data)
+        self.assertEqual(lttb([], 10), [])
+
+    def test_choose_bucket_picks_the_finest_that_fits(self):
+        start = timezone.now()
+        for days, points, bucket in ((1, 500, 'hour'), (20, 500, 'hour'), (21, 500, 'day'),
+                                     (365, 100, 'week'), (3650, 100, 'month'), (36500, 10, 'month')):
+            with self.subTest(days=days, points=points):
+                self.assertEqual(choose_bucket(start, start + datetime.timedelta(days=days), points)[0], bucket)
+
+
+class HealthSeriesApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='series', email='series@example.com')
+        cls.end = timezone.now().replace(minute=30, second=0, microsecond=0)
+        HealthRecord.objects.bulk_create([
+            HealthRecord(user=cls.user, heart_rate=60 + i % 5, recorded_at=cls.end - datetime.timedelta(hours=i))
+            for i in range(240)
+        ] + [HealthRecord(user=cls.user, weight='70.00', recorded_at=cls.end - datetime.timedelta(minutes=1))])
+
+    def series(self, **params):
+        params.setdefault('end', self.end.isoformat())
+        params.setdefault('start', (self.end - datetime.timedelta(days=10)).isoformat())
+        return self.client.get('/api/health-track/series/', params,
+                               HTTP_AUTHORIZATION='Bearer ' + generate_token(self.user))
+
+    def test_buckets_aggregate_every_reading(self):
+        data = self.series(metric='heart_rate', points=20).json()
+        self.assertEqual(data['bucket'], 'day')
+        self.assertEqual(sum(row['count'] for row in data['points']), 240)
+        self.assertEqual(min(row['min'] for row in data['points']), 60)
+        self.assertEqual(max(row['max'] for row in data['points']), 64)
+
+    def test_lttb_returns_the_requested_points(self):
+        points = self.series(metric='heart_rate', mode='lttb', points=50).json()['points']
+        self.assertEqual(len(points), 50)
+        self.assertEqual(points[0]['t'], (self.end - datetime.timedelta(hours=239)).isoformat())
+        self.assertEqual(points[-1]['t'], self.end.isoformat())
+
+    def test_readings_without_the_metric_are_skipped(self):
+        points = self.series(metric='weight', mode='lttb').json()['points']
+        self.assertEqual(points, [{'t': (self.end - datetime.timedelta(minutes=1)).isoformat(), 'value': 70.0}])
+
+    def test_bad_parameters_are_a_400(self):
+        for params in ({'metric': 'mood'}, {'metric': 'weight', 'mode': 'avg'}, {'metric': 'weight', 'points': 2},
+                       {'metric': 'weight', 'start': 'soon'}, {'metric': 'weight', 'start': self.end.isoformat()}):
+            with self.subTest(params):
+                self.assertEqual(self.series(**params).status_code, 400)
+
+
+class BloodPressureCategoryTests(TestCase):
+    SYSTOLIC = (None, 0, 90, 119, 120, 129, 130, 139, 140, 180)
+    DIASTOLIC = (None, 0, 60, 79, 80, 89, 90, 120)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='bp', email='bp@example.com')
+        now = timezone.now()
+        HealthRecord.objects.bulk_create([
+            HealthRecord(user=cls.user, blood_pressure_systolic=systolic, blood_pressure_diastolic=diastolic,
+                         recorded_at=now - datetime.timedelta(minutes=i))
+            for i, (systolic, diastolic) in enumerate(
+                (systolic, diastolic) for systolic in cls.SYSTOLIC for diastolic in cls.DIASTOLIC
+            )
+        ])
+
+    def test_sql_category_matches_the_python_property_at_every_boundary(self):
+        records = HealthRecord.objects.filter(user=self.user).with_bp_status()
+        self.assertEqual(len(records), len(self.SYSTOLIC) * len(self.DIASTOLIC))
+        for record in records:
+            with self.subTest(systolic=record.blood_pressure_systolic, diastolic=record.blood_pressure_diastolic):
+                self.assertEqual(record.bp_category, record.bp_status)
+
+    def test_histogram_endpoint(self):
+        records = list(HealthRecord.objects.filter(user=self.user))
+        expected = {status: sum(record.bp_status == status for record in records) for status in BP_STATUSES}
+        response = self.client.get('/api/health-track/bp-histogram/',
+                                   HTTP_AUTHORIZATION='Bearer ' + generate_token(self.user))
+        self.assertEqual(response.json(), {'histogram': expected, 'total': len(records)})
+        self.assertTrue(all(expected.values()))
+
+    def test_histogram_range_and_empty_categories(self):
+        newest = HealthRecord.objects.filter(user=self.user).first()
+        response = self.client.get('/api/health-track/bp-histogram/', {'start': newest.recorded_at.isoformat()},
+                                   HTTP_AUTHORIZATION='Bearer ' + generate_token(self.user))
+        histogram = response.json()['histogram']
+        self.assertEqual(list(histogram), BP_STATUSES)
+        self.assertEqual(histogram, {status: int(status == newest.bp_status) for status in BP_STATUSES})
+
+
+class BatchIngestTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='device', email='device@example.com')
+        self.start = timezone.now().replace(microsecond=0)
+
+    def at(self, minutes):
+        return (self.start + datetime.timedelta(minutes=minutes)).isoformat()
+
+    def post(self, body, content_type='application/json'):
+        if not isinstance(body, (str, bytes)):
+            body = json.dumps(body)
+        return self.client.post('/api/health-track/bulk/', body, content_type=content_type,
+                                HTTP_AUTHORIZATION='Bearer ' + generate_token(self.user))
+
+    def test_reports_each_item(self):
+        data = self.post([
+            {'recorded_at': self.at(0), 'heart_rate': 60},
+            {'recorded_at': self.at(1), 'blood_pressure_systolic': 'high'},
+            {'recorded_at': 'yesterday', 'heart_rate': 61},
+            {'recorded_at': self.at(2)},
+            'not a reading',
+            {'recorded_at': self.at(3), 'weight': '70.5', 'notes': 'after run'},
+        ]).json()
+        self.assertEqual((data['created'], data['duplicate'], data['invalid']), (2, 0, 4))
+        self.assertEqual([result['status'] for result in data['results']],
+                         ['created', 'invalid', 'invalid', 'invalid', 'invalid', 'created'])
+        self.assertEqual([result['index'] for result in data['results']], list(range(6)))
+        self.assertIn('blood_pressure_systolic', data['results'][1]['errors'])
+        self.assertIn('recorded_at', data['results'][2]['errors'])
+        self.assertIn('__all__', data['results'][3]['errors'])
+        stored = HealthRecord.objects.get(id=data['results'][5]['id'])
+        self.assertEqual((str(stored.weight), stored.notes), ('70.50', 'after run'))
+        self.assertEqual(HealthRecord.objects.get(id=data['results'][0]['id']).heart_rate, 60)
+
+    def test_duplicates_within_the_batch_and_against_stored_rows(self):
+        self.post([{'recorded_at': self.at(0), 'heart_rate': 60}])
+        data = self.post([
+            {'recorded_at': self.at(0), 'heart_rate': 99},
+            {'recorded_at': self.at(1), 'heart_rate': 61},
+            {'recorded_at': self.at(1), 'heart_rate': 98},
+        ]).json()
+        self.assertEqual([result['status'] for result in data['results']], ['duplicate', 'created', 'duplicate'])
+        self.assertEqual(sorted(HealthRecord.objects.filter(user=self.user).values_list('heart_rate', flat=True)),
+                         [60, 61])
+
+    def test_reading_stored_by_a_concurrent_batch_is_not_duplicated(self):
+        bulk_create = HealthRecord.objects.bulk_create
+
+        def racing_bulk_create(*args, **kwargs):
+            # Another batch commits the same reading after our duplicate check.
+            HealthRecord.objects.create(user=self.user, heart_rate=70, recorded_at=self.start)
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(HealthRecord.objects, 'bulk_create', racing_bulk_create):
+            data = self.post([{'recorded_at': self.at(0), 'heart_rate': 60},
+                              {'recorded_at': self.at(1), 'heart_rate': 61}]).json()
+        self.assertEqual(data['created'], 2)
+        self.assertEqual(HealthRecord.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(HealthRecord.objects.get(id=data['results'][0]['id']).heart_rate, 70)
+
+    def test_constraint_rejects_a_second_reading_at_the_same_time(self):
+        HealthRecord.objects.create(user=self.user, heart_rate=60, recorded_at=self.start)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            HealthRecord.objects.create(user=self.user, heart_rate=61, recorded_at=self.start)
+
+    def test_ndjson_and_wrapped_bodies(self):
+        lines = '\n'.join(json.dumps({'recorded_at': self.at(i), 'heart_rate': 60 + i}) for i in range(3))
+        self.assertEqual(self.post(lines, 'application/x-ndjson').json()['created'], 3)
+        self.assertEqual(self.post({'records': [{'recorded_at': self.at(5), 'heart_rate': 1}]}).json()['created'], 1)
+
+    def test_malformed_batches_are_a_400(self):
+        for body in ('{"records": 5}', '[', b'\xff'):
+            with self.subTest(body):
+                self.assertEqual(self.post(body).status_code, 400)
+        with mock.patch('core.ingest.MAX_BATCH_SIZE', 2):
+            self.assertEqual(self.post([{}, {}, {}]).status_code, 400)
+
+
+class SyncFeedTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='syncer', email='syncer@example.com')
+        self.other = User.objects.create_user(username='other', email='other@example.com')
+        self.now = timezone.now()
+
+    def reading(self, user=None, minutes=0, **values):
+        return HealthRecord.objects.create(user=user or self.user, recorded_at=self.now - datetime.timedelta(minutes=minutes),
+                                           **values)
+
+    def sync(self, since, **params):
+        response = self.client.get('/api/sync/', {'since': since, **params},
+                                   HTTP_AUTHORIZATION='Bearer ' + generate_token(self.user))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def seqs(self, user):
+        return list(ChangeEvent.objects.filter(user=user).order_by('seq').values_list('seq', flat=True))
+
+    def test_each_user_gets_a_gapless_sequence(self):
+        for i in range(3):
+            self.reading(minutes=i)
+            self.reading(user=self.other, minutes=i)
+        Medicine.objects.create(user=self.user, name='A', dosage='1', frequency='once', start_date=self.now.date())
+        self.assertEqual(self.seqs(self.user), [1, 2, 3, 4])
+        self.assertEqual(self.seqs(self.other), [1, 2, 3])
+        self.assertEqual(ChangeSequence.objects.get(user=self.user).last_seq, 4)
+
+    def test_sequence_continues_from_the_locked_row(self):
+        ChangeSequence.objects.create(user=self.user, last_seq=41)
+        self.reading()
+        self.assertEqual(self.seqs(self.user), [42])
+        self.assertEqual(self.sync(0)['next_token'], '42')
+
+    def test_only_synced_models_are_recorded(self):
+        ActivityLog.objects.create(user=self.user, action='login')
+        self.user.first_name = 'Changed'
+        self.user.save()
+        self.assertEqual(ChangeEvent.objects.count(), 0)
+
+    def test_several_changes_collapse_to_the_final_state(self):
+        head = self.sync(0)['next_token']
+        record = self.reading(heart_rate=60)
+        record.heart_rate = 61
+        record.save()
+        record.heart_rate = 62
+        record.save()
+        data = self.sync(head)
+        self.assertEqual([row['heart_rate'] for row in data['changes']['health_records']], [62])
+        self.assertEqual(data['deleted']['health_records'], [])
+        self.assertEqual(data['next_token'], str(int(head) + 3))
+
+    def test_deletes_are_tombstones(self):
+        kept, gone = self.reading(minutes=1), self.reading(minutes=2)
+        head = self.sync(0)['next_token']
+        gone_id = gone.pk
+        gone.delete()
+        data = self.sync(head)
+        self.assertEqual(data['changes']['health_records'], [])
+        self.assertEqual(data['deleted']['health_records'], [gone_id])
+
+        # Created and deleted between two syncs: the client only hears of the delete.
+        short_lived = self.reading(minutes=3)
+        short_lived_id = short_lived.pk
+        short_lived.delete()
+        data = self.sync(data['next_token'])
+        self.assertEqual(data['deleted']['health_records'], [short_lived_id])
+        self.assertEqual(data['changes']['health_records'], [])
+        self.assertTrue(HealthRecord.objects.filter(pk=kept.pk).exists())
+
+    def test_pages_follow_the_sequence(self):
+        for i in range(5):
+            self.reading(minutes=i, heart_rate=60 + i)
+        seen, token, has_more = [], '0', True
+        while has_more:
+            data = self.sync(token, limit=2)
+            seen += [row['heart_rate'] for row in data['changes']['health_records']]
+            token, has_more = data['next_token'], data['has_more']
+        self.assertEqual(seen, [60, 61, 62, 63, 64])
+        self.assertEqual(token, '5')
+
+    def test_deleting_the_user_drops_the_feed(self):
+        self.addCleanup(user_snapshots.clear)  # Forget the deleted ids; the test database reuses them.
+        self.reading()
+        self.other.delete()
+        self.user.delete()
+        self.assertEqual(ChangeEvent.objects.count(), 0)
+
+
+# The per-instance loops the list APIs used before core/serializers.py.
+LEGACY_ROWS = {
+    MedicineSerializer: lambda med: {
+        'name': med.name,
+        'dosage': med.dosage,
+        'frequency_display': med.get_frequency_display(),
+        'start_date': med.start_date.isoformat() if med.start_date else None,
+        'end_date': med.end_date.isoformat() if med.end_date else None,
+        'is_active': med.is_active
+    },
+    HealthRecordSerializer: lambda record: {
+        'recorded_at': record.recorded_at.strftime('%Y-%m-%d %H:%M'),
+        'blood_pressure_systolic': record.blood_pressure_systolic,
+        'blood_pressure_diastolic': record.blood_pressure_diastolic,
+        'blood_sugar': str(record.blood_sugar) if record.blood_sugar else None,
+        'weight': str(record.weight) if record.weight else None,
+        'heart_rate': record.heart_rate,
+        'oxygen_level': str(record.oxygen_level) if record.oxygen_level else None,
+        'bp_status': record.bp_category
+    },
+    InsurancePolicySerializer: lambda policy: {
+        'provider_name': policy.provider_name,
+        'policy_type_display': policy.get_policy_type_display(),
+        'policy_number': policy.policy_number,
+        'coverage_amount': float(policy.coverage_amount),
+        'end_date': policy.end_date.isoformat(),
+        'is_active': policy.is_active
+    },
+    PrescriptionSerializer: lambda p: {
+        'prescription_date': p.created_at.strftime('%Y-%m-%d'),
+        'doctor_name': p.doctor_name,
+        'hospital_name': p.hospital_name,
+        'diagnosis': p.notes[:50] + '...' if len(p.notes) > 50 else p.notes,
+        'follow_up_date': None
+    },
+    MentalHealthLogSerializer: lambda log: {
+        'recorded_at': log.recorded_at.strftime('%Y-%m-%d %H:%M'),
+        'mood_score': log.mood_score,
+        'mood_score_display': log.get_mood_score_display(),
+        'stress_level_display': log.get_stress_level_display(),
+        'sleep_hours': float(log.sleep_hours) if log.sleep_hours else None,
+        'notes': log.notes
+    },
+    LifestyleLogSerializer: lambda log: {
+        'recorded_at': log.recorded_at.isoformat(),
+        'water_intake': log.water_intake,
+        'exercise_minutes': log.exercise_minutes,
+        'steps_count': log.steps_count,
+        'calories_consumed': log.calories_consumed
+    },
+    AppointmentSerializer: lambda appt: {
+        'id': appt.id,
+        'patient_name': appt.patient.get_full_name(),
+        'doctor_name': appt.doctor.get_full_name(),
+        'date': appt.date,
+        'time': appt.time,
+        'reason': appt.reason,
+        'status': appt.status,
+        'type': appt.type,
+        'meeting_link': appt.meeting_link
+    },
+    ServiceRequestSerializer: lambda req: {
+        'id': req.id,
+        'patient_name': req.patient.get_full_name(),
+        'provider_name': req.provider.get_full_name(),
+        'service_name': req.service_name,
+        'price': req.service_price,
+        'status': req.status,
+        'address': req.address,
+        'scheduled_date': req.scheduled_date
+    },
+}
+
+
+class SerializerParityTests(TestCase):
+    """Each serializer must emit exactly what the loop it replaced did, including blanks and nulls."""
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='parity', email='parity@example.com', first_name='Pat')
+        doctor = User.objects.create_user(username='doc', email='doc@example.com', first_name='Dee', last_name='Oc')
+        now = timezone.now()
+        today = now.date()
+        for i, (decimal, notes) in enumerate((('0', ''), ('98.60', 'short'), (None, 'x' * 50), ('1.50', 'y' * 51))):
+            at = now - datetime.timedelta(hours=i)
+            HealthRecord.objects.create(user=cls.user, recorded_at=at, blood_sugar=decimal, weight=decimal,
+                                        oxygen_level=i * 40 or None, blood_pressure_systolic=118 + i * 8,
+                                        blood_pressure_diastolic=78 + i * 4 if i else None)
+            Medicine.objects.create(user=cls.user, name=f'M{i}', dosage='1', frequency=['once', 'asneeded', 'twice', 'odd'][i],
+                                    start_date=today, end_date=today if i % 2 else None, is_active=bool(i % 2))
+            InsurancePolicy.objects.create(user=cls.user, policy_type='health', provider_name='P', policy_number=str(i),
+                                           coverage_amount='1000.50', premium_amount=10, start_date=today, end_date=today)
+            Prescription.objects.create(user=cls.user, doctor_name='Dr', hospital_name=notes[:5], diagnosis='-',
+                                        prescription_date=today, notes=notes)
+            MentalHealthLog.objects.create(user=cls.user, mood_score=i + 1, stress_level=5 - i, sleep_hours=decimal and '7.5',
+                                           notes=notes, recorded_at=at)
+            LifestyleLog.objects.create(user=cls.user, water_intake=i, calories_consumed=i * 100 or None,
+                                        recorded_at=(at - datetime.timedelta(days=i)).date())
+            Appointment.objects.create(patient=cls.user, doctor=doctor, date=today, time=at.time(), reason=notes)
+            ServiceRequest.objects.create(patient=cls.user, provider=doctor, service_name='S', service_price='12.00',
+                                          address='-', scheduled_date=at if i % 2 else None)
+
+    def test_output_matches_the_instance_loops(self):
+        querysets = {
+            MedicineSerializer: Medicine.objects.filter(user=self.user),
+            HealthRecordSerializer: HealthRecord.objects.filter(user=self.user).with_bp_status(),
+            InsurancePolicySerializer: InsurancePolicy.objects.filter(user=self.user),
+            PrescriptionSerializer: Prescription.objects.filter(user=self.user),
+            MentalHealthLogSerializer: MentalHealthLog.objects.filter(user=self.user),
+            LifestyleLogSerializer: LifestyleLog.objects.filter(user=self.user),
+            AppointmentSerializer: Appointment.objects.filter(patient=self.user),
+            ServiceRequestSerializer: ServiceRequest.objects.filter(patient=self.user),
+        }
+        for serializer, queryset in querysets.items():
+            with self.subTest(serializer.__name__):
+                expected = [LEGACY_ROWS[serializer](row) for row in queryset]
+                self.assertEqual(len(expected), 4)
+                self.assertEqual(serializer.serialize(queryset), expected)
+                self.assertEqual(list(serializer.stream(serializer.values(queryset))), expected)
+
+    def test_list_endpoints_use_them(self):
+        for path, key, serializer, queryset in (
+            ('/api/prescriptions/', 'prescriptions', PrescriptionSerializer, Prescription.objects.filter(user=self.user)),
+            ('/api/mental-health/', 'logs', MentalHealthLogSerializer, MentalHealthLog.objects.filter(user=self.user)),
+            ('/api/lifestyle/', 'logs', LifestyleLogSerializer, LifestyleLog.objects.filter(user=self.user)),
+        ):
+            with self.subTest(path):
+                response = self.client.get(path, HTTP_AUTHORIZATION='Bearer ' + generate_token(self.user))
+                expected = [LEGACY_ROWS[serializer](row) for row in queryset.order_by(*(
+                    ('-created_at', '-id') if serializer is PrescriptionSerializer else ('-recorded_at', '-id')
+                ))]
+                self.assertEqual(response.json()[key], json.loads(json.dumps(expected)))
+
+
+class StreamingJsonTests(TestCase):
+    """A streamed body must parse as the same JSON the JsonResponse it replaced produced."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='streamer', email='streamer@example.com')
+        now = timezone.now()
+        for i in range(30):
+            HealthRecord.objects.create(user=cls.user, recorded_at=now - datetime.timedelta(hours=i),
+                                        blood_pressure_systolic=110 + i, blood_pressure_diastolic=70 + i % 20,
+                                        blood_sugar='95.50' if i % 3 else None, weight='72.40')
+            Prescription.objects.create(user=cls.user, doctor_name=f'Dr {i}', hospital_name='H \u0915 "quoted"',
+                                        diagnosis='-', prescription_date=now.date(), notes='n' * i)
+
+    def assert_same_json(self, chunks, data):
+        self.assertEqual(json.loads(''.join(chunks)), json.loads(json.dumps(data, cls=DjangoJSONEncoder)))
+
+    def test_iter_json_matches_json_dumps(self):
+        rows = [{'n': i, 'at': datetime.date(2024, 1, i + 1), 'text': 'a\n"b"'} for i in range(20)]
+        # (streamed document, the same document with lists in place of iterators)
+        documents = (
+            (lambda: {'rows': iter(rows), 'cursor': None}, {'rows': rows, 'cursor': None}),
+            (lambda: {'outer': {'inner': iter(rows), 'empty': iter(())}, 'plain': [1, {'x': 2}]},
+             {'outer': {'inner': rows, 'empty': []}, 'plain': [1, {'x': 2}]}),
+            (lambda: {'rows': iter([iter([1, 2]), iter([])]), 'key "quoted"': 'v'},
+             {'rows': [[1, 2], []], 'key "quoted"': 'v'}),
+            (lambda: {}, {}),
+        )
+        for make, data in documents:
+            for buffer_size in (1, 16, 1 << 20):
+                with self.subTest(buffer_size=buffer_size, document=data):
+                    self.assert_same_json(iter_json(make(), buffer_size=buffer_size), data)
+
+    def test_small_buffers_flush_in_pieces(self):
+        chunks = list(iter_json({'rows': iter(range(100))}, buffer_size=32))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunks))
+        self.assert_same_json(chunks, {'rows': list(range(100))})
+
+    def test_streamed_endpoints_match_json_response(self):
+        records = HealthRecord.objects.filter(user=self.user)
+        prescriptions = Prescription.objects.filter(user=self.user)
+        cases = (
+            ('/api/health-track/', {
+                'records': HealthRecordSerializer.serialize(records.with_bp_status().order_by('-recorded_at', '-id')),
+                'next_cursor': None,
+            }),
+            ('/api/past-records/', {
+                'health_records': PastHealthRecordSerializer.serialize(records.order_by('-recorded_at', '-id')),
+                'prescriptions': PastPrescriptionSerializer.serialize(prescriptions.order_by('-prescription_date', '-id')),
+                'health_records_next_cursor': None,
+                'prescriptions_next_cursor': None,
+            }),
+        )
+        for path, data in cases:
+            with self.subTest(path):
+                response = self.client.get(path, HTTP_AUTHORIZATION='Bearer ' + generate_token(self.user))
+                self.assertTrue(response.streaming)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                body = b''.join(response.streaming_content)
+                self.assertEqual(json.loads(body), json.loads(JsonResponse(data).content))
+
+
+class ExportFormatTests(TestCase):
+    """Every export format, plain or gzipped, must parse back into the rows that were exported."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='exporter', email='exporter@example.com')
+        other = get_user_model().objects.create_user(username='other', email='other@example.com')
+        now = timezone.now()
+        for i in range(5):
+            HealthRecord.objects.create(user=cls.user, recorded_at=now - datetime.timedelta(hours=i),
+                                        blood_pressure_systolic=120 + i, blood_pressure_diastolic=80 if i else None,
+                                        heart_rate=60 + i, weight='70.50' if i % 2 else None)
+        HealthRecord.objects.create(user=other, recorded_at=now, blood_pressure_systolic=200)
+        Medicine.objects.create(user=cls.user, name='Comma, "quoted"\nline', dosage='5mg', frequency='twice',
+                                start_date=now.date(), is_active=True)
+        Medicine.objects.create(user=cls.user, name='\u0926\u0935\u093e', dosage='1', frequency='once',
+                                start_date=now.date(), end_date=now.date(), is_active=False)
+        MentalHealthLog.objects.create(user=cls.user, mood_score=3, stress_level=2, recorded_at=now)
+
+    def export(self, fmt, types='', gzip_=False):
+        response = self.client.get('/api/export/', {'format': fmt, 'types': types, 'gzip': '1' if gzip_ else ''},
+                                   HTTP_AUTHORIZATION='Bearer ' + generate_token(self.user))
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content)
+        return gzip.decompress(body) if gzip_ else body
+
+    def test_csv_round_trip(self):
+        sections = {}
+        for row in csv.reader(io.StringIO(self.export('csv').decode())):
+            if row[0] == 'record_type':
+                header = row
+            else:
+                sections.setdefault(row[0], []).append(dict(zip(header, row)))
+        self.assertEqual({key: len(rows) for key, rows in sections.items()},
+                         {'health_records': 5, 'medicines': 2, 'mental_health_logs': 1})
+        self.assertEqual(set(sections['medicines'][0]), {'record_type', *columns(Medicine)})
+        self.assertEqual([row['name'] for row in sections['medicines']],
+                         list(Medicine.objects.filter(user=self.user).order_by('id').values_list('name', flat=True)))
+        self.assertEqual([row['id'] for row in sections['health_records']],
+                         [str(pk) for pk in HealthRecord.objects.filter(user=self.user).order_by('id').values_list('id', flat=True)])
+
+    def test_ndjson_round_trip(self):
+        lines = self.export('ndjson', 'health_records,medicines').decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['record_type'] for row in rows], ['health_records'] * 5 + ['medicines'] * 2)
+        self.assertEqual(rows[-2]['name'], 'Comma, "quoted"\nline')
+        self.assertEqual(rows[-1]['end_date'], timezone.now().date().isoformat())
+        self.assertEqual({row['blood_pressure_systolic'] for row in rows[:5]}, {120, 121, 122, 123, 124})
+
+    def test_fhir_bundle(self):
+        bundle = json.loads(self.export('fhir'))
+        self.assertEqual((bundle['resourceType'], bundle['type']), ('Bundle', 'collection'))
+        resources = [entry['resource'] for entry in bundle['entry']]
+        self.assertEqual(len({entry['fullUrl'] for entry in bundle['entry']}), len(resources))
+        kinds = [resource['resourceType'] for resource in resources]
+        # Four complete BP panels, five heart rates, two weights; mental health has no FHIR shape.
+        self.assertEqual(kinds.count('Observation'), 4 + 5 + 2)
+        self.assertEqual(kinds.count('MedicationStatement'), 2)
+        panels = [r for r in resources if r['resourceType'] == 'Observation' and 'component' in r]
+        self.assertEqual({c['valueQuantity']['unit'] for r in panels for c in r['component']}, {'mm[Hg]'})
+        statements = {r['id']: r for r in resources if r['resourceType'] == 'MedicationStatement'}
+        self.assertEqual(sorted(r['status'] for r in statements.values()), ['active', 'completed'])
+        self.assertTrue(all(r['subject'] == {'reference': f'Patient/{self.user.id}'} for r in resources))
+
+    def test_gzip_matches_plain_output(self):
+        for fmt in ('csv', 'ndjson'):
+            with self.subTest(fmt):
+                self.assertEqual(self.export(fmt, gzip_=True), self.export(fmt))
+        self.assertEqual(len(json.loads(self.export('fhir', gzip_=True))['entry']), 13)
+
+    def test_large_export_spans_buffers(self):
+        # Enough rows to flush several compressed pieces; the stream must still be one valid gzip member.
+        now = timezone.now()
+        HealthRecord.objects.bulk_create([
+            HealthRecord(user=self.user, recorded_at=now - datetime.timedelta(days=1, minutes=i), heart_rate=70)
+            for i in range(2000)
+        ])
+        for compress in (False, True):
+            with self.subTest(compress=compress):
+                chunks = list(iter_export(self.user.id, 'ndjson', ['health_records'], compress))
+                body = b''.join(chunks)
+                lines = (gzip.decompress(body) if compress else body).decode().splitlines()
+                self.assertEqual(len(lines), 2005)
+                if not compress:
+                    self.assertGreater(len(body), EXPORT_BUFFER_SIZE)
+                    self.assertGreater(len(chunks), 1)
+
+    @override_settings(EXPORT_RUN_IN_THREAD=False)
+    def test_job_artifact_downloads_intact(self):
+        auth = {'HTTP_AUTHORIZATION': 'Bearer ' + generate_token(self.user)}
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            response = self.client.post('/api/export/jobs/', {'format': 'csv', 'gzip': True},
+                                        content_type='application/json', **auth)
+            self.assertEqual(response.status_code, 202)
+            job_id = response.json()['job']['id']
+            self.assertTrue(run_export_job(job_id))
+            job = ExportJob.objects.get(pk=job_id)
+            self.assertEqual((job.status, job.row_count), ('done', 8))
+            download = self.client.get(f'/api/export/jobs/{job_id}/download/', **auth)
+            self.assertEqual(download['Content-Type'], 'application/gzip')
+            body = gzip.decompress(b''.join(download.streaming_content))
+            download.close()
+        self.assertEqual(body, self.export('csv'))
+
+
+class ActivityBufferTests(TestCase):
+    """Buffered activity writes, the spool left by a failed write, and its replay."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='active', email='active@example.com')
+
+    def setUp(self):
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        self.spool_dir = spool.name
+        # No flusher thread: the tests decide when to flush.
+        patcher = mock.patch.object(activity.ActivityBuffer, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buffer = activity.ActivityBuffer(max_size=100, spool_dir=self.spool_dir)
+
+    def log(self, count, user_id=None):
+        for i in range(count):
+            self.buffer.log(user_id or self.user.id, 'record_added', f'event {i}', '127.0.0.1')
+
+    def spooled(self):
+        return sorted(os.listdir(self.spool_dir))
+
+    def age(self, name, seconds=activity.RECOVERY_AGE + 1):
+        path = os.path.join(self.spool_dir, name)
+        then = time.time() - seconds
+        os.utime(path, (then, then))
+
+    def test_events_wait_for_flush_and_land_in_one_batch(self):
+        DashboardSummary.rebuild(self.user)
+        self.log(3)
+        self.assertEqual(ActivityLog.objects.count(), 0)
+        self.assertEqual(self.buffer.pending(), 3)
+        [segment] = self.spooled()
+        self.assertTrue(segment.endswith(activity.OPEN_SUFFIX))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.buffer.flush(), 3)
+        inserts = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "core_activitylog"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(list(ActivityLog.objects.order_by('id').values_list('details', flat=True)),
+                         ['event 0', 'event 1', 'event 2'])
+        self.assertEqual(len(DashboardSummary.objects.get(user=self.user).recent_activities), 3)
+        self.assertEqual(self.buffer.pending(), 0)
+        self.assertEqual(self.spooled(), [])
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_events_of_deleted_users_are_dropped(self):
+        self.log(1, user_id=self.user.id + 1000)
+        self.log(2)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(ActivityLog.objects.count(), 2)
+
+    def test_failed_write_leaves_the_batch_in_the_spool(self):
+        self.log(3)
+        with mock.patch.object(activity, 'write_events', side_effect=DatabaseError('down')), \
+                self.assertLogs('core.activity', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending(), 0)
+        [segment] = self.spooled()
+        self.assertTrue(segment.endswith(activity.READY_SUFFIX))
+        with open(os.path.join(self.spool_dir, segment), encoding='utf-8') as spool_file:
+            events = [json.loads(line) for line in spool_file]
+        self.assertEqual([event['details'] for event in events], ['event 0', 'event 1', 'event 2'])
+        self.assertEqual({event['user_id'] for event in events}, {self.user.id})
+
+        # Later events go to a new segment and flush normally.
+        self.log(1)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.spooled(), [segment])
+
+    def test_failed_write_without_a_spool_keeps_the_events(self):
+        self.buffer.spool_dir = None
+        self.log(2)
+        with mock.patch.object(activity, 'write_events', side_effect=DatabaseError('down')):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.pending(), 2)
+        self.assertEqual(self.buffer.flush(), 2)
+
+    def test_flush_activity_log_replays_the_spool(self):
+        self.log(3)
+        with mock.patch.object(activity, 'write_events', side_effect=DatabaseError('down')), \
+                self.assertLogs('core.activity', 'ERROR'):
+            self.buffer.flush()
+        [failed] = self.spooled()
+
+        host = socket.gethostname()
+        # A segment from a crashed process on this host, torn mid-line.
+        with open(os.path.join(self.spool_dir, f'{host}-{2 ** 22 + 1}-1{activity.OPEN_SUFFIX}'), 'w') as crashed:
+            crashed.write(json.dumps({'user_id': self.user.id, 'action': 'login', 'details': 'crashed',
+                                      'ip_address': None, 'created_at': timezone.now().isoformat()}) + '\n')
+            crashed.write('{"user_id": ')
+        # Still being written by a live process, or on another host: not ours to replay.
+        live = f'{host}-{os.getpid()}-9{activity.OPEN_SUFFIX}'
+        elsewhere = f'other-host-{2 ** 22 + 1}-1{activity.OPEN_SUFFIX}'
+        for name in (live, elsewhere):
+            open(os.path.join(self.spool_dir, name), 'w').close()
+
+        def replay():
+            out = io.StringIO()
+            with mock.patch.object(activity.activity_buffer, 'spool_dir', self.spool_dir):
+                call_command('flush_activity_log', stdout=out)
+            return out.getvalue().strip()
+
+        # A fresh .ready segment may still belong to a flush in progress.
+        self.assertEqual(replay(), 'Flushed 0 buffered and 1 spooled activity event(s)')
+        self.assertEqual(self.spooled(), sorted([failed, live, elsewhere]))
+
+        self.age(failed)
+        self.assertEqual(replay(), 'Flushed 0 buffered and 3 spooled activity event(s)')
+        self.assertEqual(self.spooled(), sorted([live, elsewhere]))
+        self.assertEqual(sorted(ActivityLog.objects.values_list('details', flat=True)),
+                         ['crashed', 'event 0', 'event 1', 'event 2'])
+        self.assertEqual(replay(), 'Flushed 0 buffered and 0 spooled activity event(s)')
+
+    def test_replay_failure_puts_the_segment_back(self):
+        self.log(2)
+        with mock.patch.object(activity, 'write_events', side_effect=DatabaseError('down')), \
+                self.assertLogs('core.activity', 'ERROR'):
+            self.buffer.flush()
+        [segment] = self.spooled()
+        self.age(segment)
+        with mock.patch.object(activity, 'write_events', side_effect=DatabaseError('still down')):
+            with self.assertRaises(DatabaseError):
+                activity.recover_spool(self.spool_dir)
+        self.assertEqual(self.spooled(), [segment])
+        self.assertEqual(activity.recover_spool(self.spool_dir), 2)
+
+
+class ActivityArchiveTests(TestCase):
+    """Retention: archiving old activity to monthly files, restoring a month, and resuming a delete."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='archived', email='archived@example.com')
+        cls.other = get_user_model().objects.create_user(username='kept', email='kept@example.com')
+        cls.cutoff = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+        for user, day in ((cls.user, datetime.date(2024, 1, 10)), (cls.other, datetime.date(2024, 1, 20)),
+                          (cls.user, datetime.date(2024, 2, 5)), (cls.user, datetime.date(2024, 3, 2))):
+            ActivityLog.objects.create(user=user, action='login', details=f'{day:%b %d}',
+                                       created_at=datetime.datetime.combine(day, datetime.time(12),
+                                                                            tzinfo=datetime.timezone.utc))
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.archive = ActivityArchive(self.directory)
+
+    def details(self):
+        return sorted(ActivityLog.objects.values_list('details', flat=True))
+
+    def command(self, *args):
+        out = io.StringIO()
+        call_command('archive_activity_logs', '--dir', self.directory, *args, stdout=out)
+        return out.getvalue()
+
+    def test_archive_moves_old_rows_to_monthly_files(self):
+        self.assertEqual(archive_before(self.archive, self.cutoff, chunk_size=2), {'2024-01': 2, '2024-02': 1})
+        self.assertEqual(self.details(), ['Mar 02'])
+
+        reopened = ActivityArchive(self.directory)
+        self.assertEqual(sorted(reopened.months), ['2024-01', '2024-02'])
+        self.assertEqual(reopened.months['2024-01']['rows'], 2)
+        self.assertEqual(reopened.months['2024-01']['user_ids'], sorted([self.user.id, self.other.id]))
+        self.assertEqual(reopened.index['pending_delete'], [])
+        self.assertEqual([row['details'] for row in reopened.read('2024-01')], ['Jan 10', 'Jan 20'])
+        self.assertEqual([row['details'] for row in reopened.search(user_id=self.other.id)], ['Jan 20'])
+        self.assertEqual([row['details'] for row in reopened.search(user_id=self.user.id, month='2024-02')], ['Feb 05'])
+
+        # A second run with nothing left to move appends nothing.
+        self.assertEqual(archive_before(reopened, self.cutoff), {})
+        self.assertEqual(reopened.months['2024-01']['rows'], 2)
+
+    def test_dry_run_touches_nothing(self):
+        self.assertEqual(archive_before(self.archive, self.cutoff, dry_run=True), {'2024-01': 2, '2024-02': 1})
+        self.assertEqual(len(self.details()), 4)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_restore_counts_only_inserted_rows(self):
+        archive_before(self.archive, self.cutoff)
+        january = list(self.archive.read('2024-01'))
+        # One row is already back in the table, so only the other is restored.
+        ActivityLog.objects.create(**{**january[0], 'created_at': datetime.datetime.fromisoformat(january[0]['created_at'])})
+
+        self.assertEqual(self.command('--restore', '2024-01', '--chunk-size', '1'), 'Restored 1 row(s) from 2024-01\n')
+        self.assertEqual(self.details(), ['Jan 10', 'Jan 20', 'Mar 02'])
+        self.assertEqual(sorted(ActivityLog.objects.filter(details__startswith='Jan').values_list('id', flat=True)),
+                         [row['id'] for row in january])
+        reopened = ActivityArchive(self.directory)
+        self.assertEqual(list(reopened.months), ['2024-02'])
+        self.assertFalse(os.path.exists(reopened.path('2024-01')))
+
+        with self.assertRaises(ArchiveError):
+            reopened.restore('2024-01')
+        with self.assertRaisesMessage(CommandError, 'No archive for 2024-01'):
+            self.command('--restore', '2024-01')
+
+    def test_interrupted_delete_is_finished_without_archiving_again(self):
+        # A run that archived a chunk and recorded it, then died before deleting it.
+        rows = list(ActivityLog.objects.filter(created_at__lt=self.cutoff).order_by('id').values(
+            'id', 'user_id', 'action', 'details', 'ip_address', 'created_at'
+        ))
+        for row in rows:
+            row['created_at'] = row['created_at'].isoformat()
+        self.archive.append('2024-01', [row for row in rows if row['created_at'].startswith('2024-01')])
+        self.archive.append('2024-02', [row for row in rows if row['created_at'].startswith('2024-02')])
+        self.archive.index['pending_delete'] = [row['id'] for row in rows]
+        self.archive.save_index()
+
+        restarted = ActivityArchive(self.directory)
+        self.assertEqual(archive_before(restarted, self.cutoff), {})
+        self.assertEqual(self.details(), ['Mar 02'])
+        self.assertEqual(restarted.months['2024-01']['rows'], 2)
+        self.assertEqual(ActivityArchive(self.directory).index['pending_delete'], [])
+        self.assertEqual(restarted.finish_pending_delete(), 0)
+
+    def test_finish_pending_delete(self):
+        ids = list(ActivityLog.objects.filter(user=self.other).values_list('id', flat=True))
+        self.archive.index['pending_delete'] = ids
+        self.archive.save_index()
+        self.assertEqual(ActivityArchive(self.directory).finish_pending_delete(), 1)
+        self.assertFalse(ActivityLog.objects.filter(user=self.other).exists())
+        self.assertEqual(ActivityArchive(self.directory).finish_pending_delete(), 0)
+
+    def test_partitioning_is_postgresql_only_and_explicit(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('Checks the non-PostgreSQL guards')
+        self.assertFalse(is_partitioned())
+        with self.assertRaises(ArchiveError):
+            convert_to_partitioned()
+        with self.assertRaisesMessage(CommandError, 'only supported on PostgreSQL'):
+            self.command('--partition', '--convert')
+
+    @mock.patch('core.archive.is_partitioned', return_value=False)
+    @mock.patch('core.archive.convert_to_partitioned')
+    def test_converting_requires_the_convert_flag(self, convert, partitioned):
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            with self.assertRaisesMessage(CommandError, '--convert'):
+                self.command('--partition')
+            convert.assert_not_called()
+            convert.return_value = []
+            self.assertIn('Converted', self.command('--partition', '--convert'))
+        convert.assert_called_once_with(3)
+
+
+class RateLimitMathTests(SimpleTestCase):
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('10/m'), (10, 60))
+        self.assertEqual(parse_rate(' 5/10m '), (5, 600))
+        self.assertEqual(parse_rate('200/d'), (200, 86400))
+        for bad in ('10', '10/w', '/m', 'ten/m', '10/-1m'):
+            with self.subTest(bad), self.assertRaises(ValueError):
+                parse_rate(bad)
+
+    def test_previous_window_weight_falls_linearly(self):
+        self.assertEqual(sliding_count(10, 3, 0, 60), 13)
+        self.assertEqual(sliding_count(10, 3, 15, 60), 10.5)
+        self.assertEqual(sliding_count(10, 3, 30, 60), 8)
+        self.assertAlmostEqual(sliding_count(10, 3, 59.999, 60), 3, places=2)
+        self.assertEqual(sliding_count(0, 3, 0, 60), 3)
+
+    def test_retry_after_lands_on_the_limit(self):
+        window, limit = 60, 10
+        for previous, current, elapsed in ((10, 5, 0), (20, 1, 10), (12, 10, 59), (0, 11, 0), (30, 25, 40), (5, 11, 59.5)):
+            with self.subTest(previous=previous, current=current, elapsed=elapsed):
+                wait = retry_after(previous, current, elapsed, window, limit)
+                self.assertGreater(wait, 0)
+                later = elapsed + wait
+                if later < window:
+                    # Still in this window: the previous window's weight has fallen far enough.
+                    count = sliding_count(previous, current, later, window)
+                else:
+                    # This window has closed and is now the weighted previous one.
+                    count = sliding_count(current, 0, later - window, window)
+                self.assertAlmostEqual(count, limit)
+
+    def test_retry_after_is_zero_once_the_count_fits(self):
+        self.assertEqual(retry_after(10, 5, 45, 60, 10), 0.0)
+
+    def assert_window_edges(self, limiter):
+        # 5/m: five hits pass and the sixth is refused, in the first window.
+        results = [limiter.hit('k', '5/m', now=600 + i) for i in range(6)]
+        self.assertEqual(results[:5], [None] * 5)
+        self.assertAlmostEqual(results[5], 55 + 60 * (1 - 5 / 6))
+        # Right after the boundary the six hits still weigh in fully (rejections count).
+        self.assertIsNotNone(limiter.hit('k', '5/m', now=660))
+        # Half a window later the six weigh 3; with the two hits of this window that is 5, still allowed.
+        self.assertIsNone(limiter.hit('k', '5/m', now=690))
+        # Two windows on, the old counts are gone.
+        self.assertEqual([limiter.hit('k', '5/m', now=780 + i) for i in range(5)], [None] * 5)
+        # Keys and rates are counted separately.
+        self.assertIsNone(limiter.hit('other', '5/m', now=785))
+        self.assertIsNone(limiter.hit('k', '100/m', now=785))
+
+    def test_memory_backend_window_edges(self):
+        self.assert_window_edges(RateLimiter(MemoryBackend()))
+
+    def test_memory_backend_evicts_the_oldest_key(self):
+        backend = MemoryBackend(maxsize=2)
+        for key in ('a', 'b', 'a', 'c'):
+            backend.hit(key, 60, 0)
+        self.assertEqual(list(backend._windows), ['a', 'c'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                           'LOCATION': 'ratelimit-tests'}})
+    def test_cache_backend_window_edges(self):
+        backend = CacheBackend()
+        backend.cache.clear()
+        self.addCleanup(backend.cache.clear)
+        self.assert_window_edges(RateLimiter(backend))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                           'LOCATION': 'ratelimit-tests'}})
+    def test_cache_backend_reads_a_closed_window_once(self):
+        backend = CacheBackend()
+        backend.cache.clear()
+        self.addCleanup(backend.cache.clear)
+        for second in range(3):
+            backend.hit('k', 60, second)
+        with mock.patch.object(backend.cache, 'get', wraps=backend.cache.get) as get:
+            self.assertEqual(backend.hit('k', 60, 60), (3, 1))
+            self.assertEqual(backend.hit('k', 60, 61), (3, 2))
+        self.assertEqual(get.call_count, 1)
+        # Another worker's hits land in the same keys.
+        self.assertEqual(CacheBackend().hit('k', 60, 62), (3, 3))
+
+
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_BACKEND='memory', RATE_LIMIT_IP_HEADER='',
+                   RATE_LIMITS={'api_login': [('ip', '3/m'), ('username', '2/10m')]})
+class RateLimitMiddlewareTests(TestCase):
+    def login(self, username='nobody', ip='10.0.0.1'):
+        return self.client.post('/accounts/api/login/', json.dumps({'username': username, 'password': 'x'}),
+                                content_type='application/json', REMOTE_ADDR=ip)
+
+    def test_request_past_the_limit_gets_429(self):
+        self.assertEqual([self.login(f'user{i}').status_code for i in range(3)], [401] * 3)
+        response = self.login('user3')
+        self.assertEqual(response.status_code, 429)
+        retry = int(response['Retry-After'])
+        self.assertTrue(1 <= retry <= 120)
+        self.assertEqual(response.json()['retry_after'], retry)
+        # Another address has its own allowance.
+        self.assertEqual(self.login('user4', ip='10.0.0.2').status_code, 401)
+
+    def test_body_field_rule(self):
+        self.assertEqual([self.login('Target', ip=f'10.0.1.{i}').status_code for i in range(2)], [401, 401])
+        self.assertEqual(self.login(' target ', ip='10.0.1.9').status_code, 429)
+        self.assertEqual(self.login('someone-else', ip='10.0.1.9').status_code, 401)
+
+    def test_preflight_and_unlisted_views_are_not_counted(self):
+        for _ in range(5):
+            self.client.options('/accounts/api/login/', REMOTE_ADDR='10.0.0.1')
+            self.client.post('/accounts/api/resend-otp/', '{}', content_type='application/json', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(self.login().status_code, 401)
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual({self.login(f'user{i}').status_code for i in range(5)}, {401})
+
+
+class RateLimitSettingsTests(SimpleTestCase):
+    def import_settings(self, **env):
+        environ = {key: value for key, value in os.environ.items() if not key.startswith(('REDIS_URL', 'RATE_LIMIT'))}
+        # Vercel also requires a database URL; any will do for an import.
+        env = {'VERCEL': '1', 'DATABASE_URL': 'sqlite:///unused.sqlite3', **env}
+        return subprocess.run([sys.executable, '-c', 'import healthtracker.settings'], env={**environ, **env},
+                              cwd=settings.BASE_DIR, capture_output=True, text=True)
+
+    def test_serverless_without_a_shared_cache_refuses_to_start(self):
+        result = self.import_settings()
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('ImproperlyConfigured: Rate limiting on Vercel needs a shared cache', result.stderr)
+        for opt_out in ({'RATE_LIMIT_BACKEND': 'memory'}, {'RATE_LIMIT_ENABLED': 'false'}, {'REDIS_URL': 'redis://cache:6379/0'}):
+            with self.subTest(opt_out):
+                self.assertEqual(self.import_settings(**opt_out).returncode, 0)
+
+
+class RateLimitKeyTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_client_ip(self):
+        request = self.factory.get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.1.1.1, 2.2.2.2')
+        with override_settings(RATE_LIMIT_IP_HEADER=''):
+            # A client-supplied header is ignored unless a proxy is configured to set it.
+            self.assertEqual(client_ip(request), '10.0.0.1')
+        with override_settings(RATE_LIMIT_IP_HEADER='X-Forwarded-For'):
+            self.assertEqual(client_ip(request), '2.2.2.2')
+            self.assertEqual(client_ip(self.factory.get('/', REMOTE_ADDR='10.0.0.1')), '10.0.0.1')
+
+    def test_token_user_id(self):
+        user = get_user_model().objects.create_user(username='limited', email='limited@example.com')
+        token = generate_token(user)
+        self.assertEqual(_token_user_id(self.factory.get('/', HTTP_AUTHORIZATION='Bearer ' + token)), user.id)
+        for header in ('', 'Token ' + token, 'Bearer not-a-token', 'Bearer ' + token[:-2]):
+            with self.subTest(header):
+                self.assertIsNone(_token_user_id(self.factory.get('/', HTTP_AUTHORIZATION=header)))
+
+        anonymous = self.factory.get('/', REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(rate_limit_key(anonymous, 'user'), 'anon:10.0.0.5')
+        signed_in = self.factory.get('/', HTTP_AUTHORIZATION='Bearer ' + token)
+        self.assertEqual(rate_limit_key(signed_in, 'user'), f'user:{user.id}')
+
+    def test_body_field(self):
+        def post(body, content_type='application/json'):
+            return self.factory.post('/', body, content_type=content_type)
+
+        request = post(json.dumps({'email': ' Someone@Example.COM ', 'count': 0}))
+        self.assertEqual(_body_field(request, 'email'), 'someone@example.com')
+        self.assertIsNone(_body_field(request, 'count'))
+        self.assertIsNone(_body_field(request, 'missing'))
+        self.assertEqual(rate_limit_key(request, 'email'), 'email:someone@example.com')
+        self.assertIsNone(rate_limit_key(request, 'missing'))
+        for unreadable in (post('{not json'), post('["a"]'), post('email=a@b.c', 'application/x-www-form-urlencoded')):
+            with self.subTest(unreadable.body):
+                self.assertIsNone(_body_field(unreadable, 'email'))
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        cases = [
+            ('bytes=0-99', 1000, (0, 99)),
+            ('bytes=100-', 1000, (100, 999)),
+            ('bytes=900-5000', 1000, (900, 999)),
+            ('bytes=999-999', 1000, (999, 999)),
+            ('bytes=-100', 1000, (900, 999)),
+            ('bytes=-5000', 1000, (0, 999)),
+            (' bytes=0-0 ', 1, (0, 0)),
+            # Unsatisfiable.
+            ('bytes=1000-', 1000, 'invalid'),
+            ('bytes=5-4', 1000, 'invalid'),
+            ('bytes=-0', 1000, 'invalid'),
+            ('bytes=0-', 0, 'invalid'),
+            ('bytes=-1', 0, 'invalid'),
+            ('bytes=-100', 0, 'invalid'),
+            # Not a single byte range: the whole file.
+            (None, 1000, None),
+            ('', 1000, None),
+            ('bytes=-', 1000, None),
+            ('bytes=0-1,5-6', 1000, None),
+            ('items=0-1', 1000, None),
+            ('bytes=a-b', 1000, None),
+        ]
+        for header, size, expected in cases:
+            with self.subTest(header=header, size=size):
+                self.assertEqual(parse_range(header, size), expected)
+
+
+def computed_dashboard(user):
+    """dashboard_api's payload as it was computed from the source tables before DashboardSummary."""
+    latest_record = HealthRecord.objects.filter(user_id=user.id).first()
+    latest_record_data = None
+    if latest_record:
+        latest_record_data = {
+            'blood_pressure_systolic': latest_record.blood_pressure_systolic,
+            'blood_pressure_diastolic': latest_record.blood_pressure_diastolic,
+            'bp_status': latest_record.bp_status,
+            'blood_sugar': str(latest_record.blood_sugar) if latest_record.blood_sugar else None,
+            'weight': str(latest_record.weight) if latest_record.weight else None,
+            'heart_rate': latest_record.heart_rate,
+            'recorded_at': latest_record.recorded_at.isoformat()
+        }
+    active_medicines = Medicine.objects.filter(user_id=user.id, is_active=True).count()
+    # created_at_since is left out: the SPA derives it, so a 304 can't freeze it.
+    recent_activities = [{
+        'action': activity.get_action_display(),
+        'action_display': activity.get_action_display(),
+        'details': activity.details,
+        'created_at': activity.created_at.isoformat(),
+    } for activity in ActivityLog.objects.filter(user_id=user.id)[:5]]
+    latest_mental_health = MentalHealthLog.objects.filter(user_id=user.id).first()
+    mental_health_data = None
+    if latest_mental_health:
+        mental_health_data = {
+            'sleep_hours': str(latest_mental_health.sleep_hours) if latest_mental_health.sleep_hours else None,
+            'mood_score': latest_mental_health.mood_score,
+            'stress_level': latest_mental_health.stress_level
+        }
+    return {
+        'user': {'name': f"{user.first_name} {user.last_name}".strip() or user.username, 'email': user.email},
+        'latest_record': latest_record_data,
+        'active_medicines': active_medicines,
+        'active_medicines_count': active_medicines,
+        'recent_activities': recent_activities,
+        'latest_mental_health': mental_health_data
+    }
+
+
+class DashboardSummaryTests(TestCase):
+    """The summary row must serve exactly what the dashboard used to compute."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='summary', email='summary@example.com')
+        self.now = timezone.now()
+
+    def assertMatchesComputed(self):
+        response = self.client.get('/api/dashboard/', HTTP_AUTHORIZATION='Bearer ' + generate_token(self.user))
+        self.user.refresh_from_db()
+        self.assertEqual(response.json(), computed_dashboard(self.user))
+
+    def test_rebuilt_on_first_read(self):
+        self.assertMatchesComputed()
+        HealthRecord.objects.create(user=self.user, blood_pressure_systolic=125, blood_pressure_diastolic=75)
+        DashboardSummary.objects.all().delete()
+        self.assertMatchesComputed()
+
+    def test_follows_creates_updates_and_deletes(self):
+        self.assertMatchesComputed()  # Creates the summary, so every write below must refresh it.
+        older = HealthRecord.objects.create(user=self.user, heart_rate=60, recorded_at=self.now - datetime.timedelta(days=1))
+        newer = HealthRecord.objects.create(user=self.user, blood_pressure_systolic=135, blood_pressure_diastolic=85,
+                                            blood_sugar='98.50', weight='70.25', recorded_at=self.now)
+        medicine = Medicine.objects.create(user=self.user, name='A', dosage='1', frequency='once', start_date=self.now.date())
+        Medicine.objects.create(user=self.user, name='B', dosage='1', frequency='once', start_date=self.now.date())
+        mood = MentalHealthLog.objects.create(user=self.user, mood_score=4, stress_level=2, sleep_hours='7.5')
+        for i in range(7):
+            ActivityLog.objects.create(user=self.user, action='login', details=str(i),
+                                       created_at=self.now - datetime.timedelta(minutes=10 - i))
+        self.assertMatchesComputed()
+
+        newer.blood_pressure_systolic = 150
+        newer.save()
+        medicine.is_active = False
+        medicine.save()
+        mood.mood_score = 1
+        mood.save()
+        self.user.first_name = 'Renamed'
+        self.user.email = 'renamed@example.com'
+        self.user.save()
+        self.assertMatchesComputed()
+
+        newer.delete()
+        mood.delete()
+        ActivityLog.objects.filter(user=self.user).order_by('-created_at').first().delete()
+        self.assertMatchesComputed()
+        older.delete()
+        self.assertMatchesComputed()
+
+    def test_follows_batch_ingestion(self):
+        self.assertMatchesComputed()
+        ingest_readings(self.user.id, [
+            {'recorded_at': (self.now - datetime.timedelta(hours=i)).isoformat(), 'heart_rate': 60 + i}
+            for i in range(3)
+        ])
+        self.assertMatchesComputed()
+        self.assertEqual(DashboardSummary.objects.get(user=self.user).latest_record['heart_rate'], 60)
+
+
+class RejectingBackend(locmem.EmailBackend):
+    """locmem backend that refuses mail to rejected@example.com and counts its connections."""
+    opened = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        type(self).opened += 1
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'rejected@example.com' in message.to:
+                raise smtplib.SMTPRecipientsRefused({'rejected@example.com': (550, b'rejected')})
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='core.tests.RejectingBackend', EMAIL_HOST_USER='noreply@example.com',
+    OUTBOX_RUN_IN_THREAD=False, OUTBOX_SEND_INLINE=False, RATE_LIMIT_ENABLED=False,
+)
+class OutboxTests(TestCase):
+    def setUp(self):
+        RejectingBackend.opened = 0
+
+    def enqueue(self, to='patient@example.com', subject='Hello'):
+        return outbox.enqueue_email(subject, 'Body', 'noreply@example.com', [to])
+
+    def test_queued_mail_is_sent_by_the_worker(self):
+        message = self.enqueue()
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(outbox.send_pending(), (1, 0))
+        self.assertEqual([m.to for m in mail.outbox], [['patient@example.com']])
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('sent', 1))
+        self.assertEqual(outbox.send_pending(), (0, 0))
+
+    def test_a_batch_shares_one_connection(self):
+        for i in range(5):
+            self.enqueue(to=f'patient{i}@example.com')
+        self.assertEqual(outbox.send_pending(), (5, 0))
+        self.assertEqual(RejectingBackend.opened, 1)
+
+    def test_failures_back_off_then_give_up(self):
+        message = self.enqueue(to='rejected@example.com')
+        self.enqueue()
+        with self.assertLogs('core.outbox', 'WARNING'):
+            self.assertEqual(outbox.send_pending(), (1, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertIn('SMTPRecipientsRefused', message.last_error)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        # Not due yet.
+        self.assertEqual(outbox.send_pending(), (0, 0))
+
+        for attempt in range(2, outbox.MAX_ATTEMPTS + 1):
+            OutboxEmail.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+            with self.assertLogs('core.outbox', 'WARNING'):
+                self.assertEqual(outbox.send_pending(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('failed', outbox.MAX_ATTEMPTS))
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(EMAIL_BACKEND='django.core.mail.backends.filebased.EmailBackend',
+                               EMAIL_FILE_PATH=directory):
+                self.enqueue(subject='Written to disk')
+                self.assertEqual(outbox.send_pending(), (1, 0))
+            [name] = os.listdir(directory)
+            with open(os.path.join(directory, name)) as f:
+                self.assertIn('Subject: Written to disk', f.read())
+
+    @override_settings(OUTBOX_SEND_INLINE=True)
+    def test_inline_send_waits_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            message = self.enqueue()
+            self.assertEqual(mail.outbox, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(mail.outbox), 1)
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'sent')
+
+    @override_settings(OUTBOX_SEND_INLINE=True)
+    def test_inline_failure_is_left_for_retry(self):
+        with self.assertLogs('core.outbox', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            message = self.enqueue(to='rejected@example.com')
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+
+    @override_settings(CRON_SECRET='cron-secret')
+    def test_cron_endpoint_requires_the_secret(self):
+        self.enqueue()
+        self.assertEqual(self.client.get('/api/cron/send-queued-mail/').status_code, 401)
+        self.assertEqual(len(mail.outbox), 0)
+        response = self.client.get('/api/cron/send-queued-mail/', HTTP_AUTHORIZATION='Bearer cron-secret')
+        self.assertEqual(response.json(), {'success': True, 'sent': 1, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_login_otp_arrives_by_mail(self):
+        get_user_model().objects.create_user(username='mailed', email='mailed@example.com', password='pw12345!')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/accounts/api/login/', json.dumps({'username': 'mailed', 'password': 'pw12345!'}),
+                                        content_type='application/json')
+        self.assertTrue(response.json()['otp_required'])
+        self.assertEqual(outbox.send_pending(), (1, 0))
+        [message] = mail.outbox
+        self.assertEqual(message.to, ['mailed@example.com'])
+        code = re.search(r'\b(\d{6})\b', message.body).group(1)
+        response = self.client.post('/accounts/api/verify-otp/', json.dumps(
+            {'email': 'mailed@example.com', 'otp': code, 'otp_type': 'login'}
+        ), content_type='application/json')
+        self.assertTrue(response.json()['success'])
+
+
+class SingleFlightTests(SimpleTestCase):
+    callers = 20
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.calls = 0
+
+    def leader_work(self, result):
+        # Hold the leader until everyone else has joined, so the test does not depend on timing.
+        self.calls += 1
+        wait_until(lambda: self.flight.coalesced == self.callers - 1)
+        return result
+
+    def test_threads_share_one_call(self):
+        results = run_concurrently(self.callers, lambda i: self.flight.do('key', self.leader_work, object()))
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(self.flight.in_flight(), 0)
+
+    def test_followers_see_the_leaders_exception(self):
+        def fail():
+            self.leader_work(None)
+            raise ValueError('upstream failed')
+
+        def caller(i):
+            try:
+                self.flight.do('key', fail)
+            except ValueError as e:
+                return e
+
+        errors = run_concurrently(self.callers, caller)
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(isinstance(error, ValueError) for error in errors))
+        # The key is free again once the call finished.
+        self.assertEqual(self.flight.do('key', lambda: 'retried'), 'retried')
+
+    def test_different_keys_do_not_share(self):
+        self.assertEqual([self.flight.do(key, str, key) for key in ('a', 'b')], ['a', 'b'])
+        self.assertEqual(self.flight.coalesced, 0)
+
+    def test_tasks_share_one_call(self):
+        async def compute():
+            self.calls += 1
+            await asyncio.sleep(0)
+            return object()
+
+        async def main():
+            return await asyncio.gather(*(self.flight.do_async('key', compute) for _ in range(self.callers)))
+
+        results = asyncio.run(main())
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.flight.coalesced, self.callers - 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(self.flight.in_flight(), 0)
+
+    def test_cancelled_waiter_does_not_cancel_the_others(self):
+        async def compute():
+            await asyncio.sleep(0.05)
+            return 'answer'
+
+        async def main():
+            leader = asyncio.ensure_future(self.flight.do_async('key', compute))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(self.flight.do_async('key', compute))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(asyncio.run(main()), 'answer')
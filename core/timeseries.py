@@ -0,0 +1,116 @@
+"""
+Server-side downsampling for HealthRecord charts.
+
+Two strategies are offered: time-bucketed min/avg/max aggregates computed in
+SQL, and Largest-Triangle-Three-Buckets (LTTB) over the raw readings, which
+keeps the visual shape of the series while returning a fixed number of points.
+"""
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncDate, TruncHour, TruncMonth, TruncWeek
+
+# Public metric name -> HealthRecord field.
+METRICS = {
+    'systolic': 'blood_pressure_systolic',
+    'diastolic': 'blood_pressure_diastolic',
+    'blood_sugar': 'blood_sugar',
+    'weight': 'weight',
+    'heart_rate': 'heart_rate',
+    'oxygen_level': 'oxygen_level',
+}
+
+# Bucket granularities, finest first, with their approximate length in seconds.
+BUCKETS = [
+    ('hour', TruncHour, 3600),
+    ('day', TruncDate, 86400),
+    ('week', TruncWeek, 7 * 86400),
+    ('month', TruncMonth, 30 * 86400),
+]
+
+
+def choose_bucket(start, end, points):
+    """Pick the finest granularity that yields at most `points` buckets over the range."""
+    span = max((end - start).total_seconds(), 1)
+    for name, trunc, seconds in BUCKETS:
+        if span / seconds <= points:
+            return name, trunc
+    return BUCKETS[-1][0], BUCKETS[-1][1]
+
+
+def _number(value):
+    return float(value) if value is not None else None
+
+
+def bucketed_series(queryset, field, start, end, points):
+    """
+    Aggregate `field` over `queryset` (already restricted to start..end) into
+    time buckets. Returns (bucket_name, rows) with one row per non-empty bucket.
+    """
+    bucket, trunc = choose_bucket(start, end, points)
+    rows = (
+        queryset.filter(**{f'{field}__isnull': False})
+        .annotate(bucket=trunc('recorded_at'))
+        .values('bucket')
+        .annotate(min=Min(field), avg=Avg(field), max=Max(field), count=Count('id'))
+        .order_by('bucket')
+    )
+    return bucket, [
+        {
+            't': row['bucket'].isoformat(),
+            'min': _number(row['min']),
+            'avg': round(_number(row['avg']), 2),
+            'max': _number(row['max']),
+            'count': row['count'],
+        }
+        for row in rows
+    ]
+
+
+def lttb(data, threshold):
+    """
+    Downsample `data`, a list of tuples sorted by x whose first two items are
+    (x, y), to `threshold` points with Largest-Triangle-Three-Buckets. The
+    selected tuples are returned unchanged; first and last are always kept.
+    """
+    length = len(data)
+    if threshold >= length or threshold < 3:
+        return list(data)
+
+    sampled = [data[0]]
+    every = (length - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third vertex of the triangle.
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, length)
+        next_bucket = data[next_start:next_end]
+        avg_x = sum(point[0] for point in next_bucket) / len(next_bucket)
+        avg_y = sum(point[1] for point in next_bucket) / len(next_bucket)
+
+        ax, ay = data[a][0], data[a][1]
+        best_area = -1
+        best = None
+        for j in range(int(i * every) + 1, next_start):
+            x, y = data[j][0], data[j][1]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        sampled.append(data[best])
+        a = best
+    sampled.append(data[-1])
+    return sampled
+
+
+def lttb_series(queryset, field, points):
+    """Stream the raw readings of `field` in time order and LTTB-downsample them."""
+    readings = (
+        queryset.filter(**{f'{field}__isnull': False})
+        .order_by('recorded_at', 'id')
+        .values_list('recorded_at', field)
+        .iterator(chunk_size=2000)
+    )
+    data = [(recorded_at.timestamp(), float(value), recorded_at) for recorded_at, value in readings]
+    return [
+        {'t': recorded_at.isoformat(), 'value': value}
+        for _, value, recorded_at in lttb(data, points)
+    ]
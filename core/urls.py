@@ -7,22 +7,31 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('api/dashboard/', api_views.dashboard_api, name='dashboard_api'),
     path('api/health-track/add/', api_views.add_health_record_api, name='add_health_record_api'),
+    path('api/health-track/bulk/', api_views.add_health_records_bulk_api, name='add_health_records_bulk_api'),
     path('api/medicines/add/', api_views.add_medicine_api, name='add_medicine_api'),
     path('api/prescriptions/add/', api_views.add_prescription_api, name='add_prescription_api'),
     
     # Getter APIs
     path('api/medicines/', api_views.medicines_api, name='medicines_api'),
     path('api/health-track/', api_views.health_track_api, name='health_track_api'),
+    path('api/health-track/series/', api_views.health_series_api, name='health_series_api'),
+    path('api/health-track/bp-histogram/', api_views.bp_histogram_api, name='bp_histogram_api'),
     path('api/prescriptions/', api_views.prescriptions_api, name='prescriptions_api'),
     path('api/profile/', api_views.profile_api, name='profile_api'),
     path('api/mental-health/', api_views.mental_health_api, name='mental_health_api'),
     path('api/lifestyle/', api_views.lifestyle_api, name='lifestyle_api'),
     path('api/insurance/', api_views.insurance_api, name='insurance_api'),
     path('api/past-records/', api_views.past_records_api, name='past_records_api'),
+    path('api/sync/', api_views.sync_api, name='sync_api'),
+    path('api/export/', api_views.export_api, name='export_api'),
+    path('api/export/jobs/', api_views.export_jobs_api, name='export_jobs_api'),
+    path('api/export/jobs/<int:job_id>/', api_views.export_job_api, name='export_job_api'),
+    path('api/export/jobs/<int:job_id>/download/', api_views.export_job_download_api, name='export_job_download_api'),
     path('api/appointments/', api_views.appointments_api, name='appointments_api'),
     path('api/appointments/<int:appointment_id>/action/', api_views.appointment_action_api, name='appointment_action_api'),
     path('api/service-requests/', api_views.service_requests_api, name='service_requests_api'),
     path('api/service-requests/<int:request_id>/action/', api_views.service_request_action_api, name='service_request_action_api'),
+    path('api/cron/send-queued-mail/', api_views.send_queued_mail_cron, name='send_queued_mail_cron'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('provider-dashboard/', views.provider_dashboard, name='provider_dashboard'),
     path('medicines/', views.medicines, name='medicines'),
@@ -1,11 +1,15 @@
+import logging
 import uuid
-from django.core.mail import send_mail
 from django.conf import settings
 from django.urls import reverse
 
+from .outbox import enqueue_email
+
+logger = logging.getLogger(__name__)
+
 def send_otp_email(email, otp, first_name=None):
     """
-    Sends an OTP code to the user's email address.
+    Queues an OTP email to the user's address; sent by the outbox worker.
     """
     subject = 'Your HealthTrack+ Verification Code'
     message = f"""Hi {first_name or 'there'},
@@ -26,30 +30,19 @@ The HealthTrack+ Team
     from_email = settings.EMAIL_HOST_USER
     
     if not from_email:
-        print("ERROR: EMAIL_HOST_USER is not configured!")
+        logger.error("EMAIL_HOST_USER is not configured; OTP email not sent.")
         return False
     
     try:
-        print(f"--- [DEVELOPMENT ONLY] OTP for {email}: {otp} ---")
-        print(f"Sending OTP email to {email} from {from_email}...")
-        result = send_mail(
-            subject,
-            message,
-            from_email,
-            [email],
-            fail_silently=False,
-        )
-        print(f"Email sent successfully! Result: {result}")
+        enqueue_email(subject, message, from_email, [email])
         return True
     except Exception as e:
-        print(f"Error sending OTP email: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"Error queueing OTP email: {type(e).__name__}: {e}")
         return False
 
 def send_verification_email(user, request):
     """
-    Generates a verification token and sends an email to the user.
+    Generates a verification token and queues the verification email.
     """
     token = str(uuid.uuid4())
     user.verification_token = token
@@ -77,15 +70,14 @@ The HealthTrack+ Team
 """
     
     try:
-        send_mail(
+        enqueue_email(
             subject,
             message,
             getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@healthtrack.plus'),
             [user.email],
-            fail_silently=False,
         )
         return True
     except Exception as e:
-        print(f"Error sending verification email: {e}")
+        logger.error(f"Error queueing verification email: {e}")
         return False
 
@@ -0,0 +1,85 @@
+"""
+Per-user data versions for conditional GETs.
+
+Every write to a user's data bumps a version token stored in the user's
+DataVersion row. Read APIs derive their ETag from it before touching the
+data, so a poll with a matching If-None-Match is answered 304 after a
+single primary-key read.
+
+The version lives in the database rather than the cache. A LocMem cache is
+private to one worker or serverless instance, and the other instances would
+keep answering 304 for data that changed. Bumps are deferred until the
+writing transaction commits, so a concurrent GET can't pair the new ETag
+with the old data.
+
+Versions are fresh nanosecond timestamps rather than counters, so a
+recreated row can never bring an old ETag back to life.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags
+
+from .models import DataVersion
+
+
+def get_data_version(user_id):
+    version = DataVersion.objects.filter(user_id=user_id).values_list('version', flat=True).first()
+    if version is None:
+        # First read: start a version; a concurrent first read may win the insert.
+        version = DataVersion.objects.get_or_create(user_id=user_id, defaults={'version': time.time_ns()})[0].version
+    return version
+
+
+def bump_data_version(*user_ids):
+    user_ids = [user_id for user_id in user_ids if user_id]
+    if not user_ids:
+        return
+
+    def store():
+        # Users without a row have no ETag out yet; their first read creates
+        # a fresh version, which is newer than this write.
+        DataVersion.objects.filter(user_id__in=user_ids).update(version=time.time_ns())
+    transaction.on_commit(store)
+
+
+def user_data_etag(view_func):
+    """
+    Conditional GET support for per-user read APIs; stack below @jwt_required.
+
+    The ETag covers the user's data version and the full request path, so each
+    endpoint and query string gets its own tag. Only If-None-Match is honoured:
+    HTTP dates have one-second resolution, too coarse to tell two writes apart,
+    so Last-Modified is informational.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view_func(request, *args, **kwargs)
+
+        user_id = request.user.id
+        version = get_data_version(user_id)
+        digest = hashlib.sha1(f'{user_id}:{version}:{request.get_full_path()}'.encode('utf-8')).hexdigest()
+        etag = f'W/"{digest}"'
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            client_etags = parse_etags(if_none_match)
+            if '*' in client_etags or digest in (tag.removeprefix('W/').strip('"') for tag in client_etags):
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                patch_vary_headers(response, ['Authorization'])
+                return response
+
+        response = view_func(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(version / 1e9)
+            response['Cache-Control'] = 'private, no-cache'
+            patch_vary_headers(response, ['Authorization'])
+        return response
+    return wrapper
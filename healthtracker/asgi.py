@@ -2,6 +2,9 @@
 ASGI config for healthtracker project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn healthtracker.asgi:application``)
+for async views such as the streaming chatbot endpoint, which WSGI can only
+deliver once the whole stream has been buffered.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
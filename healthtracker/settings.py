@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,9 +9,31 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.environ.get('SESSION_SECRET', 'django-insecure-dev-key-change-in-production')
 
+# JWT signing keyring. New tokens are signed with SECRET_KEY under JWT_KEY_ID;
+# retired keys stay verifiable during rotation via JWT_PREVIOUS_KEYS, given as
+# comma-separated "kid:secret" pairs.
+JWT_KEY_ID = os.environ.get('JWT_KEY_ID', 'default')
+JWT_PREVIOUS_KEYS = dict(
+    pair.split(':', 1) for pair in os.environ.get('JWT_PREVIOUS_KEYS', '').split(',') if ':' in pair
+)
+
+# Number of verified JWTs each worker keeps in memory (see jwt.TokenCache).
+JWT_TOKEN_CACHE_SIZE = int(os.environ.get('JWT_TOKEN_CACHE_SIZE', '1024'))
+
+# Per-process cache of authenticated users (see accounts/auth.py).
+USER_SNAPSHOT_CACHE_SIZE = int(os.environ.get('USER_SNAPSHOT_CACHE_SIZE', '1024'))
+USER_SNAPSHOT_CACHE_TTL = int(os.environ.get('USER_SNAPSHOT_CACHE_TTL', '60'))
+
 GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 
+# Chatbot providers (see chatbot/providers.py); point the URLs at
+# `manage.py run_fake_provider` to develop without real keys.
+GROQ_API_URL = os.environ.get('GROQ_API_URL', 'https://api.groq.com/openai/v1/chat/completions')
+GROQ_MODEL = os.environ.get('GROQ_MODEL', 'llama-3.3-70b-versatile')
+OPENROUTER_API_URL = os.environ.get('OPENROUTER_API_URL', 'https://openrouter.ai/api/v1/chat/completions')
+OPENROUTER_MODEL = os.environ.get('OPENROUTER_MODEL', 'google/gemini-2.0-flash-001')
+
 # Default to safe behavior on Vercel (production), but keep local-dev convenient.
 _default_debug = 'False' if os.environ.get('VERCEL') else 'True'
 DEBUG = os.environ.get('DEBUG', _default_debug).lower() in ('true', '1', 'yes')
@@ -61,6 +84,23 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.environ.get('EMAIL_HOST_USER', 'noreply@healthtrack.plus')
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', '10'))
+
+# Email outbox (see core/outbox.py). By default a background thread sends
+# queued mail. Vercel freezes the function once the response is out, so there
+# each message is sent inline when its transaction commits. The cron in
+# vercel.json retries failures through /api/cron/send-queued-mail/; Vercel
+# authenticates it with CRON_SECRET as a bearer token. Other hosts that can't
+# keep a thread alive should run `manage.py send_queued_mail`.
+OUTBOX_SEND_INLINE = os.environ.get(
+    'OUTBOX_SEND_INLINE', 'true' if os.environ.get('VERCEL') else 'false'
+).lower() in ('true', '1', 'yes')
+OUTBOX_RUN_IN_THREAD = os.environ.get(
+    'OUTBOX_RUN_IN_THREAD', 'false' if os.environ.get('VERCEL') else 'true'
+).lower() in ('true', '1', 'yes')
+CRON_SECRET = os.environ.get('CRON_SECRET', '')
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '5'))
 
 SOCIALACCOUNT_PROVIDERS = {
     'google': {
@@ -79,6 +119,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.ratelimit.RateLimitMiddleware',
 ]
 
 ROOT_URLCONF = 'healthtracker.urls'
@@ -108,6 +149,58 @@ DATABASES = {
     }
 }
 
+# Shared cache. Rate limits, cache-backed OTPs and other cross-request state
+# need one cache for all workers, so production should set REDIS_URL; the
+# local-memory fallback is only correct for a single process.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# One-time passcodes (see accounts/otp.py). The cache backend needs the shared
+# Redis cache; without it codes are kept in the database.
+OTP_BACKEND = os.environ.get('OTP_BACKEND', 'cache' if REDIS_URL else 'db')
+OTP_TTL_SECONDS = int(os.environ.get('OTP_TTL_SECONDS', '600'))
+OTP_MAX_ATTEMPTS = int(os.environ.get('OTP_MAX_ATTEMPTS', '5'))
+
+# Rate limits by URL name (see core/ratelimit.py). Counters live in the shared
+# cache when there is one. RATE_LIMIT_IP_HEADER names the client-address header
+# set by the proxy in front of us (Vercel sets X-Forwarded-For); leave it empty
+# when clients connect directly, since they can forge it.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('true', '1', 'yes')
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'cache' if REDIS_URL else 'memory')
+# Serverless instances share no memory, so without Redis each one would keep
+# its own counters and the limits would multiply with the instance count.
+# Refuse to start; set RATE_LIMIT_BACKEND=memory to accept per-instance limits.
+if (os.environ.get('VERCEL') and RATE_LIMIT_ENABLED and not REDIS_URL
+        and os.environ.get('RATE_LIMIT_BACKEND') != 'memory'):
+    raise ImproperlyConfigured(
+        'Rate limiting on Vercel needs a shared cache: set REDIS_URL, or set '
+        'RATE_LIMIT_BACKEND=memory to accept per-instance limits, or RATE_LIMIT_ENABLED=false.'
+    )
+RATE_LIMIT_IP_HEADER = os.environ.get('RATE_LIMIT_IP_HEADER', 'X-Forwarded-For' if os.environ.get('VERCEL') else '')
+RATE_LIMITS = {
+    # authenticate() runs PBKDF2 and a success sends an email.
+    'api_login': [('ip', '20/m'), ('username', '10/10m')],
+    # Registration sends an OTP email to whatever address it is given.
+    'api_register': [('ip', '5/m'), ('ip', '30/d'), ('email', '3/10m')],
+    'api_resend_otp': [('ip', '5/m'), ('email', '3/10m')],
+    'api_verify_otp': [('ip', '20/m'), ('email', '10/10m')],
+    # Each message is an LLM call against a shared quota.
+    'chat_api': [('user', '10/m'), ('ip', '30/m'), ('user', '200/d')],
+    'chat_stream_api': [('user', '10/m'), ('ip', '30/m'), ('user', '200/d')],
+}
+
 # Use the provided Neon PostgreSQL database
 DATABASE_URL = os.environ.get('DATABASE_URL', None)
 
@@ -152,6 +245,62 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Keyset pagination for the list APIs (see core/pagination.py).
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', '50'))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', '500'))
+
+# Data exports (see core/export.py). Serverless hosts should disable the
+# background thread and run `manage.py run_export_jobs` on a schedule instead.
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '2000'))
+EXPORT_RUN_IN_THREAD = os.environ.get('EXPORT_RUN_IN_THREAD', 'true').lower() in ('true', '1', 'yes')
+EXPORT_RETENTION_DAYS = int(os.environ.get('EXPORT_RETENTION_DAYS', '7'))
+
+# Buffered ActivityLog writes (see core/activity.py). The spool directory must
+# be writable; /tmp is the only writable path on serverless hosts.
+ACTIVITY_LOG_BUFFER_SIZE = int(os.environ.get('ACTIVITY_LOG_BUFFER_SIZE', '100'))
+ACTIVITY_LOG_FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_LOG_FLUSH_INTERVAL', '2.0'))
+ACTIVITY_LOG_FLUSH_ON_REQUEST_END = os.environ.get('ACTIVITY_LOG_FLUSH_ON_REQUEST_END', 'true').lower() in ('true', '1', 'yes')
+ACTIVITY_LOG_SPOOL_DIR = os.environ.get('ACTIVITY_LOG_SPOOL_DIR', '')
+ACTIVITY_LOG_FSYNC = os.environ.get('ACTIVITY_LOG_FSYNC', 'false').lower() in ('true', '1', 'yes')
+# Retention: `manage.py archive_activity_logs` moves older rows to monthly archives.
+ACTIVITY_LOG_RETENTION_DAYS = int(os.environ.get('ACTIVITY_LOG_RETENTION_DAYS', '180'))
+ACTIVITY_ARCHIVE_DIR = os.environ.get('ACTIVITY_ARCHIVE_DIR', str(BASE_DIR / 'archive' / 'activity_logs'))
+
+# Outbound calls to the LLM/TTS providers (see chatbot/http_client.py).
+OUTBOUND_HTTP_CONNECT_TIMEOUT = float(os.environ.get('OUTBOUND_HTTP_CONNECT_TIMEOUT', '3.05'))
+OUTBOUND_HTTP_READ_TIMEOUT = float(os.environ.get('OUTBOUND_HTTP_READ_TIMEOUT', '30'))
+OUTBOUND_HTTP_RETRIES = int(os.environ.get('OUTBOUND_HTTP_RETRIES', '2'))
+OUTBOUND_HTTP_POOL_SIZE = int(os.environ.get('OUTBOUND_HTTP_POOL_SIZE', '10'))
+
+# Text-to-speech (see chatbot/tts.py). The audio cache directory must be
+# writable; /tmp is the only writable path on serverless hosts.
+SARVAM_TTS_URL = os.environ.get('SARVAM_TTS_URL', 'https://api.sarvam.ai/text-to-speech')
+TTS_CACHE_DIR = os.environ.get('TTS_CACHE_DIR', '')
+# Whether every instance sees the same TTS_CACHE_DIR. Audio URLs are only
+# handed out when it does; on Vercel each instance has its own /tmp, so a URL
+# would 404 on any other instance and the audio is returned inline instead.
+TTS_CACHE_SHARED = os.environ.get(
+    'TTS_CACHE_SHARED', 'false' if os.environ.get('VERCEL') else 'true'
+).lower() in ('true', '1', 'yes')
+TTS_CACHE_MAX_BYTES = int(os.environ.get('TTS_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+TTS_CHUNK_CHARS = int(os.environ.get('TTS_CHUNK_CHARS', '450'))
+TTS_MAX_CHARS = int(os.environ.get('TTS_MAX_CHARS', '3000'))
+TTS_CONCURRENCY = int(os.environ.get('TTS_CONCURRENCY', '4'))
+
+# Chat provider circuit breakers and latency routing (see chatbot/routing.py).
+CHAT_BREAKER_WINDOW = int(os.environ.get('CHAT_BREAKER_WINDOW', '20'))
+CHAT_BREAKER_MIN_CALLS = int(os.environ.get('CHAT_BREAKER_MIN_CALLS', '5'))
+CHAT_BREAKER_FAILURE_RATE = float(os.environ.get('CHAT_BREAKER_FAILURE_RATE', '0.5'))
+CHAT_BREAKER_COOLDOWN = float(os.environ.get('CHAT_BREAKER_COOLDOWN', '30'))
+CHAT_LATENCY_EWMA_ALPHA = float(os.environ.get('CHAT_LATENCY_EWMA_ALPHA', '0.3'))
+
+# Chatbot answer cache (see chatbot/response_cache.py); 'cache' shares it
+# between workers through the Django cache.
+CHAT_CACHE_ENABLED = os.environ.get('CHAT_CACHE_ENABLED', 'true').lower() in ('true', '1', 'yes')
+CHAT_CACHE_BACKEND = os.environ.get('CHAT_CACHE_BACKEND', 'cache' if REDIS_URL else 'memory')
+CHAT_CACHE_TTL = int(os.environ.get('CHAT_CACHE_TTL', str(24 * 60 * 60)))
+CHAT_CACHE_MAX_ENTRIES = int(os.environ.get('CHAT_CACHE_MAX_ENTRIES', '1000'))
+
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
 LOGOUT_REDIRECT_URL = '/'
@@ -1,8 +1,12 @@
 import base64
+import calendar
+import datetime
 import json
 import hmac
 import hashlib
+import threading
 import time
+from collections import OrderedDict
 
 class InvalidTokenError(Exception):
     pass
@@ -19,7 +23,17 @@ def base64url_decode(input_str):
         input_str += '=' * (4 - rem)
     return base64.urlsafe_b64decode(input_str)
 
+def _timestamp_claims(payload):
+    # Mirror PyJWT: registered time claims given as datetimes become epoch seconds.
+    payload = dict(payload)
+    for claim in ('exp', 'iat', 'nbf'):
+        value = payload.get(claim)
+        if isinstance(value, datetime.datetime):
+            payload[claim] = calendar.timegm(value.utctimetuple())
+    return payload
+
 def encode(payload, key, algorithm='HS256'):
+    payload = _timestamp_claims(payload)
     header = {"alg": algorithm, "typ": "JWT"}
     header_bytes = base64url_encode(json.dumps(header).encode('utf-8'))
     payload_bytes = base64url_encode(json.dumps(payload, default=str).encode('utf-8'))
@@ -64,3 +78,180 @@ def decode(token, key, algorithms=['HS256']):
         if isinstance(e, InvalidTokenError):
             raise e
         raise InvalidTokenError(str(e))
+
+
+def _keyed_mac(key):
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return hmac.new(key, digestmod=hashlib.sha256)
+
+
+class Signer:
+    """
+    Reusable HS256 token signer.
+
+    The HMAC key schedule is computed once and the constant header segment is
+    serialized once; each encode() only copies the pre-keyed context. When a
+    `kid` is given it is written to the header so a Verifier can pick the key.
+    """
+
+    def __init__(self, key, kid=None, algorithm='HS256'):
+        if algorithm != 'HS256':
+            raise ValueError("Only HS256 is supported")
+        header = {"alg": algorithm, "typ": "JWT"}
+        if kid is not None:
+            header["kid"] = kid
+        self.kid = kid
+        self.header_segment = base64url_encode(json.dumps(header).encode('utf-8'))
+        self._mac = _keyed_mac(key)
+        self._mac.update(f"{self.header_segment}.".encode('utf-8'))
+
+    def encode(self, payload):
+        payload_segment = base64url_encode(
+            json.dumps(_timestamp_claims(payload), default=str).encode('utf-8')
+        )
+        mac = self._mac.copy()
+        mac.update(payload_segment.encode('utf-8'))
+        return f"{self.header_segment}.{payload_segment}.{base64url_encode(mac.digest())}"
+
+
+class Verifier:
+    """
+    Reusable HS256 verifier over a keyring of `{kid: key}`.
+
+    Tokens carrying a `kid` header are checked against that key, so old keys
+    can stay in the ring during rotation; tokens without one (issued before
+    kids were introduced) use `default_kid`. Parsed headers are memoized since
+    every token from the same Signer shares one header segment.
+    """
+
+    _MAX_HEADERS = 64
+
+    def __init__(self, keys, default_kid=None, algorithms=['HS256']):
+        if not isinstance(keys, dict):
+            keys = {default_kid: keys}
+        self.algorithms = list(algorithms)
+        self.default_kid = default_kid
+        self._macs = {kid: _keyed_mac(key) for kid, key in keys.items()}
+        self._headers = {}
+
+    def _mac_for(self, header_segment):
+        mac = self._headers.get(header_segment)
+        if mac is None:
+            header = json.loads(base64url_decode(header_segment).decode('utf-8'))
+            if header.get('alg') not in self.algorithms:
+                raise InvalidTokenError("The specified alg value is not allowed")
+            kid = header.get('kid', self.default_kid)
+            if kid not in self._macs:
+                raise InvalidTokenError("Unknown key id")
+            mac = self._macs[kid].copy()
+            mac.update(f"{header_segment}.".encode('utf-8'))
+            if len(self._headers) < self._MAX_HEADERS:
+                self._headers[header_segment] = mac
+        return mac
+
+    def verify(self, token):
+        try:
+            header_segment, payload_segment, signature = token.split('.')
+        except (AttributeError, ValueError):
+            raise InvalidTokenError("Invalid token format")
+
+        try:
+            mac = self._mac_for(header_segment).copy()
+            mac.update(payload_segment.encode('utf-8'))
+            if not hmac.compare_digest(signature, base64url_encode(mac.digest())):
+                raise InvalidTokenError("Signature verification failed")
+            payload = json.loads(base64url_decode(payload_segment).decode('utf-8'))
+        except InvalidTokenError:
+            raise
+        except Exception as e:
+            raise InvalidTokenError(str(e))
+
+        exp = payload.get('exp')
+        if isinstance(exp, (int, float)) and exp < time.time():
+            raise ExpiredSignatureError("Signature has expired")
+        return payload
+
+    def verify_many(self, tokens):
+        """
+        Verify a batch of tokens. Returns one entry per token, in order: the
+        payload, or the InvalidTokenError instance that token failed with.
+        """
+        results = []
+        for token in tokens:
+            try:
+                results.append(self.verify(token))
+            except InvalidTokenError as e:
+                results.append(e)
+        return results
+
+
+class TokenCache:
+    """
+    Bounded LRU of already-verified tokens, so a token that is presented again
+    skips the split/base64/HMAC/json work in decode().
+
+    Entries are dropped once their numeric `exp` has passed, and the whole cache
+    is flushed whenever it is used with a different signing key or Verifier.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._key = None
+        self._lock = threading.Lock()
+
+    def decode(self, token, key, algorithms=['HS256']):
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        return self._cached(token, key, lambda: decode(token, key, algorithms=algorithms))
+
+    def verify(self, token, verifier):
+        """Like decode(), but verifies through a Verifier; a new Verifier flushes the cache."""
+        return self._cached(token, verifier, lambda: verifier.verify(token))
+
+    def _cached(self, token, key, verify):
+        with self._lock:
+            if key != self._key:
+                self._entries.clear()
+                self._key = key
+
+            entry = self._entries.get(token)
+            if entry is not None:
+                payload, expires_at = entry
+                if expires_at is None or expires_at >= time.time():
+                    self._entries.move_to_end(token)
+                    self.hits += 1
+                    return dict(payload)
+                del self._entries[token]
+            self.misses += 1
+
+        # Verify outside the lock; errors propagate exactly as from the verifier.
+        payload = verify()
+
+        exp = payload.get('exp')
+        expires_at = exp if isinstance(exp, (int, float)) else None
+        with self._lock:
+            if key == self._key:
+                self._entries[token] = (payload, expires_at)
+                self._entries.move_to_end(token)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return dict(payload)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
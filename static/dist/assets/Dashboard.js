@@ -1 +1 @@
-import{j as e,C as d,a as c,b as i,d as n}from"./ui.js";import{r as m,u as k,H as A,F as D,W as H,A as L,P as f,G as C,I as R,J as $,D as E,K as P,L as S}from"./vendor.js";import{D as F}from"./DashboardLayout.js";import"./Sidebar.js";function W(){const[r,p]=m.useState(null),[j,N]=m.useState(!0),[u,v]=m.useState(null),x=k();if(m.useEffect(()=>{const s=new AbortController;return(async()=>{const b=localStorage.getItem("token");if(!b){x("/login");return}try{const o=await fetch("http://localhost:8000/api/dashboard/",{headers:{Authorization:`Bearer ${b}`,"Content-Type":"application/json"},signal:s.signal});if(o.status===401||o.status===403){localStorage.removeItem("token"),x("/login");return}if(!o.ok)throw new Error("Failed to fetch dashboard data");const w=await o.json();p(w)}catch(l){if(l.name==="AbortError")return;console.error("Dashboard Fetch Error:",l),v(l.message||"Failed to load dashboard")}finally{s.signal.aborted||N(!1)}})(),()=>s.abort()},[x]),j)return e.jsx("div",{className:"min-h-screen bg-background flex items-center justify-center",children:"Loading Dashboard..."});if(u)return e.jsx("div",{className:"min-h-screen bg-background flex items-center justify-center text-destructive",children:u});if(!r)return null;const h=(s,a="")=>s==null||s===""||s==="None"?`-- ${a}`.trim():`${s} ${a}`.trim(),t=s=>s!=null&&s!==""&&s!=="None",_=[{label:"Blood Pressure",value:t(r.latest_record?.blood_pressure_systolic)?`${r.latest_record?.blood_pressure_systolic}/${r.latest_record?.blood_pressure_diastolic} mmHg`:"--/-- mmHg",status:r.latest_record?.bp_status||"No data",icon:A,color:"text-rose-500",bg:"bg-rose-500/10"},{label:"Blood Sugar",value:h(r.latest_record?.blood_sugar,"mg/dL"),status:t(r.latest_record?.blood_sugar)?"Recorded":"No data",icon:D,color:"text-sky-500",bg:"bg-sky-500/10"},{label:"Weight",value:h(r.latest_record?.weight,"Kg"),status:t(r.latest_record?.weight)?"Recorded":"No data",icon:H,color:"text-emerald-500",bg:"bg-emerald-500/10"},{label:"Heart Rate",value:h(r.latest_record?.heart_rate,"bpm"),status:t(r.latest_record?.heart_rate)?"Recorded":"No data",icon:L,color:"text-amber-500",bg:"bg-amber-500/10"}],y=r.active_medicines||0,g=r.latest_mental_health?.sleep_hours;return e.jsxs(F,{children:[e.jsx("header",{className:"mb-8 flex items-center justify-between",children:e.jsxs("div",{children:[e.jsx("h1",{className:"text-3xl font-bold tracking-tight",children:"Dashboard"}),e.jsxs("p",{className:"text-muted-foreground mt-1",children:["Welcome back, ",r.user.name]})]})}),e.jsx("div",{className:"grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-6 mb-8",children:_.map(s=>e.jsxs(d,{className:"border-border/50 bg-card/50 backdrop-blur",children:[e.jsxs(c,{className:"flex flex-row items-center justify-between space-y-0 pb-2",children:[e.jsx(i,{className:"text-sm font-medium text-muted-foreground",children:s.label}),e.jsx("div",{className:`p-2 rounded-full ${s.bg} ${s.color}`,children:e.jsx(s.icon,{className:"h-4 w-4"})})]}),e.jsxs(n,{children:[e.jsx("div",{className:"text-2xl font-bold animate-in fade-in slide-in-from-bottom-2",children:s.value}),e.jsx("p",{className:"text-xs text-muted-foreground mt-1",children:s.status})]})]},s.label))}),e.jsxs("div",{className:"grid grid-cols-1 lg:grid-cols-3 gap-8",children:[e.jsxs("div",{className:"lg:col-span-2 grid grid-cols-1 md:grid-cols-2 gap-6",children:[e.jsxs(d,{className:"border-border/50 bg-card/50",children:[e.jsxs(c,{className:"flex flex-row items-center space-y-0 pb-2 gap-4",children:[e.jsx("div",{className:"p-2 rounded-full bg-violet-500/10 text-violet-500",children:e.jsx(f,{className:"h-5 w-5"})}),e.jsxs("div",{children:[e.jsx(i,{className:"text-base",children:"Active Medicines"}),e.jsx("p",{className:"text-xs text-muted-foreground",children:"Currently taking"})]})]}),e.jsx(n,{children:e.jsx("div",{className:"text-3xl font-bold",children:y})})]}),e.jsxs(d,{className:"border-border/50 bg-card/50",children:[e.jsxs(c,{className:"flex flex-row items-center space-y-0 pb-2 gap-4",children:[e.jsx("div",{className:"p-2 rounded-full bg-indigo-500/10 text-indigo-500",children:e.jsx(C,{className:"h-5 w-5"})}),e.jsxs("div",{children:[e.jsx(i,{className:"text-base",children:"Sleep Hours"}),e.jsx("p",{className:"text-xs text-muted-foreground",children:"Last night"})]})]}),e.jsx(n,{children:e.jsxs("div",{className:"text-3xl font-bold",children:[t(g)?g:"--"," ",e.jsx("span",{className:"text-base font-normal text-muted-foreground",children:"hrs"})]})})]}),e.jsxs(d,{className:"col-span-1 md:col-span-2 border-border/50 bg-card/50",children:[e.jsx(c,{children:e.jsx(i,{children:"Recent Activity"})}),e.jsx(n,{children:e.jsx("div",{className:"space-y-4",children:r.recent_activities&&r.recent_activities.length>0?r.recent_activities.map((s,a)=>e.jsxs("div",{className:"flex items-center gap-4 p-3 rounded-lg hover:bg-muted/50 transition-colors",children:[e.jsx("div",{className:"h-2 w-2 rounded-full bg-primary"}),e.jsxs("div",{className:"flex-1",children:[e.jsx("p",{className:"text-sm font-medium",children:s.action_display}),e.jsx("p",{className:"text-xs text-muted-foreground",children:s.details})]}),e.jsxs("span",{className:"text-xs text-muted-foreground",children:[s.created_at_since," ago"]})]},a)):e.jsx("p",{className:"text-sm text-muted-foreground",children:"No recent activity"})})})]})]}),e.jsxs("div",{className:"space-y-4",children:[e.jsx("h3",{className:"text-lg font-semibold",children:"Quick Actions"}),[{label:"Add Health Record",href:"/add-health-record",icon:R},{label:"Add Medicine",href:"/add-medicine",icon:f},{label:"Add Prescription",href:"/add-prescription",icon:$},{label:"Mental Health Tools",href:"/mental-health",icon:E},{label:"Lifestyle Tracking",href:"/lifestyle",icon:P}].map(s=>e.jsxs(S,{to:s.href,className:"flex items-center gap-4 p-4 rounded-xl border border-border bg-card hover:bg-accent transition-all group shadow-sm hover:shadow-md",children:[e.jsx("div",{className:"h-10 w-10 rounded-full bg-primary/10 flex items-center justify-center text-primary group-hover:bg-primary group-hover:text-primary-foreground transition-colors",children:e.jsx(s.icon,{className:"h-5 w-5"})}),e.jsx("span",{className:"font-medium",children:s.label})]},s.label))]})]})]})}export{W as default};
+import{j as e,C as d,a as c,b as i,d as n}from"./ui.js";import{r as m,u as k,H as A,F as D,W as H,A as L,P as f,G as C,I as R,J as $,D as E,K as P,L as S}from"./vendor.js";import{D as F}from"./DashboardLayout.js";import"./Sidebar.js";function timeSince(t){const u=[[31536e3,"year"],[2592e3,"month"],[604800,"week"],[86400,"day"],[3600,"hour"],[60,"minute"]],s=Math.max(0,(Date.now()-new Date(t))/1e3);for(let i=0;i<u.length;i++){const n=Math.floor(s/u[i][0]);if(n>0){let r=`${n} ${u[i][1]}${n===1?"":"s"}`;const x=u[i+1];if(x){const m=Math.floor((s-n*u[i][0])/x[0]);m>0&&(r+=`, ${m} ${x[1]}${m===1?"":"s"}`)}return r}}return"0 minutes"}function W(){const[r,p]=m.useState(null),[j,N]=m.useState(!0),[u,v]=m.useState(null),x=k();if(m.useEffect(()=>{const s=new AbortController;return(async()=>{const b=localStorage.getItem("token");if(!b){x("/login");return}try{const o=await fetch("http://localhost:8000/api/dashboard/",{headers:{Authorization:`Bearer ${b}`,"Content-Type":"application/json"},signal:s.signal});if(o.status===401||o.status===403){localStorage.removeItem("token"),x("/login");return}if(!o.ok)throw new Error("Failed to fetch dashboard data");const w=await o.json();p(w)}catch(l){if(l.name==="AbortError")return;console.error("Dashboard Fetch Error:",l),v(l.message||"Failed to load dashboard")}finally{s.signal.aborted||N(!1)}})(),()=>s.abort()},[x]),j)return e.jsx("div",{className:"min-h-screen bg-background flex items-center justify-center",children:"Loading Dashboard..."});if(u)return e.jsx("div",{className:"min-h-screen bg-background flex items-center justify-center text-destructive",children:u});if(!r)return null;const h=(s,a="")=>s==null||s===""||s==="None"?`-- ${a}`.trim():`${s} ${a}`.trim(),t=s=>s!=null&&s!==""&&s!=="None",_=[{label:"Blood Pressure",value:t(r.latest_record?.blood_pressure_systolic)?`${r.latest_record?.blood_pressure_systolic}/${r.latest_record?.blood_pressure_diastolic} mmHg`:"--/-- mmHg",status:r.latest_record?.bp_status||"No data",icon:A,color:"text-rose-500",bg:"bg-rose-500/10"},{label:"Blood Sugar",value:h(r.latest_record?.blood_sugar,"mg/dL"),status:t(r.latest_record?.blood_sugar)?"Recorded":"No data",icon:D,color:"text-sky-500",bg:"bg-sky-500/10"},{label:"Weight",value:h(r.latest_record?.weight,"Kg"),status:t(r.latest_record?.weight)?"Recorded":"No data",icon:H,color:"text-emerald-500",bg:"bg-emerald-500/10"},{label:"Heart Rate",value:h(r.latest_record?.heart_rate,"bpm"),status:t(r.latest_record?.heart_rate)?"Recorded":"No data",icon:L,color:"text-amber-500",bg:"bg-amber-500/10"}],y=r.active_medicines||0,g=r.latest_mental_health?.sleep_hours;return e.jsxs(F,{children:[e.jsx("header",{className:"mb-8 flex items-center justify-between",children:e.jsxs("div",{children:[e.jsx("h1",{className:"text-3xl font-bold tracking-tight",children:"Dashboard"}),e.jsxs("p",{className:"text-muted-foreground mt-1",children:["Welcome back, ",r.user.name]})]})}),e.jsx("div",{className:"grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-6 mb-8",children:_.map(s=>e.jsxs(d,{className:"border-border/50 bg-card/50 backdrop-blur",children:[e.jsxs(c,{className:"flex flex-row items-center justify-between space-y-0 pb-2",children:[e.jsx(i,{className:"text-sm font-medium text-muted-foreground",children:s.label}),e.jsx("div",{className:`p-2 rounded-full ${s.bg} ${s.color}`,children:e.jsx(s.icon,{className:"h-4 w-4"})})]}),e.jsxs(n,{children:[e.jsx("div",{className:"text-2xl font-bold animate-in fade-in slide-in-from-bottom-2",children:s.value}),e.jsx("p",{className:"text-xs text-muted-foreground mt-1",children:s.status})]})]},s.label))}),e.jsxs("div",{className:"grid grid-cols-1 lg:grid-cols-3 gap-8",children:[e.jsxs("div",{className:"lg:col-span-2 grid grid-cols-1 md:grid-cols-2 gap-6",children:[e.jsxs(d,{className:"border-border/50 bg-card/50",children:[e.jsxs(c,{className:"flex flex-row items-center space-y-0 pb-2 gap-4",children:[e.jsx("div",{className:"p-2 rounded-full bg-violet-500/10 text-violet-500",children:e.jsx(f,{className:"h-5 w-5"})}),e.jsxs("div",{children:[e.jsx(i,{className:"text-base",children:"Active Medicines"}),e.jsx("p",{className:"text-xs text-muted-foreground",children:"Currently taking"})]})]}),e.jsx(n,{children:e.jsx("div",{className:"text-3xl font-bold",children:y})})]}),e.jsxs(d,{className:"border-border/50 bg-card/50",children:[e.jsxs(c,{className:"flex flex-row items-center space-y-0 pb-2 gap-4",children:[e.jsx("div",{className:"p-2 rounded-full bg-indigo-500/10 text-indigo-500",children:e.jsx(C,{className:"h-5 w-5"})}),e.jsxs("div",{children:[e.jsx(i,{className:"text-base",children:"Sleep Hours"}),e.jsx("p",{className:"text-xs text-muted-foreground",children:"Last night"})]})]}),e.jsx(n,{children:e.jsxs("div",{className:"text-3xl font-bold",children:[t(g)?g:"--"," ",e.jsx("span",{className:"text-base font-normal text-muted-foreground",children:"hrs"})]})})]}),e.jsxs(d,{className:"col-span-1 md:col-span-2 border-border/50 bg-card/50",children:[e.jsx(c,{children:e.jsx(i,{children:"Recent Activity"})}),e.jsx(n,{children:e.jsx("div",{className:"space-y-4",children:r.recent_activities&&r.recent_activities.length>0?r.recent_activities.map((s,a)=>e.jsxs("div",{className:"flex items-center gap-4 p-3 rounded-lg hover:bg-muted/50 transition-colors",children:[e.jsx("div",{className:"h-2 w-2 rounded-full bg-primary"}),e.jsxs("div",{className:"flex-1",children:[e.jsx("p",{className:"text-sm font-medium",children:s.action_display}),e.jsx("p",{className:"text-xs text-muted-foreground",children:s.details})]}),e.jsxs("span",{className:"text-xs text-muted-foreground",children:[timeSince(s.created_at)," ago"]})]},a)):e.jsx("p",{className:"text-sm text-muted-foreground",children:"No recent activity"})})})]})]}),e.jsxs("div",{className:"space-y-4",children:[e.jsx("h3",{className:"text-lg font-semibold",children:"Quick Actions"}),[{label:"Add Health Record",href:"/add-health-record",icon:R},{label:"Add Medicine",href:"/add-medicine",icon:f},{label:"Add Prescription",href:"/add-prescription",icon:$},{label:"Mental Health Tools",href:"/mental-health",icon:E},{label:"Lifestyle Tracking",href:"/lifestyle",icon:P}].map(s=>e.jsxs(S,{to:s.href,className:"flex items-center gap-4 p-4 rounded-xl border border-border bg-card hover:bg-accent transition-all group shadow-sm hover:shadow-md",children:[e.jsx("div",{className:"h-10 w-10 rounded-full bg-primary/10 flex items-center justify-center text-primary group-hover:bg-primary group-hover:text-primary-foreground transition-colors",children:e.jsx(s.icon,{className:"h-5 w-5"})}),e.jsx("span",{className:"font-medium",children:s.label})]},s.label))]})]})]})}export{W as default};